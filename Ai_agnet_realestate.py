@@ -1,45 +1,80 @@
 import re
+import numpy as np
 import pandas as pd
-import random
-from typing import Dict, Any, List
+from typing import Dict, Any, FrozenSet, List, Optional
+from catalogue import (
+    AREA_TOLERANCES, ATTRIBUTES_COLUMN, BASE_PRICE_COLUMN, BUDGET_BUFFERS, COMPOUND_BIT, FIELD_MASK,
+    FINISHING_SHIFT, FINISHING_TYPE_SHIFT, ColumnRanges, PropertyIndex, catalogue_version, pack_attributes, type_values, with_base_prices
+)
+from currency import BASE_CURRENCY, DIALECT_CURRENCIES, RateTable, currency_from_word, currency_name
+from dialect_detector import ENABLED as DIALECT_DETECTION, DialectClassifier
+from facets import ADAPTIVE as ADAPTIVE_QUESTIONS, SUMMARIZE_AT, FacetIndex
+from fuzzy_index import ENABLED as FUZZY_MATCHING, build as build_fuzzy_index
+from geo_index import LocationIndex
+from metrics import Counter, Histogram, suppressed as metrics_suppressed
+from sales_pitch import SalesPitchEngine
+from semantic_index import load_if_enabled as load_semantic_index
+from session_state import FINISHINGS, FINISHING_TYPES, SERVICES, SessionState
+from text_index import InvertedIndex, normalize
+from tracing import traced
+
+AGENT_STEP_SECONDS = Histogram(
+    "agent_step_seconds", "Time spent in each step of the agent pipeline", ("step",)
+)
+DIALECT_DETECTIONS = Counter(
+    "agent_dialect_detections_total", "Chats whose dialect was detected from a message", ("dialect",)
+)
+RECOMMENDATION_FALLBACKS = Counter(
+    "agent_recommendation_fallbacks_total", "Recommendation searches that had to relax a filter", ("path",)
+)
+
+# Keyword tables that also match misspelled words
+FUZZY_TABLES = (
+    "type_patterns", "purpose_patterns", "compound_patterns",
+    "finishing_patterns", "finishing_type_patterns", "services_patterns"
+)
 
 class ArabicRealEstateAgent:
     def __init__(self, properties_df: pd.DataFrame, dialect: str = "egyptian"):
+        # Exchange rates; budgets and prices are compared in the base currency
+        self.rates = RateTable.load()
+        if BASE_PRICE_COLUMN not in properties_df.columns:
+            properties_df = with_base_prices(properties_df, self.rates)
+        if ATTRIBUTES_COLUMN not in properties_df.columns:
+            properties_df = properties_df.assign(**{ATTRIBUTES_COLUMN: pack_attributes(properties_df)})
         self.properties_df = properties_df
         self.current_dialect = dialect
-        self.session_state = {
-            "preferences": {
-                "type": None,
-                "location": None,
-                "bedrooms": None,
-                "bathrooms": None,
-                "budget": None,
-                "area_m2": None,
-                "floor": None,
-                "purpose": None,  # For rent or sale
-                "compound": None, # In a compound or not
-                "finishing": None, # Finishing type
-                "finishing_type": None, # Type of finishing if applicable
-                "services": [],    # Additional services
-                "other_features": []
-            },
-            "user_info": {
-                "name": None,
-                "phone": None,
-                "email": None
-            },
-            "conversation_stage": "greeting",
-            "shown_properties": [],
-            "current_property": None,
-            "selected_property_index": 0,  # Index of the property the user selected (1 or 2)
-            "negotiation_attempts": 0,
-            "question_flow_index": 0, # To control the flow of questions
-            "asked_finishing_type": False, # Track if finishing type question was asked
-            "asked_services": False, # Track if services question was asked
-            "last_question_asked": None, # Track the last question asked
-            "sales_pitch_stage": 0,  # Track which sales pitch stage we're in
-            "used_sales_arguments": []  # Track which sales arguments have been used
-        }
+        # Dialect of chats whose own dialect is not known (yet)
+        self.default_dialect = dialect
+        self.session_state = SessionState()
+        
+        # Identify the catalogue so serialized sessions can refer to rows by id
+        self.catalogue_version = catalogue_version(properties_df)
+        self.property_index = PropertyIndex(properties_df)
+        # Presorted price / area columns for range searches
+        self.column_ranges = ColumnRanges(properties_df)
+        # Inverted index over listing descriptions, used to rank by requested features
+        self.description_index = InvertedIndex(
+            properties_df["description"] if "description" in properties_df.columns else pd.Series([""] * len(properties_df))
+        )
+        # Optional embedding index (SEMANTIC_SEARCH=1) for requests phrased differently from the listings
+        self.semantic_index = load_semantic_index(properties_df, self.catalogue_version)
+        self.current_request = ""  # Message being processed, used as the semantic query
+        # Listings other chats are reserving (a holds.HoldTable, set by the app) and
+        # the chat being answered, whose own hold does not count
+        self.listing_holds = None
+        self.current_chat_id: Optional[int] = None
+        
+        # Spatial index of catalogue locations and neighborhoods, for nearby-area fallbacks
+        indexed_places = []
+        for column in ("location", "neighborhood"):
+            if column in properties_df.columns:
+                indexed_places.extend(str(name) for name in properties_df[column].dropna().unique())
+        self.location_index = LocationIndex.load(indexed_places)
+        
+        # Row bitmaps per question answer, to ask whatever best narrows the
+        # remaining listings (None keeps the fixed question order)
+        self.facet_index = FacetIndex(properties_df) if ADAPTIVE_QUESTIONS else None
         
         # Define the order of questions to ask
         self.question_flow = [
@@ -48,6 +83,33 @@ class ArabicRealEstateAgent:
             "budget", "bedrooms", "bathrooms"
         ]
         
+        # Phrases that clearly commit to a listing, checked by _check_buying_intent()
+        self.clear_intent_phrases = [
+            "عايز اشتري", "هشتري", "أريد شراء", "موافق على الشراء",
+            "أقبل العرض", "اتفقنا", "اخدت قراري", "أوافق على السعر",
+            "نروح نشوفها امتى", "متى أستطيع رؤيتها"
+        ]
+        
+        # Arabic place names mapped to catalogue locations
+        self.common_locations = {
+            "التجمع": "Cairo", 
+            "الرحاب": "Cairo",
+            "مدينتي": "Cairo",
+            "الشيخ زايد": "Giza",
+            "6 اكتوبر": "Giza",
+            "أكتوبر": "Giza",
+            "المعادي": "Cairo",
+            "مصر الجديدة": "Cairo",
+            "القاهرة الجديدة": "Cairo",
+            "الإسكندرية": "Alexandria",
+            "اسكندرية": "Alexandria",
+            "الجيزة": "Giza",
+            "جيزة": "Giza",
+            "القاهرة": "Cairo",
+            "أسيوط": "Assiut",
+            "المنصورة": "Mansoura",
+        }
+        
         # Keywords that indicate buying/renting intent
         self.buying_intent_keywords = [
             "هشتري", "هاخده", "عايز اشتري", "أشتري", "اشتري", "هشتريه", "أخده", "اخده", "اتفقنا",
@@ -82,6 +144,9 @@ class ArabicRealEstateAgent:
             "تخيل نفسك وانت بتستقبل ضيوفك في المكان ده، هيكون انطباعهم إزاي عن ذوقك واختيارك!"
         ]
         
+        # Sales arguments localized per catalogue area up front; seed with SALES_PITCH_SEED
+        self.pitch_engine = SalesPitchEngine(self.sales_arguments, properties_df)
+        
         self.patterns = {
             "type_patterns": {
                 "شقة": ["شقة", "شقه", "apartment", "flat", "شقق", "شق"],
@@ -112,7 +177,21 @@ class ArabicRealEstateAgent:
                 "نادي": ["نادي", "club", "gym", "جيم", "رياضة", "مسبح", "حمام سباحة", "pool", "swimming"],
                 "مول": ["مول", "سوق", "تسوق", "mall", "shopping", "سنتر", "محلات", "مركز تجاري", "مول تجاري"]
             },
-            "budget_patterns": {"money": r"(\d+(?:,\d+)*)\s*(جنيه|دولار|ريال|درهم|الف|ألف|مليون)?"},
+            # Listing features, keyed by the phrase searched in the (English) descriptions
+            "feature_patterns": {
+                "garden": ["حديقة", "جنينة", "جنينه", "garden"],
+                "balcony": ["بلكونة", "بلكونه", "شرفة", "تراس", "balcony", "terrace"],
+                "metro": ["مترو", "المترو", "metro", "subway"],
+                "renovated": ["متجدد", "مجدد", "متجددة", "تجديد", "renovated"],
+                "modern": ["مودرن", "حديث", "حديثة", "modern"],
+                "spacious": ["واسع", "واسعة", "وسيع", "كبيرة", "spacious"],
+                "business district": ["منطقة أعمال", "حي الأعمال", "بيزنس", "business district"],
+                "suitable for building": ["للبناء", "للبنا", "صالحة للبناء", "building"]
+            },
+            "budget_patterns": {
+                "money": r"(\d+(?:,\d+)*)\s*(جنيه|دولار|ريال|درهم|الف|ألف|مليون)?",
+                "range_numbers": r"\d+(?:,\d+)*"
+            },
             "bedroom_patterns": {"count": r"(\d+)(?:\s*)(غرفة|غرف|اوض|أوض|room|bedroom)?"},
             "bathroom_patterns": {"count": r"(\d+)(?:\s*)(حمام|toilet|bathroom|bath)?"},
             "area_patterns": {"area": r"(\d+)(?:\s*)(متر|م2|m2|square meter|sqm)?"},
@@ -124,6 +203,19 @@ class ArabicRealEstateAgent:
             }
         }
         
+        # Feature phrases in normalized form, so spelling variants (ة/ه, أ/ا) still match
+        self.feature_phrases = {
+            feature: [normalize(pattern) for pattern in patterns]
+            for feature, patterns in self.patterns["feature_patterns"].items()
+        }
+        
+        # Precompile the regular-expression pattern groups (keyword groups map to lists)
+        self.regex = {
+            group: {name: re.compile(pattern) for name, pattern in patterns.items()}
+            for group, patterns in self.patterns.items()
+            if all(isinstance(pattern, str) for pattern in patterns.values())
+        }
+        
         self.phrases = {
             "egyptian": {
                 "greeting": "أهلاً وسهلاً! أنا وكيل العقارات الذكي. ازاي ممكن أساعدك؟",
@@ -156,7 +248,9 @@ class ArabicRealEstateAgent:
                 "ask_more_options": "عندي عقارات تانية ممكن تكون مناسبة ليك. تحب أعرضها عليك؟",
                 "property_comparison": "العقار ده أفضل من غيره بكتير من ناحية السعر والمساحة والموقع. بالمقارنة مع العقارات المشابهة، هتلاقيه أوفر بحوالي 10-15%.",
                 "discount_offer": "ممكن أحاول أتفاوض مع المالك على خصم بسيط لو أكدت رغبتك في الشراء دلوقتي. ممكن نوصل لتخفيض ١-٣٪ من السعر.",
-                "higher_discount": "بما إنك عميل مميز، هحاول أوصل للمالك وأشوف لو ممكن يديك خصم 5-7%، بس لازم تأكدلي إنك موافق مبدئياً."
+                "higher_discount": "بما إنك عميل مميز، هحاول أوصل للمالك وأشوف لو ممكن يديك خصم 5-7%، بس لازم تأكدلي إنك موافق مبدئياً.",
+                "nearby_alternative": "مفيش عقارات في {requested} حالياً، بس لقيت عقارات قريبة في {nearby} (حوالي {distance} كم).",
+                "suggest_nearby_locations": "معلش، مفيش عقارات في المنطقة دي. ممكن نشوف مناطق قريبة زي {places}؟"
             },
             "khaleeji": {
                 "greeting": "هلا والله! أنا هني أساعدك تلقى العقار المناسب لك.",
@@ -189,7 +283,9 @@ class ArabicRealEstateAgent:
                 "ask_more_options": "عندي عقارات ثانية ممكن تكون مناسبة لك. تبي أعرضها عليك؟",
                 "property_comparison": "العقار هذا أفضل من غيره وايد من ناحية السعر والمساحة والموقع. بالمقارنة مع العقارات المشابهة، بتلقاه أوفر بحوالي 10-15%.",
                 "discount_offer": "ممكن أحاول أتفاوض مع المالك على خصم بسيط لو أكدت رغبتك في الشراء الحين. ممكن نوصل لتخفيض ١-٣٪ من السعر.",
-                "higher_discount": "بما إنك عميل مميز، بحاول أوصل للمالك وأشوف إذا ممكن يعطيك خصم 5-7%، بس لازم تأكد لي إنك موافق مبدئياً."
+                "higher_discount": "بما إنك عميل مميز، بحاول أوصل للمالك وأشوف إذا ممكن يعطيك خصم 5-7%، بس لازم تأكد لي إنك موافق مبدئياً.",
+                "nearby_alternative": "ما في عقارات في {requested} حالياً، بس لقيت عقارات قريبة في {nearby} (تقريباً {distance} كم).",
+                "suggest_nearby_locations": "عذراً، ما في عقارات في هالمنطقة. نقدر نشوف مناطق قريبة مثل {places}؟"
             },
             "msa": {
                 "greeting": "أهلاً وسهلاً! أنا هنا لمساعدتك في العثور على العقار المناسب لك.",
@@ -222,9 +318,37 @@ class ArabicRealEstateAgent:
                 "ask_more_options": "لدي عقارات أخرى قد تكون مناسبة لك. هل ترغب في الاطلاع عليها؟",
                 "property_comparison": "هذا العقار أفضل من غيره بكثير من حيث السعر والمساحة والموقع. بالمقارنة مع العقارات المماثلة، ستجده أوفر بحوالي 10-15%.",
                 "discount_offer": "يمكنني محاولة التفاوض مع المالك على خصم بسيط إذا أكدت رغبتك في الشراء الآن. يمكننا الوصول إلى تخفيض ١-٣٪ من السعر.",
-                "higher_discount": "بما أنك عميل مميز، سأحاول التواصل مع المالك لأرى إذا كان بإمكانه منحك خصم 5-7%، لكن يجب أن تؤكد لي أنك موافق مبدئياً."
+                "higher_discount": "بما أنك عميل مميز، سأحاول التواصل مع المالك لأرى إذا كان بإمكانه منحك خصم 5-7%، لكن يجب أن تؤكد لي أنك موافق مبدئياً.",
+                "nearby_alternative": "لا توجد عقارات في {requested} حالياً، لكنني وجدت عقارات قريبة في {nearby} (على بعد {distance} كم تقريباً).",
+                "suggest_nearby_locations": "عذراً، لا توجد عقارات في هذه المنطقة. هل يمكننا البحث في مناطق قريبة مثل {places}؟"
             }
         }
+        
+        # Typo-tolerant lookups over the keyword tables, intent phrases and
+        # place names; the agent's own wording is known not to be keywords
+        self.fuzzy_index = None
+        if FUZZY_MATCHING:
+            tables = {table: self.patterns[table] for table in FUZZY_TABLES}
+            tables["buying_intent"] = {phrase: [phrase] for phrase in self.clear_intent_phrases}
+            locations = {}
+            for name, location in self.common_locations.items():
+                locations.setdefault(location, []).append(name)
+            if "location" in properties_df.columns:
+                for location in properties_df["location"].dropna().unique():
+                    locations.setdefault(str(location), []).append(str(location))
+            for alias, place in self.location_index.names():
+                locations.setdefault(place.name, []).append(alias)
+            tables["location"] = locations
+            vocabulary = [phrase for phrases in self.phrases.values() for phrase in phrases.values()]
+            self.fuzzy_index = build_fuzzy_index(tables, vocabulary + self.sales_arguments)
+        self._fuzzy_cache = (None, [])
+        
+        # Tells a chat's dialect from its messages, trained on the agent's own phrases
+        self.dialect_classifier = None
+        if DIALECT_DETECTION:
+            self.dialect_classifier = DialectClassifier(
+                {dialect: phrases.values() for dialect, phrases in self.phrases.items()}
+            )
     
     def get_current_state_summary(self) -> Dict[str, Any]:
         """
@@ -234,7 +358,7 @@ class ArabicRealEstateAgent:
             Dictionary with summary of current state
         """
         return {
-            "preferences": self.session_state["preferences"],
+            "preferences": self.session_state["preferences"].to_dict(),
             "conversation_stage": self.session_state["conversation_stage"],
             "properties_shown": len(self.session_state["shown_properties"]),
             "current_dialect": self.current_dialect
@@ -242,39 +366,56 @@ class ArabicRealEstateAgent:
     
     def reset_session(self) -> None:
         """Reset the session state to start a new conversation."""
-        self.session_state = {
-            "preferences": {
-                "type": None,
-                "location": None,
-                "bedrooms": None,
-                "bathrooms": None,
-                "budget": None,
-                "area_m2": None,
-                "floor": None,
-                "purpose": None,
-                "compound": None,
-                "finishing": None,
-                "finishing_type": None,
-                "services": [],
-                "other_features": []
-            },
-            "user_info": {
-                "name": None,
-                "phone": None,
-                "email": None
-            },
-            "conversation_stage": "greeting",
-            "shown_properties": [],
-            "current_property": None,
-            "selected_property_index": 0,
-            "negotiation_attempts": 0,
-            "question_flow_index": 0,
-            "asked_finishing_type": False,
-            "asked_services": False,
-            "last_question_asked": None,
-            "sales_pitch_stage": 0,
-            "used_sales_arguments": []
-        }
+        self.session_state = SessionState()
+    
+    # Synthetic conversation used by warm_up(); answers questions until a recommendation is made
+    WARMUP_SCRIPT = (
+        "مرحبا", "عايز شقة في القاهرة للشراء", "نعم", "متشطب", "سوبر لوكس",
+        "أمن", "نعم", "نعم", "نعم", "نعم", "نعم", "نعم", "نعم", "نعم"
+    )
+    
+    def warm_up(self) -> bool:
+        """
+        Run a synthetic conversation through process_input so every code path
+        used by real traffic has been exercised once. The current session and
+        the metrics are left untouched.
+        
+        Returns:
+            True if the conversation reached the recommendation stage
+        """
+        saved_state = self.session_state
+        self.session_state = SessionState()
+        try:
+            with metrics_suppressed():
+                for message in self.WARMUP_SCRIPT:
+                    if not self.process_input(message):
+                        return False
+                    if self.session_state["conversation_stage"] == "recommending":
+                        return True
+            return False
+        except Exception as e:
+            print(f"[ERROR] Warm-up conversation failed: {str(e)}")
+            return False
+        finally:
+            self.session_state = saved_state
+    
+    def get_property(self, property_id: int, catalogue_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Look up a property by id.
+        
+        Args:
+            property_id: The property id
+            catalogue_version: Version the id was recorded against, if known
+            
+        Returns:
+            The property row as a dictionary, or None if it is not in the catalogue
+        """
+        if catalogue_version is not None and catalogue_version != self.catalogue_version:
+            print(f"[INFO] Resolving property {property_id} recorded against catalogue {catalogue_version}, current is {self.catalogue_version}")
+        position = self.property_index.position_of(int(property_id))
+        if position is None:
+            return None
+        return self.properties_df.iloc[position].to_dict()
     
     def get_available_dialects(self) -> List[str]:
         """
@@ -322,6 +463,12 @@ class ArabicRealEstateAgent:
     def set_dialect(self, dialect):
         if dialect in self.phrases:
             self.current_dialect = dialect
+            self.default_dialect = dialect
+        return self.dialect_confirmation(dialect)
+    
+    def dialect_confirmation(self, dialect: str) -> str:
+        """Reply confirming a switch to dialect, or listing the dialects when it is unknown."""
+        if dialect in self.phrases:
             if dialect == "egyptian":
                 return "تم التغيير للهجة المصرية!"
             elif dialect == "khaleeji":
@@ -331,6 +478,8 @@ class ArabicRealEstateAgent:
         else:
             return "اللهجة غير متوفرة. اللهجات المتاحة هي: مصري (egyptian)، خليجي (khaleeji)، فصحى (msa)."
     
+    @traced("agent.process_input")
+    @AGENT_STEP_SECONDS.time("process_input")
     def process_input(self, user_input: str) -> str:
         """
         Process user input and respond accordingly based on conversation stage.
@@ -345,61 +494,21 @@ class ArabicRealEstateAgent:
         print(f"[DEBUG] Process input with state: {self.session_state}")
         
         # Ensure session_state has the expected structure
-        if not isinstance(self.session_state, dict):
-            print(f"[ERROR] session_state is not a dictionary: {type(self.session_state)}")
-            # Initialize with default values
-            self.session_state = {
-                "conversation_stage": "greeting",
-                "preferences": {
-                    "type": None,
-                    "location": None,
-                    "bedrooms": None,
-                    "bathrooms": None,
-                    "budget": None,
-                    "area_m2": None,
-                    "floor": None,
-                    "purpose": None,
-                    "compound": None,
-                    "finishing": None,
-                    "finishing_type": None,
-                    "services": [],
-                    "other_features": []
-                },
-                "user_info": {
-                    "name": None,
-                    "phone": None,
-                    "email": None
-                },
-                "shown_properties": [],
-                "current_property": None,
-                "selected_property_index": 0,
-                "negotiation_attempts": 0,
-                "question_flow_index": 0,
-                "asked_finishing_type": False,
-                "asked_services": False,
-                "last_question_asked": None,
-                "sales_pitch_stage": 0,
-                "used_sales_arguments": []
-            }
-        
-        # Check if preferences is missing or not a dictionary
-        if "preferences" not in self.session_state or not isinstance(self.session_state["preferences"], dict):
-            print(f"[ERROR] preferences missing or invalid in session_state")
-            self.session_state["preferences"] = {
-                "type": None,
-                "location": None,
-                "bedrooms": None,
-                "bathrooms": None,
-                "budget": None,
-                "area_m2": None,
-                "floor": None,
-                "purpose": None,
-                "compound": None,
-                "finishing": None,
-                "finishing_type": None,
-                "services": [],
-                "other_features": []
-            }
+        if not isinstance(self.session_state, SessionState):
+            print(f"[ERROR] session_state is not a SessionState: {type(self.session_state)}")
+            self.session_state = SessionState()
+        
+        self.current_request = user_input
+        
+        # Answer in the chat's own dialect, detected once per chat from the
+        # first message that gives it away clearly enough
+        if self.dialect_classifier is not None and self.session_state.dialect is None:
+            detected, margin = self.dialect_classifier.classify(user_input)
+            if detected is not None:
+                print(f"[INFO] Detected {detected} dialect (margin {margin:.1f})")
+                self.session_state.dialect = detected
+                DIALECT_DETECTIONS.inc(detected)
+        self.current_dialect = self.session_state.dialect or self.default_dialect
         
         # Extract contact information if applicable
         self._extract_contact_info(user_input)
@@ -463,6 +572,7 @@ class ArabicRealEstateAgent:
                         num_value *= 1000  # Treat as thousands
                     
                     self.session_state["preferences"]["budget"] = float(num_value)
+                    self.session_state["preferences"]["budget_currency"] = None
                     print(f"[INFO] Set budget from direct numeric input: {num_value}")
                     # Increment question flow
                     self.session_state["question_flow_index"] += 1
@@ -513,19 +623,19 @@ class ArabicRealEstateAgent:
                 return self._make_recommendation()
             elif "١" in user_input or "1" in user_input or "الأول" in user_input or "اول" in user_input or "الاول" in user_input:
                 # User selected option 1
-                self.session_state["selected_property_index"] = 0
+                self._select_recommendation(0)
                 self.session_state["conversation_stage"] = "sales_pitch"
                 self.session_state["sales_pitch_stage"] = 0
                 return self._get_adaptive_sales_pitch()
             elif "٢" in user_input or "2" in user_input or "الثاني" in user_input or "تاني" in user_input or "التاني" in user_input:
                 # User selected option 2
-                self.session_state["selected_property_index"] = 1
+                self._select_recommendation(1)
                 self.session_state["conversation_stage"] = "sales_pitch"
                 self.session_state["sales_pitch_stage"] = 0
                 return self._get_adaptive_sales_pitch()
             elif any(word in user_input.lower() for word in ["نعم", "أيوة", "تمام", "حلو", "yes", "good", "اعجبني", "عجبني", "يعجبني"]):
                 # User is generally satisfied, move to sales pitch with the first property
-                self.session_state["selected_property_index"] = 0
+                self._select_recommendation(0)
                 self.session_state["conversation_stage"] = "sales_pitch"
                 self.session_state["sales_pitch_stage"] = 0
                 return self._get_adaptive_sales_pitch()
@@ -637,6 +747,7 @@ class ArabicRealEstateAgent:
             # Default response
             return self.get_phrase("greeting")
     
+    @traced("agent.check_buying_intent")
     def _check_buying_intent(self, user_input: str) -> bool:
         """
         Check if user input indicates intent to buy/rent property
@@ -646,19 +757,17 @@ class ArabicRealEstateAgent:
         if len(user_input.strip()) < 10:
             return False
             
-        # Define very specific buying intent phrases
-        clear_intent_phrases = [
-            "عايز اشتري", "هشتري", "أريد شراء", "موافق على الشراء",
-            "أقبل العرض", "اتفقنا", "اخدت قراري", "أوافق على السعر",
-            "نروح نشوفها امتى", "متى أستطيع رؤيتها"
-        ]
-        
-        # Check for these specific phrases
+        # Check for very specific buying intent phrases
         user_input_lower = user_input.lower()
-        for phrase in clear_intent_phrases:
+        for phrase in self.clear_intent_phrases:
             if phrase in user_input_lower:
                 print(f"[INFO] Detected clear buying intent with phrase: {phrase}")
                 return True
+        
+        # Or a misspelling of one
+        for phrase in self._fuzzy_labels("buying_intent", user_input):
+            print(f"[INFO] Detected clear buying intent with misspelled phrase: {phrase}")
+            return True
                 
         # If we're in sales_pitch stage and user replies positively to viewing question
         if self.session_state["conversation_stage"] == "sales_pitch" and self.session_state["sales_pitch_stage"] >= 4:
@@ -671,13 +780,55 @@ class ArabicRealEstateAgent:
                 
         return False
     
+    def _fuzzy_labels(self, table: str, user_input: str) -> List[str]:
+        """
+        Labels of a keyword table (or "buying_intent" / "location") matched by
+        misspelled words of a message, in message order
+        """
+        # Contact details are mostly names, which are easily taken for misspelled keywords
+        if self.fuzzy_index is None or self.session_state["conversation_stage"] in ["contact_collection", "closing"]:
+            return []
+        # The message is matched once per turn, however many tables are checked
+        if self._fuzzy_cache[0] != user_input:
+            self._fuzzy_cache = (user_input, self.fuzzy_index.find(user_input))
+        labels = []
+        for match in self._fuzzy_cache[1]:
+            for match_table, label in match.values:
+                if match_table == table and label not in labels:
+                    labels.append(label)
+        return labels
+    
+    def _match_keyword(self, table: str, user_input: str) -> Optional[str]:
+        """
+        First label of a keyword table found in a message, or else matched by
+        a misspelled word
+        
+        Args:
+            table: Key of self.patterns
+            user_input: The user's message
+            
+        Returns:
+            The label, or None
+        """
+        user_input_lower = user_input.lower()
+        for label, patterns in self.patterns[table].items():
+            if any(pattern in user_input_lower for pattern in patterns):
+                return label
+        labels = self._fuzzy_labels(table, user_input)
+        if labels:
+            print(f"[INFO] Matched misspelled {table[:-len('_patterns')]}: {labels[0]}")
+            return labels[0]
+        return None
+    
+    @traced("agent.extract_contact_info")
+    @AGENT_STEP_SECONDS.time("extract_contact_info")
     def _extract_contact_info(self, user_input: str) -> None:
         """Extract contact information from user input"""
         user_info = self.session_state["user_info"]
         
         # Extract name
         if user_info["name"] is None:
-            name_match = re.search(self.patterns["contact_patterns"]["name"], user_input)
+            name_match = self.regex["contact_patterns"]["name"].search(user_input)
             if name_match:
                 user_info["name"] = name_match.group(1).strip()
                 print(f"[INFO] Extracted name: {user_info['name']}")
@@ -689,7 +840,7 @@ class ArabicRealEstateAgent:
                 
         # Extract phone number
         if user_info["phone"] is None:
-            phone_match = re.search(self.patterns["contact_patterns"]["phone"], user_input)
+            phone_match = self.regex["contact_patterns"]["phone"].search(user_input)
             if phone_match:
                 phone = phone_match.group(0).strip()
                 user_info["phone"] = phone
@@ -697,11 +848,13 @@ class ArabicRealEstateAgent:
                 
         # Extract email
         if user_info["email"] is None:
-            email_match = re.search(self.patterns["contact_patterns"]["email"], user_input)
+            email_match = self.regex["contact_patterns"]["email"].search(user_input)
             if email_match:
                 user_info["email"] = email_match.group(0).strip()
                 print(f"[INFO] Extracted email: {user_info['email']}")
     
+    @traced("agent.extract_information")
+    @AGENT_STEP_SECONDS.time("extract_information")
     def _extract_information(self, user_input: str) -> None:
         """
         Extract relevant information from user input.
@@ -709,76 +862,61 @@ class ArabicRealEstateAgent:
         Args:
             user_input: The user's input text in Arabic
         """
-        # Ensure preferences exist and are initialized properly
-        if "preferences" not in self.session_state:
-            print("[ERROR] preferences key missing in session_state during extraction")
-            self.session_state["preferences"] = {
-                "type": None,
-                "location": None,
-                "bedrooms": None,
-                "bathrooms": None,
-                "budget": None,
-                "area_m2": None,
-                "floor": None,
-                "purpose": None,
-                "compound": None,
-                "finishing": None,
-                "finishing_type": None,
-                "services": [],
-                "other_features": []
-            }
-                
         # Extract property type
         if self.session_state["preferences"]["type"] is None:
-            for prop_type, patterns in self.patterns["type_patterns"].items():
-                if any(pattern in user_input.lower() for pattern in patterns):
-                    self.session_state["preferences"]["type"] = prop_type
-                    print(f"[INFO] Detected property type: {prop_type}")
-                    break
+            prop_type = self._match_keyword("type_patterns", user_input)
+            if prop_type is not None:
+                self.session_state["preferences"]["type"] = prop_type
+                print(f"[INFO] Detected property type: {prop_type}")
         
         # Extract purpose (buy/rent)
         if self.session_state["preferences"]["purpose"] is None:
-            for purpose, patterns in self.patterns["purpose_patterns"].items():
-                if any(pattern in user_input.lower() for pattern in patterns):
-                    self.session_state["preferences"]["purpose"] = purpose
-                    print(f"[INFO] Detected purpose: {purpose}")
-                    break
+            purpose = self._match_keyword("purpose_patterns", user_input)
+            if purpose is not None:
+                self.session_state["preferences"]["purpose"] = purpose
+                print(f"[INFO] Detected purpose: {purpose}")
         
         # Extract compound preference
         if self.session_state["preferences"]["compound"] is None:
-            for answer, patterns in self.patterns["compound_patterns"].items():
-                if any(pattern in user_input.lower() for pattern in patterns):
-                    self.session_state["preferences"]["compound"] = answer
-                    print(f"[INFO] Detected compound preference: {answer}")
-                    break
+            answer = self._match_keyword("compound_patterns", user_input)
+            if answer is not None:
+                self.session_state["preferences"]["compound"] = answer
+                print(f"[INFO] Detected compound preference: {answer}")
         
         # Extract finishing
         if self.session_state["preferences"]["finishing"] is None:
-            for finishing, patterns in self.patterns["finishing_patterns"].items():
-                if any(pattern in user_input.lower() for pattern in patterns):
-                    self.session_state["preferences"]["finishing"] = finishing
-                    print(f"[INFO] Detected finishing: {finishing}")
-                    break
+            finishing = self._match_keyword("finishing_patterns", user_input)
+            if finishing is not None:
+                self.session_state["preferences"]["finishing"] = finishing
+                print(f"[INFO] Detected finishing: {finishing}")
         
         # Extract finishing type
         if self.session_state["preferences"]["finishing"] == "متشطب" and self.session_state["preferences"].get("finishing_type") is None:
-            for finish_type, patterns in self.patterns["finishing_type_patterns"].items():
-                if any(pattern in user_input.lower() for pattern in patterns):
-                    self.session_state["preferences"]["finishing_type"] = finish_type
-                    print(f"[INFO] Detected finishing type: {finish_type}")
-                    break
+            finish_type = self._match_keyword("finishing_type_patterns", user_input)
+            if finish_type is not None:
+                self.session_state["preferences"]["finishing_type"] = finish_type
+                print(f"[INFO] Detected finishing type: {finish_type}")
         
-        # Extract services
-        services = self.session_state["preferences"]["services"]
+        # Extract services, spelled right or not
+        preferences = self.session_state["preferences"]
         for service, patterns in self.patterns["services_patterns"].items():
-            if any(pattern in user_input.lower() for pattern in patterns) and service not in services:
-                services.append(service)
+            if any(pattern in user_input.lower() for pattern in patterns) and preferences.add_service(service):
                 print(f"[INFO] Detected service: {service}")
+        for service in self._fuzzy_labels("services_patterns", user_input):
+            if preferences.add_service(service):
+                print(f"[INFO] Detected misspelled service: {service}")
+        
+        # Extract listing features (garden, balcony, near metro...)
+        normalized_input = normalize(user_input)
+        for feature, phrases in self.feature_phrases.items():
+            if feature not in preferences["other_features"] and any(phrase in normalized_input for phrase in phrases):
+                preferences["other_features"].append(feature)
+                print(f"[INFO] Detected feature: {feature}")
         
         # Extract budget
         if self.session_state["preferences"]["budget"] is None:
             # First try the specific pattern
-            budget_match = re.search(self.patterns["budget_patterns"]["money"], user_input)
+            budget_match = self.regex["budget_patterns"]["money"].search(user_input)
             if budget_match:
                 amount = budget_match.group(1).replace(',', '')
                 currency = budget_match.group(2) if budget_match.group(2) else ""
@@ -800,13 +938,14 @@ class ArabicRealEstateAgent:
                         amount *= 1000  # Assume it's in thousands
                     
                     self.session_state["preferences"]["budget"] = amount
-                    print(f"[INFO] Extracted budget: {amount}")
+                    self.session_state["preferences"]["budget_currency"] = currency_from_word(user_input)
+                    print(f"[INFO] Extracted budget: {amount} {self._budget_currency()}")
                 except ValueError:
                     pass
             
             # Try to find budget range (from X to Y)
             elif any(phrase in user_input.lower() for phrase in ["من", "الى", "إلى", "حتى", "لغاية", "to", "بين"]):
-                numbers = re.findall(r'\d+(?:,\d+)*', user_input)
+                numbers = self.regex["budget_patterns"]["range_numbers"].findall(user_input)
                 if len(numbers) >= 2:
                     try:
                         # Take the higher number as the budget
@@ -820,13 +959,14 @@ class ArabicRealEstateAgent:
                             max_amount *= 1000  # Assume it's in thousands
                         
                         self.session_state["preferences"]["budget"] = max_amount
-                        print(f"[INFO] Extracted budget from range: {max_amount}")
+                        self.session_state["preferences"]["budget_currency"] = currency_from_word(user_input)
+                        print(f"[INFO] Extracted budget from range: {max_amount} {self._budget_currency()}")
                     except ValueError:
                         pass
         
         # Extract bedroom count
         if self.session_state["preferences"]["bedrooms"] is None:
-            bedroom_match = re.search(self.patterns["bedroom_patterns"]["count"], user_input)
+            bedroom_match = self.regex["bedroom_patterns"]["count"].search(user_input)
             if bedroom_match:
                 try:
                     bedrooms = int(bedroom_match.group(1))
@@ -837,7 +977,7 @@ class ArabicRealEstateAgent:
         
         # Extract bathroom count
         if self.session_state["preferences"]["bathrooms"] is None:
-            bathroom_match = re.search(self.patterns["bathroom_patterns"]["count"], user_input)
+            bathroom_match = self.regex["bathroom_patterns"]["count"].search(user_input)
             if bathroom_match:
                 try:
                     bathrooms = int(bathroom_match.group(1))
@@ -848,7 +988,7 @@ class ArabicRealEstateAgent:
         
         # Extract area
         if self.session_state["preferences"]["area_m2"] is None:
-            area_match = re.search(self.patterns["area_patterns"]["area"], user_input)
+            area_match = self.regex["area_patterns"]["area"].search(user_input)
             if area_match:
                 try:
                     area = int(area_match.group(1))
@@ -859,7 +999,7 @@ class ArabicRealEstateAgent:
         
         # Extract floor
         if self.session_state["preferences"]["floor"] is None:
-            floor_match = re.search(self.patterns["floor_patterns"]["floor"], user_input)
+            floor_match = self.regex["floor_patterns"]["floor"].search(user_input)
             if floor_match:
                 try:
                     floor = int(floor_match.group(1))
@@ -884,32 +1024,18 @@ class ArabicRealEstateAgent:
                         return  # Exit early if we found a match
                 
                 # Direct matching for common Arabic locations as fallback
-                common_locations = {
-                    "التجمع": "Cairo", 
-                    "الرحاب": "Cairo",
-                    "مدينتي": "Cairo",
-                    "الشيخ زايد": "Giza",
-                    "6 اكتوبر": "Giza",
-                    "أكتوبر": "Giza",
-                    "المعادي": "Cairo",
-                    "مصر الجديدة": "Cairo",
-                    "القاهرة الجديدة": "Cairo",
-                    "الإسكندرية": "Alexandria",
-                    "اسكندرية": "Alexandria",
-                    "الجيزة": "Giza",
-                    "جيزة": "Giza",
-                    "القاهرة": "Cairo",
-                    "أسيوط": "Assiut",
-                    "المنصورة": "Mansoura",
-                }
-                
-                # Check common locations
-                for location_key, location_value in common_locations.items():
+                for location_key, location_value in self.common_locations.items():
                     if location_key.lower() in user_input_lower:
                         print(f"[INFO] Matched common location: {location_value}")
                         self.session_state["preferences"]["location"] = location_value
                         return  # Exit early if we found a match
                 
+                # Then misspelled place names, e.g. "اسكندريه"
+                for location in self._fuzzy_labels("location", user_input):
+                    print(f"[INFO] Matched misspelled location: {location}")
+                    self.session_state["preferences"]["location"] = location
+                    return
+                
                 # For the case where we're specifically asking for location and we get a one-word answer
                 if self.session_state["conversation_stage"] == "clarifying" and len(user_input.split()) <= 2:
                     # Use the input directly as a location if it's short
@@ -928,6 +1054,27 @@ class ArabicRealEstateAgent:
             except Exception as e:
                 print(f"[ERROR] Failed to match location from dataset: {str(e)}")
     
+    @traced("agent.get_adaptive_sales_pitch")
+    def _select_recommendation(self, index: int) -> None:
+        """
+        Make the index-th listing of the last recommendation the current
+        property, the one that is pitched and held.
+        
+        Args:
+            index: 0 for the first recommended listing, 1 for the second
+        """
+        self.session_state["selected_property_index"] = index
+        current_property = self.session_state["current_property"]
+        shown = self.session_state["shown_properties"]
+        if index == 0 or not current_property or "id" not in current_property:
+            return
+        # The last recommendation is the newest shown listings, the current property first
+        first = shown.index(int(current_property["id"])) if int(current_property["id"]) in shown else -1
+        if first >= 0 and first + index < len(shown):
+            property_data = self.get_property(shown[first + index])
+            if property_data is not None:
+                self.session_state["current_property"] = property_data
+    
     def _get_adaptive_sales_pitch(self) -> str:
         """
         Generate varied and persuasive sales pitches that build desire for the current property
@@ -936,37 +1083,9 @@ class ArabicRealEstateAgent:
             A persuasive sales argument
         """
         # Get a different sales pitch each time
-        used_arguments = self.session_state.get("used_sales_arguments", [])
-        property_data = self.session_state.get("current_property", {})
-        
-        # Filter out arguments we've already used
-        available_arguments = [arg for arg in self.sales_arguments if arg not in used_arguments]
-        
-        # If we've used all arguments, reset
-        if not available_arguments:
-            self.session_state["used_sales_arguments"] = []
-            available_arguments = self.sales_arguments
-        
-        # Choose a random argument
-        pitch = random.choice(available_arguments)
-        
-        # Enhance pitch with property-specific details if available
-        if property_data:
-            try:
-                # Add property details to personalize the pitch
-                if "neighborhood" in property_data and "location" in property_data:
-                    pitch = pitch.replace("المنطقة دي", f"منطقة {property_data['neighborhood']} في {property_data['location']}")
-                
-                # Add price comparison if available
-                if "price" in property_data:
-                    price = int(property_data["price"])
-                    pitch += f"\n\nالسعر ({price:,}) أقل من متوسط أسعار العقارات المماثلة في المنطقة بنسبة 5-10%."
-            except:
-                # If any error occurs during personalization, just use the original pitch
-                pass
-        
-        # Update used arguments
-        used_arguments.append(pitch)
+        pitch, used_arguments = self.pitch_engine.next_pitch(
+            self.session_state["used_sales_arguments"], self.session_state["current_property"]
+        )
         self.session_state["used_sales_arguments"] = used_arguments
         
         return pitch
@@ -978,6 +1097,12 @@ class ArabicRealEstateAgent:
         Returns:
             The next question to ask
         """
+        if self.facet_index is not None:
+            question_type = self._next_adaptive_question()
+            if question_type is None:
+                return self._generate_summary()
+            return self._ask_question(question_type)
+        
         # If we've asked all questions, move to summary
         if self.session_state["question_flow_index"] >= len(self.question_flow):
             return self._generate_summary()
@@ -1037,60 +1162,130 @@ class ArabicRealEstateAgent:
             return self._ask_next_question()
         
         # Ask the appropriate question
-        if question_type == "location":
-            self.session_state["last_question_asked"] = "ask_location"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_location")
-        elif question_type == "purpose":
-            self.session_state["last_question_asked"] = "ask_purpose"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_purpose")
-        elif question_type == "type":
-            self.session_state["last_question_asked"] = "ask_type"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_type")
-        elif question_type == "compound":
-            self.session_state["last_question_asked"] = "ask_compound"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_compound")
-        elif question_type == "area_m2":
-            self.session_state["last_question_asked"] = "ask_area"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_area")
-        elif question_type == "finishing":
-            self.session_state["last_question_asked"] = "ask_finishing"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_finishing")
-        elif question_type == "finishing_type":
-            self.session_state["last_question_asked"] = "ask_finishing_type"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_finishing_type")
-        elif question_type == "services":
-            self.session_state["last_question_asked"] = "ask_services"
+        return self._ask_question(question_type)
+    
+    def _ask_question(self, question_type: str) -> str:
+        """
+        Ask one question of the flow and record it as asked
+        
+        Args:
+            question_type: Entry of self.question_flow
+            
+        Returns:
+            The question text
+        """
+        question_key = "ask_area" if question_type == "area_m2" else f"ask_{question_type}"
+        self.session_state["last_question_asked"] = question_key
+        self.session_state["asked_questions"] |= 1 << self.question_flow.index(question_type)
+        self.session_state["question_flow_index"] += 1
+        if question_type == "services":
             self.session_state["asked_services"] = True
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_services")
-        elif question_type == "floor":
-            self.session_state["last_question_asked"] = "ask_floor"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_floor")
-        elif question_type == "budget":
-            self.session_state["last_question_asked"] = "ask_budget"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_budget")
-        elif question_type == "bedrooms":
-            self.session_state["last_question_asked"] = "ask_bedrooms"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_bedrooms")
-        elif question_type == "bathrooms":
-            self.session_state["last_question_asked"] = "ask_bathrooms"
-            self.session_state["question_flow_index"] += 1
-            return self.get_phrase("ask_bathrooms")
-        else:
-            # Increment index and try next question
-            self.session_state["question_flow_index"] += 1
-            return self._ask_next_question()
+        return self.get_phrase(question_key)
+    
+    def _next_adaptive_question(self) -> Optional[str]:
+        """
+        Pick the unasked question that is expected to narrow the remaining
+        listings the most; ties keep the question flow order. Questions the
+        catalogue has no column for (purpose, floor) cannot be scored, so they
+        are still asked in flow order once no other question would help
+        
+        Returns:
+            The question type, or None once few enough listings remain or no
+            question would narrow them down and none is left unscored
+        """
+        rows = self._candidate_rows()
+        preferences = self.session_state["preferences"]
+        asked = self.session_state["asked_questions"]
+        open_questions = []
+        for index, question_type in enumerate(self.question_flow):
+            if asked >> index & 1:
+                continue
+            # Same skip rules as the fixed order
+            if question_type == "compound" and preferences["type"] not in ["شقة", "فيلا"]:
+                continue
+            if question_type == "finishing_type" and preferences["finishing"] != "متشطب":
+                continue
+            if question_type == "services":
+                if preferences["services"]:
+                    continue
+            elif preferences[question_type] is not None:
+                continue
+            open_questions.append(question_type)
+        
+        best_question, best_gain = None, 0.0
+        if rows.bit_count() > SUMMARIZE_AT:
+            for question_type in open_questions:
+                gain = self.facet_index.information_gain(question_type, rows)
+                if gain > best_gain + 1e-9:
+                    best_question, best_gain = question_type, gain
+        
+        if best_question is not None:
+            print(f"[INFO] Asking {best_question} ({best_gain:.2f} bits over {rows.bit_count()} listings)")
+            return best_question
+        for question_type in open_questions:
+            if question_type not in self.facet_index.answers:
+                print(f"[INFO] Asking unscored {question_type} ({rows.bit_count()} listings left)")
+                return question_type
+        print(f"[INFO] {rows.bit_count()} listings left, summarizing")
+        return None
+    
+    def _candidate_rows(self) -> int:
+        """
+        Bitmap of the listings the recommendation search would still consider,
+        narrowed by the answered questions like in _make_recommendation(), less
+        its nearby-location and cheapest-listing fallbacks
+        """
+        facets = self.facet_index
+        preferences = self.session_state["preferences"]
+        rows = facets.all_rows
+        
+        def narrow(rows: int, matching: int) -> int:
+            # A filter that would leave nothing is dropped, as in the search
+            return rows & matching or rows
+        
+        for column in ("type", "location"):
+            if preferences[column] is not None:
+                rows = narrow(rows, facets.values.get(column, {}).get(preferences[column], 0))
+        
+        for column in ("bedrooms", "bathrooms"):
+            count = preferences[column]
+            if count is not None:
+                values = facets.values.get(column, {})
+                nearby = values.get(count - 1, 0) | values.get(count, 0) | values.get(count + 1, 0)
+                rows = rows & values.get(count, 0) or narrow(rows, nearby)
+        
+        for property_id in self._held_ids():
+            position = self.property_index.position_of(property_id)
+            if position is not None:
+                rows &= ~(1 << position)
+        
+        required_mask, required_value = self._attribute_requirement()
+        if required_mask:
+            rows = narrow(rows, facets.attribute_rows(required_mask, required_value))
+        
+        if preferences["area_m2"] is not None and "area_m2" in facets.answers:
+            for tolerance in AREA_TOLERANCES:
+                matching = rows & facets.area_rows(preferences["area_m2"], tolerance)
+                if matching:
+                    rows = matching
+                    break
+        
+        if preferences["budget"] is not None and "budget" in facets.answers:
+            budget = self.rates.to_base(preferences["budget"], self._budget_currency())
+            for buffer in BUDGET_BUFFERS:
+                matching = rows & facets.budget_rows(budget, buffer)
+                if matching:
+                    rows = matching
+                    break
+        return rows
+    
+    def _held_ids(self) -> FrozenSet[int]:
+        """Ids of the listings held by chats other than the current one."""
+        if self.listing_holds is None:
+            return frozenset()
+        return self.listing_holds.held_ids(self.current_chat_id)
     
+    @traced("agent.generate_summary")
     def _generate_summary(self) -> str:
         """Generate a summary of collected preferences"""
         preferences = self.session_state["preferences"]
@@ -1112,7 +1307,7 @@ class ArabicRealEstateAgent:
                 summary += f"• الغرض: {preferences['purpose']}\n"
             
             if preferences["budget"]:
-                summary += f"• الميزانية: {int(preferences['budget']):,} جنيه\n"
+                summary += f"• الميزانية: {int(preferences['budget']):,} {currency_name(self._budget_currency())}\n"
             
             if preferences["area_m2"]:
                 summary += f"• المساحة: {preferences['area_m2']} متر مربع\n"
@@ -1136,6 +1331,9 @@ class ArabicRealEstateAgent:
             if len(preferences["services"]) > 0:
                 summary += f"• الخدمات المطلوبة: {', '.join(preferences['services'])}\n"
             
+            if len(preferences["other_features"]) > 0:
+                summary += f"• مميزات إضافية: {', '.join(self._feature_labels())}\n"
+            
             summary += f"\n{self.get_phrase('summary_confirm')}"
         
         elif self.current_dialect == "khaleeji":
@@ -1151,7 +1349,7 @@ class ArabicRealEstateAgent:
                 summary += f"• الغرض: {preferences['purpose']}\n"
             
             if preferences["budget"]:
-                summary += f"• الميزانية: {int(preferences['budget']):,} ريال\n"
+                summary += f"• الميزانية: {int(preferences['budget']):,} {currency_name(self._budget_currency())}\n"
             
             if preferences["area_m2"]:
                 summary += f"• المساحة: {preferences['area_m2']} متر مربع\n"
@@ -1175,6 +1373,9 @@ class ArabicRealEstateAgent:
             if len(preferences["services"]) > 0:
                 summary += f"• الخدمات المطلوبة: {', '.join(preferences['services'])}\n"
             
+            if len(preferences["other_features"]) > 0:
+                summary += f"• مميزات إضافية: {', '.join(self._feature_labels())}\n"
+            
             summary += f"\n{self.get_phrase('summary_confirm')}"
         
         else:  # MSA
@@ -1190,7 +1391,7 @@ class ArabicRealEstateAgent:
                 summary += f"• الغرض: {preferences['purpose']}\n"
             
             if preferences["budget"]:
-                summary += f"• الميزانية: {int(preferences['budget']):,} وحدة نقدية\n"
+                summary += f"• الميزانية: {int(preferences['budget']):,} {currency_name(self._budget_currency())}\n"
             
             if preferences["area_m2"]:
                 summary += f"• المساحة: {preferences['area_m2']} متر مربع\n"
@@ -1214,10 +1415,15 @@ class ArabicRealEstateAgent:
             if len(preferences["services"]) > 0:
                 summary += f"• الخدمات المطلوبة: {', '.join(preferences['services'])}\n"
             
+            if len(preferences["other_features"]) > 0:
+                summary += f"• مميزات إضافية: {', '.join(self._feature_labels())}\n"
+            
             summary += f"\n{self.get_phrase('summary_confirm')}"
         
         return summary
     
+    @traced("agent.make_recommendation")
+    @AGENT_STEP_SECONDS.time("make_recommendation")
     def _make_recommendation(self) -> str:
         """
         Generate a property recommendation based on user preferences.
@@ -1226,6 +1432,7 @@ class ArabicRealEstateAgent:
             Recommendation text with property details
         """
         preferences = self.session_state["preferences"]
+        nearby_note = None
         
         # Filter properties based on preferences
         filtered_df = self.properties_df.copy()
@@ -1233,10 +1440,11 @@ class ArabicRealEstateAgent:
         # Apply loose filtering when we can't find exact matches
         if preferences["type"] is not None:
             try:
-                filtered_df = filtered_df[filtered_df["type"] == preferences["type"]]
+                filtered_df = filtered_df[filtered_df["type"].isin(type_values(preferences["type"]))]
                 # If no results, don't filter by type
                 if len(filtered_df) == 0:
                     print(f"[INFO] No properties match the type {preferences['type']}, ignoring type filter")
+                    RECOMMENDATION_FALLBACKS.inc("type_filter_dropped")
                     filtered_df = self.properties_df.copy()
             except Exception as e:
                 print(f"[ERROR] Error filtering by type: {str(e)}")
@@ -1246,8 +1454,20 @@ class ArabicRealEstateAgent:
                 exact_match_df = filtered_df[filtered_df["location"] == preferences["location"]]
                 # If no exact matches, try loose matching
                 if len(exact_match_df) == 0:
-                    print(f"[INFO] No exact location matches for {preferences['location']}, trying loose matching")
-                    # Don't apply location filter if can't find match
+                    print(f"[INFO] No exact location matches for {preferences['location']}, trying nearby areas")
+                    nearby_df, nearby = self._find_nearby_properties(filtered_df, preferences["location"])
+                    if nearby_df is not None:
+                        RECOMMENDATION_FALLBACKS.inc("nearby_location")
+                        filtered_df = nearby_df
+                        if nearby.distance_km >= 1:
+                            nearby_note = self.get_phrase("nearby_alternative").format(
+                                requested=preferences["location"],
+                                nearby=nearby.place.name,
+                                distance=int(round(nearby.distance_km))
+                            )
+                    else:
+                        # Don't apply location filter if can't find match
+                        RECOMMENDATION_FALLBACKS.inc("location_filter_dropped")
                 else:
                     filtered_df = exact_match_df
             except Exception as e:
@@ -1265,6 +1485,7 @@ class ArabicRealEstateAgent:
                         (filtered_df["bedrooms"] <= preferences["bedrooms"] + 1)
                     ]
                     if len(nearby_df) > 0:
+                        RECOMMENDATION_FALLBACKS.inc("bedrooms_nearby")
                         filtered_df = nearby_df
                 else:
                     filtered_df = exact_match_df
@@ -1283,33 +1504,75 @@ class ArabicRealEstateAgent:
                         (filtered_df["bathrooms"] <= preferences["bathrooms"] + 1)
                     ]
                     if len(nearby_df) > 0:
+                        RECOMMENDATION_FALLBACKS.inc("bathrooms_nearby")
                         filtered_df = nearby_df
                 else:
                     filtered_df = exact_match_df
             except Exception as e:
                 print(f"[ERROR] Error filtering by bathrooms: {str(e)}")
         
-        if preferences["budget"] is not None and len(filtered_df) > 0:
+        required_mask, required_value = self._attribute_requirement()
+        if required_mask and len(filtered_df) > 0:
+            try:
+                # One AND across all candidates covers services, compound and finishing
+                flags = filtered_df[ATTRIBUTES_COLUMN].to_numpy()
+                attribute_df = filtered_df[(flags & required_mask) == required_value]
+                if len(attribute_df) == 0:
+                    print(f"[INFO] No properties have all requested services and finishing, ignoring them")
+                    RECOMMENDATION_FALLBACKS.inc("attribute_filter_dropped")
+                else:
+                    filtered_df = attribute_df
+            except Exception as e:
+                print(f"[ERROR] Error filtering by services and finishing: {str(e)}")
+        
+        if preferences["area_m2"] is not None and len(filtered_df) > 0 and "area_m2" in self.column_ranges:
+            try:
+                # Candidates in area order; each wider tolerance is two more binary searches
+                areas = self.column_ranges["area_m2"].subset(self._row_mask(filtered_df))
+                area = preferences["area_m2"]
+                for tolerance in AREA_TOLERANCES:
+                    area_positions = areas.between(area * (1 - tolerance), area * (1 + tolerance))
+                    if len(area_positions) > 0:
+                        if tolerance != AREA_TOLERANCES[0]:
+                            RECOMMENDATION_FALLBACKS.inc("area_range_widened")
+                        filtered_df = self.properties_df.iloc[area_positions]
+                        break
+                else:
+                    print(f"[INFO] No properties near {area} m2, ignoring area filter")
+                    RECOMMENDATION_FALLBACKS.inc("area_filter_dropped")
+            except Exception as e:
+                print(f"[ERROR] Error filtering by area: {str(e)}")
+        
+        if preferences["budget"] is not None and len(filtered_df) > 0 and "price" in self.column_ranges:
             try:
+                # Candidates in base-currency price order; the wider budgets below only extend this slice
+                prices = self.column_ranges["price"].subset(self._row_mask(filtered_df))
+                budget = self.rates.to_base(preferences["budget"], self._budget_currency())
+                
                 # Add a 20% buffer to the budget
-                budget_with_buffer = preferences["budget"] * 1.2
-                budget_filtered_df = filtered_df[filtered_df["price"] <= budget_with_buffer]
+                budget_positions = prices.between(high=budget * BUDGET_BUFFERS[0])
                 
                 # If no properties within budget, try up to 50% over budget
-                if len(budget_filtered_df) == 0:
+                if len(budget_positions) == 0:
                     print(f"[INFO] No properties within budget {preferences['budget']}, extending buffer")
-                    extended_budget = preferences["budget"] * 1.5
-                    budget_filtered_df = filtered_df[filtered_df["price"] <= extended_budget]
+                    RECOMMENDATION_FALLBACKS.inc("budget_buffer_extended")
+                    budget_positions = prices.between(high=budget * BUDGET_BUFFERS[1])
                 
                 # If still no matches, just get the cheapest options
-                if len(budget_filtered_df) == 0:
+                if len(budget_positions) == 0:
                     print(f"[INFO] No properties within extended budget, finding cheapest options")
-                    budget_filtered_df = filtered_df.nsmallest(3, "price")
+                    RECOMMENDATION_FALLBACKS.inc("cheapest_fallback")
+                    budget_positions = prices.positions[:3]
                 
-                filtered_df = budget_filtered_df
+                filtered_df = self.properties_df.iloc[budget_positions]
             except Exception as e:
                 print(f"[ERROR] Error filtering by budget: {str(e)}")
         
+        # Listings other chats are reserving are never offered
+        held = self._held_ids()
+        if held:
+            filtered_df = filtered_df[~filtered_df["id"].isin(held)]
+        
         # Filter out properties already shown, if possible
         try:
             if len(self.session_state["shown_properties"]) > 0:
@@ -1326,18 +1589,27 @@ class ArabicRealEstateAgent:
         
         # Present two options as requested
         try:
-            # Sort by price to get the best matches within budget
-            filtered_df = filtered_df.sort_values(by="price")
+            # Sort by price to get the best matches within budget,
+            # listings more relevant to the request first
+            relevance = self._relevance_scores(filtered_df)
+            if relevance is not None:
+                order = np.lexsort((filtered_df[BASE_PRICE_COLUMN].to_numpy(), -relevance))
+                filtered_df = filtered_df.iloc[order]
+            else:
+                filtered_df = filtered_df.sort_values(by=BASE_PRICE_COLUMN)
             
             # Get up to 2 properties to recommend
             best_properties = []
             for i in range(min(2, len(filtered_df))):
                 property_data = filtered_df.iloc[i]
                 
-                # Add to shown properties
+                # Add to shown properties; a listing shown again moves to the end, so the
+                # newest entries are always this recommendation, in order
                 property_id = int(property_data["id"]) if "id" in property_data else -1
-                if property_id >= 0 and property_id not in self.session_state["shown_properties"]:
-                    self.session_state["shown_properties"].append(property_id)
+                if property_id >= 0:
+                    if property_id in self.session_state["shown_properties"]:
+                        self.session_state["shown_properties"].remove(property_id)
+                    self.session_state.remember_shown(property_id)
                 
                 if i == 0:
                     self.session_state["current_property"] = property_data.to_dict()
@@ -1346,12 +1618,120 @@ class ArabicRealEstateAgent:
             
             # Generate recommendations text
             recommendation = self._format_multiple_recommendations(best_properties)
+            if nearby_note:
+                recommendation = f"{nearby_note}\n\n{recommendation}"
             return recommendation
             
         except Exception as e:
             print(f"[ERROR] Error selecting best properties: {str(e)}")
             return "عذراً، حدثت مشكلة في اختيار العقار المناسب. هل يمكننا تعديل معايير البحث؟"
     
+    def _feature_labels(self) -> List[str]:
+        """Arabic names of the requested listing features."""
+        return [
+            self.patterns["feature_patterns"].get(feature, [feature])[0]
+            for feature in self.session_state["preferences"]["other_features"]
+        ]
+    
+    def _budget_currency(self) -> str:
+        """Currency of the budget: as stated by the user, else the dialect's usual one."""
+        return self.session_state["preferences"]["budget_currency"] or DIALECT_CURRENCIES.get(self.current_dialect, BASE_CURRENCY)
+    
+    def _format_price(self, property_data) -> str:
+        """Listing price in its own currency, plus the budget currency equivalent when they differ."""
+        listing_currency = property_data.get("currency", BASE_CURRENCY)
+        price_text = f"{int(property_data['price']):,} {listing_currency}"
+        budget_currency = self._budget_currency()
+        if budget_currency != listing_currency and budget_currency in self.rates:
+            converted = self.rates.from_base(property_data[BASE_PRICE_COLUMN], budget_currency)
+            price_text += f" (≈ {int(converted):,} {currency_name(budget_currency)})"
+        return price_text
+    
+    def _attribute_requirement(self):
+        """
+        Translate service, compound and finishing preferences into a bit test
+        on the packed listing attributes.
+        
+        Returns:
+            Tuple of (mask, value): a listing matches when flags & mask == value
+        """
+        preferences = self.session_state["preferences"]
+        mask = 0
+        for service in preferences["services"]:
+            mask |= 1 << SERVICES.index(service)
+        value = mask
+        
+        # Only an explicit "yes" requires a compound; "no" means it doesn't matter
+        if preferences["compound"] == "نعم":
+            mask |= COMPOUND_BIT
+            value |= COMPOUND_BIT
+        if preferences["finishing"] is not None:
+            mask |= FIELD_MASK << FINISHING_SHIFT
+            value |= (FINISHINGS.index(preferences["finishing"]) + 1) << FINISHING_SHIFT
+        # "Standard" is the answer for users who don't mind the finishing type
+        if preferences["finishing_type"] is not None and preferences["finishing_type"] != "عادي":
+            mask |= FIELD_MASK << FINISHING_TYPE_SHIFT
+            value |= (FINISHING_TYPES.index(preferences["finishing_type"]) + 1) << FINISHING_TYPE_SHIFT
+        return mask, value
+    
+    def _relevance_scores(self, filtered_df: pd.DataFrame):
+        """
+        Score candidates against the requested features and, with semantic
+        search enabled, against the wording of the request.
+        
+        Each matched feature counts one point; semantic similarity adds up to
+        one more, rounded to 0.1 so price still orders near-equal listings.
+        
+        Returns:
+            Scores aligned with filtered_df rows, or None if nothing was requested
+        """
+        features = self.session_state["preferences"]["other_features"]
+        query = " ".join(features + [self.current_request]).strip() if self.semantic_index is not None else ""
+        if not features and not query:
+            return None
+        
+        positions = self.properties_df.index.get_indexer(filtered_df.index)
+        scores = np.zeros(len(positions), dtype=np.float64)
+        if features:
+            scores += self.description_index.score(features)[positions]
+        if query:
+            with AGENT_STEP_SECONDS.timer("semantic_search"):
+                similarity = self.semantic_index.similarities(query, self._row_mask(filtered_df))
+            scores += np.round(similarity[positions], 1)
+        return scores
+    
+    def _row_mask(self, filtered_df: pd.DataFrame):
+        """Boolean mask over catalogue rows marking the rows of filtered_df."""
+        return self.column_ranges.row_mask(self.properties_df.index.get_indexer(filtered_df.index))
+    
+    def _find_nearby_properties(self, filtered_df: pd.DataFrame, location: str):
+        """
+        Find listings in the places closest to a location that has none,
+        widening the search radius step by step.
+        
+        Args:
+            filtered_df: Candidate listings
+            location: The requested location
+            
+        Returns:
+            Tuple of (matching listings, closest matching NearbyPlace), or (None, None)
+        """
+        for nearby_places in self.location_index.widening(location):
+            if not nearby_places:
+                continue
+            names = [nearby.place.name for nearby in nearby_places]
+            in_location = filtered_df["location"].isin(names)
+            in_neighborhood = filtered_df["neighborhood"].isin(names)
+            nearby_df = filtered_df[in_location | in_neighborhood]
+            if len(nearby_df) == 0:
+                continue
+            matched = set(nearby_df["location"]) | set(nearby_df["neighborhood"])
+            closest = next(nearby for nearby in nearby_places if nearby.place.name in matched)
+            print(f"[INFO] Using listings near {location}: {closest.place.name} ({closest.distance_km:.0f} km)")
+            return nearby_df, closest
+        return None, None
+    
+    @traced("agent.format_multiple_recommendations")
     def _format_multiple_recommendations(self, properties):
         """Format multiple property recommendations"""
         try:
@@ -1361,7 +1741,7 @@ class ArabicRealEstateAgent:
                 for i, property_data in enumerate(properties):
                     recommendation += f"✨ الاقتراح رقم {i+1}:\n"
                     recommendation += f"🏠 {property_data['type']} في {property_data['location']}, حي {property_data['neighborhood']}\n"
-                    recommendation += f"💰 السعر: {int(property_data['price']):,} {property_data['currency']}\n"
+                    recommendation += f"💰 السعر: {self._format_price(property_data)}\n"
                     recommendation += f"🛏️ عدد الغرف: {int(property_data['bedrooms'])}\n"
                     recommendation += f"🚿 عدد الحمامات: {int(property_data['bathrooms'])}\n"
                     recommendation += f"📏 المساحة: {int(property_data['area_m2'])} متر مربع\n"
@@ -1375,7 +1755,7 @@ class ArabicRealEstateAgent:
                 for i, property_data in enumerate(properties):
                     recommendation += f"✨ الاقتراح رقم {i+1}:\n"
                     recommendation += f"🏠 {property_data['type']} في {property_data['location']}, حي {property_data['neighborhood']}\n"
-                    recommendation += f"💰 السعر: {int(property_data['price']):,} {property_data['currency']}\n"
+                    recommendation += f"💰 السعر: {self._format_price(property_data)}\n"
                     recommendation += f"🛏️ عدد الغرف: {int(property_data['bedrooms'])}\n"
                     recommendation += f"🚿 عدد الحمامات: {int(property_data['bathrooms'])}\n"
                     recommendation += f"📏 المساحة: {int(property_data['area_m2'])} متر مربع\n"
@@ -1389,7 +1769,7 @@ class ArabicRealEstateAgent:
                 for i, property_data in enumerate(properties):
                     recommendation += f"✨ الاقتراح رقم {i+1}:\n"
                     recommendation += f"🏠 {property_data['type']} في {property_data['location']}, حي {property_data['neighborhood']}\n"
-                    recommendation += f"💰 السعر: {int(property_data['price']):,} {property_data['currency']}\n"
+                    recommendation += f"💰 السعر: {self._format_price(property_data)}\n"
                     recommendation += f"🛏️ عدد الغرف: {int(property_data['bedrooms'])}\n"
                     recommendation += f"🚿 عدد الحمامات: {int(property_data['bathrooms'])}\n"
                     recommendation += f"📏 المساحة: {int(property_data['area_m2'])} متر مربع\n"
@@ -1402,6 +1782,7 @@ class ArabicRealEstateAgent:
             print(f"[ERROR] Error formatting property recommendations: {str(e)}")
             return f"{self.get_phrase('recommendation')}\n\nلدي عقارات تناسب طلبك، ولكن حدثت مشكلة في عرض التفاصيل. هل ترغب في تعديل معايير البحث؟"
     
+    @traced("agent.suggest_criteria_adjustment")
     def _suggest_criteria_adjustment(self) -> str:
         """
         Suggest adjusting search criteria when no matching properties are found.
@@ -1416,8 +1797,8 @@ class ArabicRealEstateAgent:
         
         # Check budget constraints
         if preferences["budget"] is not None:
-            min_price = self.properties_df["price"].min()
-            if min_price > preferences["budget"]:
+            min_price = self.properties_df[BASE_PRICE_COLUMN].min()
+            if min_price > self.rates.to_base(preferences["budget"], self._budget_currency()):
                 problem_criteria.append("budget_too_low")
         
         # Check location constraints
@@ -1485,6 +1866,13 @@ class ArabicRealEstateAgent:
                 suggestion = "لم أجد عقارات بهذا العدد من الغرف. هل يمكننا النظر في عدد غرف مختلف؟"
             else:
                 suggestion = "المعايير التي اخترتها غير متوفرة معاً. هل يمكننا تعديل أحدها؟"
+        
+        # Name the closest areas that do have listings
+        if "location_not_available" in problem_criteria and "budget_too_low" not in problem_criteria:
+            nearby_places = self.location_index.nearest(preferences["location"], k=3)
+            if nearby_places:
+                names = "، ".join(nearby.place.name for nearby in nearby_places)
+                suggestion = self.get_phrase("suggest_nearby_locations").format(places=names)
                 
         # Move to refining stage
         self.session_state["conversation_stage"] = "refining"
@@ -1,11 +1,34 @@
 import os
+import hmac
+import json
 import logging
-from flask import Flask, render_template, request, jsonify, session
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
-from werkzeug.middleware.proxy_fix import ProxyFix
-import pandas as pd
-from Ai_agnet_realestate import ArabicRealEstateAgent
+import math
+import threading
+import time
+from functools import wraps
+from startup_profile import phase, report as report_startup
+
+with phase("import flask"):
+    from flask import Flask, g, render_template, request, jsonify, session
+    from werkzeug.middleware.proxy_fix import ProxyFix
+
+with phase("import sqlalchemy"):
+    from flask_sqlalchemy import SQLAlchemy
+    from sqlalchemy.exc import DatabaseError
+    from sqlalchemy.orm import DeclarativeBase
+
+# The WebSocket transport is optional; without flask-sock the client falls back to POST /api/chat
+try:
+    from flask_sock import ConnectionClosed, Sock
+except ImportError:
+    ConnectionClosed = Sock = None
+
+import holds
+import profiler
+import shadow
+from metrics import Counter, Gauge, Histogram, render_metrics
+from session_state import SESSION_BYTE_BUDGET, SESSIONS_OVER_BUDGET, DatabaseSessionStore
+from tracing import recent_traces, span, start_trace
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -15,61 +38,330 @@ class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
+
+# Metrics exposed on /metrics
+CHAT_TURN_SECONDS = Histogram("chat_turn_seconds", "Total time to handle one /api/chat request")
+TEMPLATE_RENDER_SECONDS = Histogram("template_render_seconds", "Time spent rendering templates", ("template",))
+DB_COMMIT_SECONDS = Histogram("db_commit_seconds", "Time spent in each database commit of a chat turn", ("operation",))
+STAGE_TRANSITIONS = Counter(
+    "conversation_stage_transitions_total", "Conversation stage changes caused by a chat turn", ("from_stage", "to_stage")
+)
+WEBSOCKET_CONNECTIONS = Gauge("websocket_connections", "Open /ws/chat connections")
+WEBSOCKET_EVENTS = Counter("websocket_events_total", "Events received on /ws/chat", ("type",))
+WEBSOCKET_TURN_SECONDS = Histogram("websocket_turn_seconds", "Total time to answer one message received on /ws/chat")
+WEBSOCKET_REJECTED = Counter("websocket_rejected_total", "/ws/chat handshakes refused because the worker is at WEBSOCKET_MAX_CONNECTIONS")
+# Seconds between WebSocket pings, which keep idle connections open through proxies
+WEBSOCKET_PING_INTERVAL = int(os.environ.get("WEBSOCKET_PING_INTERVAL", "25"))
+# Open /ws/chat connections per worker. Under the threaded worker each one holds a
+# thread until the tab closes, so the default leaves 8 of WORKER_THREADS to the HTTP
+# API and /readyz; refused clients fall back to POST /api/chat. 0 = no limit (gevent)
+if os.environ.get("WORKER_CLASS", "gthread") == "gthread":
+    WEBSOCKET_MAX_CONNECTIONS = int(os.environ.get(
+        "WEBSOCKET_MAX_CONNECTIONS", max(int(os.environ.get("WORKER_THREADS", "32")) - 8, 1)
+    ))
+else:
+    WEBSOCKET_MAX_CONNECTIONS = int(os.environ.get("WEBSOCKET_MAX_CONNECTIONS", "0"))
+# Tries at creating the tables when several workers start on a fresh database
+CREATE_TABLES_ATTEMPTS = 5
 # Initialize global variables
 properties_df = None
 ai_agent = None
-
-# Create the Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///realestate_chat.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
+# Open /ws/chat connections in this worker, checked against WEBSOCKET_MAX_CONNECTIONS
+open_sockets = 0
+open_sockets_lock = threading.Lock()
+# Per-chat conversation state lives in the database so any worker can continue
+# a chat; the agent itself is shared, so turns are serialized
+session_store = None
+# Listings held by chats collecting contact details, shared through the database
+listing_holds = None
+agent_lock = threading.Lock()
+# Replays sampled turns on SHADOW_ENGINE when set (see shadow.py)
+shadow_runner = None
+# The tables are created on first use (or eagerly by the gunicorn master and the ASGI lifespan)
+tables_created = False
+tables_lock = threading.Lock()
+# The catalogue and agent are loaded on first use (or eagerly by the gunicorn master)
+data_loaded = False
+data_load_lock = threading.Lock()
+# Readiness checks reported by /readyz; all must pass before the worker takes traffic
+readiness = {
+    "catalogue_loaded": False,
+    "indexes_built": False,
+    "patterns_compiled": False,
+    "warmed_up": False,
 }
 
-# Initialize the database
-db.init_app(app)
-
 # Load property data function
 def load_data():
-    global properties_df, ai_agent
+    global properties_df, ai_agent, data_loaded, shadow_runner
     try:
-        properties_df = pd.read_csv("fake_real_estate_data_with_currency.csv")
-        # Initialize the AI agent
-        ai_agent = ArabicRealEstateAgent(properties_df, dialect="egyptian")
+        # pandas and the agent module are only imported once the catalogue is needed
+        with phase("import pandas"):
+            import pandas as pd
+        with phase("import agent"):
+            from Ai_agnet_realestate import ArabicRealEstateAgent
+            from catalogue import load_catalogue
+        with phase("load catalogue"):
+            properties_df = load_catalogue()
+        with phase("build agent"):
+            # Initialize the AI agent
+            ai_agent = ArabicRealEstateAgent(properties_df, dialect="egyptian")
+            ai_agent.listing_holds = listing_holds
+        session_store.bind_catalogue(ai_agent.catalogue_version, ai_agent.get_property)
+        shadow_runner = shadow.from_env(properties_df, ai_agent.get_property, ai_agent.catalogue_version)
+        if shadow_runner is not None:
+            # The shadow only matches the primary's sales pitches with the same seed
+            ai_agent.pitch_engine.seed = shadow_runner.pitch_seed
         logger.debug("Property data loaded successfully")
+        
+        readiness["catalogue_loaded"] = len(properties_df) > 0
+        readiness["indexes_built"] = len(ai_agent.property_index.sorted_ids) == len(properties_df)
+        readiness["patterns_compiled"] = len(ai_agent.regex) > 0
+        with phase("warm up"), agent_lock:
+            readiness["warmed_up"] = ai_agent.warm_up()
+        if not readiness["warmed_up"]:
+            logger.error("Agent warm-up conversation did not reach a recommendation")
     except Exception as e:
         logger.error(f"Error loading property data: {str(e)}")
-        properties_df = pd.DataFrame()
+        properties_df = None
         ai_agent = None
+    data_loaded = True
+    report_startup(logger)
+
+def get_agent():
+    """Return the shared agent, loading the catalogue on first use (None if loading failed)."""
+    if not data_loaded:
+        with data_load_lock:
+            if not data_loaded:
+                load_data()
+    return ai_agent
+
+def ensure_tables(flask_app=None):
+    """
+    Create any missing tables, once per process, before the first database
+    access: on the first request, or up front from the gunicorn master and
+    the ASGI lifespan. Importing the app does not touch the database.
+    
+    Args:
+        flask_app: App whose database to use; defaults to the module's app
+    """
+    global tables_created
+    if tables_created:
+        return
+    with tables_lock:
+        if tables_created:
+            return
+        with phase("create tables"), (flask_app or app).app_context():
+            # Workers that don't preload the app (uvicorn --workers) race to create
+            # the tables; each retry skips the ones another worker has created
+            for attempt in range(CREATE_TABLES_ATTEMPTS):
+                try:
+                    db.create_all()
+                    break
+                except DatabaseError:
+                    db.session.rollback()
+                    if attempt == CREATE_TABLES_ATTEMPTS - 1:
+                        raise
+                    time.sleep(0.1 * (attempt + 1))
+        tables_created = True
 
-# Import models after db initialization to avoid circular imports
-with app.app_context():
-    from models import Chat, Message
-    db.create_all()
-    # Load data during app initialization
-    load_data()
+def create_app() -> Flask:
+    """Create and configure the Flask app; the catalogue load is deferred to get_agent()."""
+    global session_store, listing_holds
+
+    with phase("create app"):
+        app = Flask(__name__)
+        app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key_for_development")
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+        # Configure the database
+        app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///realestate_chat.db")
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "pool_recycle": 300,
+            "pool_pre_ping": True,
+        }
+
+        # Initialize the database
+        db.init_app(app)
+
+        app.config["SOCK_SERVER_OPTIONS"] = {"ping_interval": WEBSOCKET_PING_INTERVAL}
+
+    # Import models after db initialization to avoid circular imports; the
+    # tables themselves are created by ensure_tables() before the first query
+    from models import ChatSession, ListingHold
+    session_store = DatabaseSessionStore(db, ChatSession)
+    listing_holds = holds.from_env(db, ListingHold)
+    app.before_request(ensure_tables)
+
+    # Sample this process for PROFILE_SECONDS when set
+    profiler.start_from_env()
+
+    # Load everything up front when explicitly requested
+    if os.environ.get("EAGER_LOAD", "0") == "1":
+        ensure_tables(app)
+        get_agent()
+    else:
+        report_startup(logger)
+
+    return app
+
+app = create_app()
+from models import Chat, Message
+
+def admin_required(view):
+    """Protect an admin endpoint with the ADMIN_TOKEN environment variable (X-Admin-Token header)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        admin_token = os.environ.get("ADMIN_TOKEN")
+        if not admin_token:
+            # Admin endpoints are disabled unless a token is configured
+            return jsonify({'status': 'error', 'message': 'Not found'}), 404
+        if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), admin_token):
+            return jsonify({'status': 'error', 'message': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return wrapper
 
 # Routes
 @app.route('/')
 def index():
-    return render_template('index.html')
+    with TEMPLATE_RENDER_SECONDS.timer('index.html'):
+        return render_template('index.html')
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # Liveness only: the process is up and serving requests
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    # The first probe triggers the deferred catalogue load and warm-up
+    get_agent()
+    ready = all(readiness.values())
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'checks': readiness
+    }), 200 if ready else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/admin/traces', methods=['GET'])
+@admin_required
+def get_traces():
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'status': 'success',
+        'traces': recent_traces(limit)
+    })
+
+@app.route('/admin/shadow', methods=['GET'])
+@admin_required
+def get_shadow():
+    # Shadow results are per worker: this reports on the worker serving the request
+    if shadow_runner is None:
+        return jsonify({'status': 'error', 'message': 'Shadow execution is not enabled'}), 404
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'status': 'success',
+        'shadow': shadow_runner.status(),
+        'diffs': shadow_runner.recent_diffs(limit)
+    })
+
+@app.route('/admin/sessions', methods=['GET'])
+@admin_required
+def get_sessions():
+    limit = request.args.get('limit', 10, type=int)
+    return jsonify({
+        'status': 'success',
+        'sessions': len(session_store),
+        'total_bytes': session_store.total_bytes(),
+        'byte_budget': SESSION_BYTE_BUDGET,
+        # Saves of this worker that went over the budget: a field growing without bound
+        'over_budget_saves': int(SESSIONS_OVER_BUDGET.value()),
+        'largest': [{'chat_id': chat_id, 'bytes': size} for chat_id, size in session_store.largest(limit)]
+    })
+
+@app.route('/admin/profile', methods=['POST'])
+@admin_required
+def start_profile():
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 30))
+        interval_ms = float(data.get('interval_ms', profiler.DEFAULT_INTERVAL_MS))
+    except (TypeError, ValueError, AttributeError):
+        # Missing, non-numeric, or a body that is not a JSON object
+        seconds = interval_ms = math.nan
+    if not (0 < seconds < math.inf and 0 < interval_ms < math.inf):
+        return jsonify({
+            'status': 'error',
+            'message': 'seconds and interval_ms must be positive numbers'
+        }), 400
+    session = profiler.start(seconds, interval_ms, os.environ.get("PROFILE_DIR"))
+    if session is None:
+        return jsonify({
+            'status': 'error',
+            'message': 'A profile is already running in this worker'
+        }), 409
+    return jsonify({
+        'status': 'success',
+        'profile': session.status()
+    })
+
+@app.route('/admin/profile', methods=['GET'])
+@admin_required
+def get_profile():
+    # Profiles are per worker: this reports on the worker serving the request
+    session = profiler.current()
+    if session is None:
+        return jsonify({'status': 'error', 'message': 'No profile has been taken in this worker'}), 404
+    if request.args.get('format') == 'collapsed':
+        return session.collapsed(), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    return jsonify({
+        'status': 'success',
+        'profile': session.status()
+    })
+
+@app.route('/admin/profile', methods=['DELETE'])
+@admin_required
+def stop_profile():
+    profiler.stop()
+    return jsonify({'status': 'success'})
 
 @app.route('/api/chat', methods=['POST'])
+@CHAT_TURN_SECONDS.time()
 def chat():
+    with start_trace("POST /api/chat"):
+        return _handle_chat()
+
+def _handle_chat():
     data = request.json
     user_message = data.get('message', '')
-    chat_id = data.get('chat_id')
+    chat_id = _start_turn(user_message, data.get('chat_id'))
     
+    try:
+        ai_msg = _agent_reply(chat_id, user_message)
+        return jsonify({
+            'status': 'success',
+            'message': ai_msg.content,
+            'chat_id': chat_id
+        })
+    except Exception as e:
+        logger.error(f"Error processing message: {str(e)}")
+        return jsonify({
+            'status': 'error',
+            'message': 'عذراً، حدث خطأ في معالجة طلبك. يرجى المحاولة مرة أخرى.',
+            'chat_id': chat_id
+        })
+
+def _start_turn(user_message, chat_id=None):
+    """Store a user message, creating the chat first if needed; returns the chat id."""
     if not chat_id:
         # Create a new chat if not provided
         new_chat = Chat(title="Real Estate Chat")
         db.session.add(new_chat)
-        db.session.commit()
+        with DB_COMMIT_SECONDS.timer('create_chat'), span("db.commit", operation="create_chat"):
+            db.session.commit()
         chat_id = new_chat.id
     
     # Save user message to database
@@ -79,33 +371,68 @@ def chat():
         is_user=True
     )
     db.session.add(user_msg)
-    db.session.commit()
+    with DB_COMMIT_SECONDS.timer('user_message'), span("db.commit", operation="user_message"):
+        db.session.commit()
+    return chat_id
+
+def _agent_reply(chat_id, user_message):
+    """Answer a user message with this chat's session and store the reply; returns the reply Message."""
+    ai_agent = get_agent()
     
+    # Process the message through the AI agent with this chat's session
+    with span("agent.lock_wait"):
+        agent_lock.acquire()
+    shadow_turn = None
     try:
-        # Process the message through the AI agent
+        if listing_holds is not None:
+            # Pick up holds placed by other workers every LISTING_HOLD_REFRESH_SECONDS;
+            # under the lock, so the reload cannot drop a hold another turn is placing
+            listing_holds.refresh_if_due()
+        with span("session.load", chat_id=chat_id):
+            ai_agent.session_state = session_store.load(chat_id)
+        shadowed = shadow_runner is not None and shadow_runner.sampled()
+        if shadowed:
+            state_before = ai_agent.session_state.to_bytes(ai_agent.catalogue_version)
+            held_before = listing_holds.held_ids(chat_id) if listing_holds is not None else frozenset()
+            turn_started = time.perf_counter()
+        stage_before = ai_agent.session_state["conversation_stage"]
+        ai_agent.current_chat_id = chat_id
         ai_response = ai_agent.process_input(user_message)
-        
-        # Save AI response to database
-        ai_msg = Message(
-            chat_id=chat_id,
-            content=ai_response,
-            is_user=False
-        )
-        db.session.add(ai_msg)
+        stage_after = ai_agent.session_state["conversation_stage"]
+        if listing_holds is not None:
+            # Hold the listing while this chat is reserving it; committed right away
+            listing_holds.update(chat_id, ai_agent.session_state)
+        if shadowed:
+            shadow_turn = shadow.ShadowTurn(
+                chat_id, user_message, ai_agent.current_dialect, state_before, ai_response,
+                ai_agent.session_state.to_bytes(ai_agent.catalogue_version), time.perf_counter() - turn_started,
+                held_before
+            )
+        with span("session.save", chat_id=chat_id):
+            session_store.save(chat_id, ai_agent.session_state)
+    finally:
+        agent_lock.release()
+    
+    if shadow_turn is not None:
+        # Never waits: the turn is dropped if the shadow is behind
+        shadow_runner.submit(shadow_turn)
+    
+    if stage_after != stage_before:
+        STAGE_TRANSITIONS.inc(stage_before, stage_after)
+    
+    # Delete idle sessions every SESSION_SWEEP_INTERVAL; committed with the reply
+    session_store.sweep_if_due()
+    
+    # Save AI response to database
+    ai_msg = Message(
+        chat_id=chat_id,
+        content=ai_response,
+        is_user=False
+    )
+    db.session.add(ai_msg)
+    with DB_COMMIT_SECONDS.timer('ai_message'), span("db.commit", operation="ai_message"):
         db.session.commit()
-        
-        return jsonify({
-            'status': 'success',
-            'message': ai_response,
-            'chat_id': chat_id
-        })
-    except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
-        return jsonify({
-            'status': 'error',
-            'message': 'عذراً، حدث خطأ في معالجة طلبك. يرجى المحاولة مرة أخرى.',
-            'chat_id': chat_id
-        })
+    return ai_msg
 
 @app.route('/api/chats', methods=['GET'])
 def get_chats():
@@ -128,13 +455,30 @@ def get_messages(chat_id):
         ]
     })
 
+def _set_dialect(ai_agent, dialect, chat_id=None):
+    """
+    Pin a dialect for chat_id, overriding the detected one, or switch the
+    agent's default dialect when no chat is given.
+    """
+    if not chat_id:
+        with agent_lock:
+            return ai_agent.set_dialect(dialect)
+    if dialect in ai_agent.phrases:
+        session = session_store.load(chat_id)
+        session.dialect = dialect
+        session_store.save(chat_id, session)
+        with DB_COMMIT_SECONDS.timer('dialect'), span("db.commit", operation="dialect"):
+            db.session.commit()
+    return ai_agent.dialect_confirmation(dialect)
+
 @app.route('/api/dialect', methods=['POST'])
 def change_dialect():
     data = request.json
     dialect = data.get('dialect', 'egyptian')
     
+    ai_agent = get_agent()
     if ai_agent:
-        confirmation = ai_agent.set_dialect(dialect)
+        confirmation = _set_dialect(ai_agent, dialect, data.get('chat_id'))
         return jsonify({
             'status': 'success',
             'message': confirmation
@@ -147,6 +491,7 @@ def change_dialect():
 
 @app.route('/api/initial-message', methods=['GET'])
 def get_initial_message():
+    ai_agent = get_agent()
     if ai_agent:
         greeting = ai_agent.get_greeting()
         return jsonify({
@@ -161,6 +506,7 @@ def get_initial_message():
 
 @app.route('/api/dialects', methods=['GET'])
 def get_available_dialects():
+    ai_agent = get_agent()
     if ai_agent:
         dialects = ai_agent.get_available_dialects()
         return jsonify({
@@ -173,5 +519,125 @@ def get_available_dialects():
             'message': 'AI agent not initialized'
         })
 
+def _send(ws, event_type, **fields):
+    ws.send(json.dumps({'type': event_type, **fields}, ensure_ascii=False))
+
+def _message_event(msg):
+    return {'id': msg.id, 'content': msg.content, 'is_user': msg.is_user}
+
+def serve_chat_socket(ws):
+    """
+    Serve one /ws/chat connection. Events are JSON objects with a "type":
+    
+        hello    {chat_id, last_message_id}: start a chat, or resume one and
+                 receive the messages after last_message_id
+        message  {message}: a user message, answered with typing events and
+                 a message event
+        dialect  {dialect}: switch dialect for this chat, like POST /api/dialect
+        ping     answered with pong
+    
+    The database session is released after every event, so an idle
+    connection holds only its socket (and, under the threaded worker, its
+    thread; see WEBSOCKET_MAX_CONNECTIONS).
+    """
+    WEBSOCKET_CONNECTIONS.inc()
+    chat_id = None
+    try:
+        while True:
+            try:
+                event = json.loads(ws.receive())
+                event_type = event.get('type')
+            except (TypeError, ValueError, AttributeError):
+                _send(ws, 'error', message='Invalid event')
+                continue
+            WEBSOCKET_EVENTS.inc(event_type if event_type in ('hello', 'message', 'dialect', 'ping') else 'unknown')
+            
+            try:
+                if event_type == 'hello':
+                    chat_id = event.get('chat_id') or None
+                    if chat_id is None:
+                        ai_agent = get_agent()
+                        _send(ws, 'ready', chat_id=None, messages=[])
+                        if ai_agent:
+                            _send(ws, 'message', message=ai_agent.get_greeting(), chat_id=None, message_id=None)
+                    else:
+                        # Resume: replay whatever the client missed while disconnected
+                        missed = Message.query.filter(
+                            Message.chat_id == chat_id, Message.id > int(event.get('last_message_id') or 0)
+                        ).order_by(Message.id).all()
+                        _send(ws, 'ready', chat_id=chat_id, messages=[_message_event(msg) for msg in missed])
+                
+                elif event_type == 'message':
+                    user_message = str(event.get('message', '')).strip()
+                    if not user_message:
+                        _send(ws, 'error', message='Empty message')
+                        continue
+                    with WEBSOCKET_TURN_SECONDS.timer(), start_trace("WS /ws/chat message"):
+                        chat_id = _start_turn(user_message, chat_id)
+                        _send(ws, 'typing', state=True, chat_id=chat_id)
+                        try:
+                            ai_msg = _agent_reply(chat_id, user_message)
+                        except Exception as e:
+                            logger.error(f"Error processing message: {str(e)}")
+                            _send(ws, 'error', chat_id=chat_id,
+                                  message='عذراً، حدث خطأ في معالجة طلبك. يرجى المحاولة مرة أخرى.')
+                        else:
+                            _send(ws, 'message', message=ai_msg.content, chat_id=chat_id, message_id=ai_msg.id)
+                        finally:
+                            _send(ws, 'typing', state=False, chat_id=chat_id)
+                
+                elif event_type == 'dialect':
+                    ai_agent = get_agent()
+                    if ai_agent:
+                        confirmation = _set_dialect(ai_agent, event.get('dialect', 'egyptian'), chat_id)
+                        _send(ws, 'dialect', message=confirmation)
+                    else:
+                        _send(ws, 'error', message='AI agent not initialized')
+                
+                elif event_type == 'ping':
+                    _send(ws, 'pong')
+                
+                else:
+                    _send(ws, 'error', message=f'Unknown event type: {event_type}')
+            finally:
+                db.session.remove()
+    except ConnectionClosed:
+        pass
+    finally:
+        WEBSOCKET_CONNECTIONS.dec()
+
+def reserve_socket():
+    """
+    Take one of this worker's WEBSOCKET_MAX_CONNECTIONS slots before the /ws/chat
+    handshake, so idle tabs cannot take every thread from the HTTP API. Once they
+    are all taken the handshake is refused; the client sees the socket fail to
+    open and stays on POST /api/chat.
+    """
+    global open_sockets
+    if request.path != '/ws/chat':
+        return None
+    with open_sockets_lock:
+        if WEBSOCKET_MAX_CONNECTIONS and open_sockets >= WEBSOCKET_MAX_CONNECTIONS:
+            WEBSOCKET_REJECTED.inc()
+            return jsonify({'status': 'error', 'message': 'Too many open chat sockets'}), 503
+        open_sockets += 1
+    g.socket_reserved = True
+    return None
+
+def release_socket(exc=None):
+    """Give back the slot taken by reserve_socket() once the connection is over."""
+    global open_sockets
+    if g.pop('socket_reserved', False):
+        with open_sockets_lock:
+            open_sockets -= 1
+
+if Sock is not None:
+    sock = Sock(app)
+    app.before_request(reserve_socket)
+    app.teardown_request(release_socket)
+    sock.route('/ws/chat')(serve_chat_socket)
+else:
+    logger.info("flask-sock is not installed; /ws/chat is disabled")
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,300 @@
+# ASGI deployment mode: the chat API served from an event loop, e.g.
+#
+#     uvicorn asgi_app:app --host 0.0.0.0 --port 5000 --workers 2
+#
+# The chat endpoints use an async database driver (asyncpg or aiosqlite), so a
+# request waiting on the database holds no thread. Agent turns are CPU-bound and
+# run in a small thread pool behind a bounded queue; each turn reads and writes
+# its chat's session there, under the agent lock. Every other route, including
+# the chat page, is passed through to the Flask app.
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Mount, Route
+
+# The Flask app owns the schema, the shared agent and the metrics registry
+from app import (
+    CHAT_TURN_SECONDS, DB_COMMIT_SECONDS, STAGE_TRANSITIONS,
+    agent_lock, db, ensure_tables, get_agent, listing_holds, readiness, session_store,
+)
+from app import app as flask_app
+from metrics import Counter, Gauge, render_metrics
+from models import Chat, Message
+from tracing import propagate, span, start_trace
+
+logger = logging.getLogger(__name__)
+
+# Threads running agent turns. The agent is shared and its turns serialized,
+# so more than one thread only overlaps session decoding with a turn
+AGENT_THREADS = int(os.environ.get("ASGI_AGENT_THREADS", "2"))
+# Turns waiting for or running on the agent before new ones are rejected
+MAX_PENDING_TURNS = int(os.environ.get("ASGI_MAX_PENDING_TURNS", "64"))
+
+PENDING_TURNS = Gauge("asgi_pending_agent_turns", "Agent turns queued or running in the ASGI executor")
+REJECTED_TURNS = Counter("asgi_rejected_agent_turns_total", "Agent turns rejected because the executor queue was full")
+
+ERROR_REPLY = 'عذراً، حدث خطأ في معالجة طلبك. يرجى المحاولة مرة أخرى.'
+BUSY_REPLY = 'عذراً، الخدمة مشغولة حالياً. يرجى المحاولة مرة أخرى بعد قليل.'
+
+# Async drivers for the synchronous database URLs the Flask app accepts
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+executor = ThreadPoolExecutor(max_workers=AGENT_THREADS, thread_name_prefix="agent")
+_turn_slots = asyncio.Semaphore(MAX_PENDING_TURNS)
+engine = None
+Session = None
+
+
+class QueueFull(Exception):
+    """Raised when MAX_PENDING_TURNS agent turns are already in flight."""
+
+
+def async_database_url(url):
+    """
+    The async-driver equivalent of a database URL.
+
+    Args:
+        url: SQLAlchemy URL (or string) of the Flask app's database
+
+    Returns:
+        The same database with an asyncpg or aiosqlite driver
+    """
+    url = make_url(url)
+    drivername = _ASYNC_DRIVERS.get(url.drivername, url.drivername)
+    url = url.set(drivername=drivername)
+    if drivername == "postgresql+asyncpg" and "sslmode" in url.query:
+        # asyncpg spells libpq's sslmode as ssl
+        sslmode = url.query["sslmode"]
+        url = url.difference_update_query(["sslmode"]).update_query_dict({"ssl": sslmode})
+    return url
+
+
+async def run_agent(func, *args):
+    """
+    Run CPU-bound agent work in the executor without blocking the event loop.
+
+    Raises:
+        QueueFull: If MAX_PENDING_TURNS calls are already queued or running
+    """
+    if _turn_slots.locked():
+        REJECTED_TURNS.inc()
+        raise QueueFull()
+    async with _turn_slots:
+        PENDING_TURNS.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, propagate(partial(func, *args)))
+        finally:
+            PENDING_TURNS.dec()
+
+
+def _agent_turn(chat_id, user_message):
+    """
+    Answer one message with a chat's session, on an executor thread.
+
+    The session is loaded, saved and committed under the agent lock, so two
+    messages on the same chat never start from the same state.
+
+    Returns:
+        Tuple of (reply, stage before, stage after)
+    """
+    ai_agent = get_agent()
+    # The session store and the holds go through the Flask app's (synchronous) engine
+    with flask_app.app_context():
+        with span("agent.lock_wait"):
+            agent_lock.acquire()
+        try:
+            with span("session.load", chat_id=chat_id):
+                ai_agent.session_state = session_store.load(chat_id)
+            if listing_holds is not None:
+                listing_holds.refresh_if_due()
+            stage_before = ai_agent.session_state["conversation_stage"]
+            ai_agent.current_chat_id = chat_id
+            ai_response = ai_agent.process_input(user_message)
+            stage_after = ai_agent.session_state["conversation_stage"]
+            if listing_holds is not None:
+                listing_holds.update(chat_id, ai_agent.session_state)
+            with span("session.save", chat_id=chat_id):
+                session_store.save(chat_id, ai_agent.session_state)
+            with DB_COMMIT_SECONDS.timer('session'), span("db.commit", operation="session"):
+                db.session.commit()
+        finally:
+            agent_lock.release()
+
+        # Delete idle sessions every SESSION_SWEEP_INTERVAL, as the Flask chat route does
+        if session_store.sweep_if_due():
+            db.session.commit()
+    return ai_response, stage_before, stage_after
+
+
+def _set_dialect(dialect):
+    ai_agent = get_agent()
+    if ai_agent is None:
+        return None
+    with agent_lock:
+        return ai_agent.set_dialect(dialect)
+
+
+def _pin_dialect(chat_id, dialect):
+    """Pin a chat's dialect, overriding the detected one; under the agent lock, like a turn."""
+    with flask_app.app_context(), agent_lock:
+        session = session_store.load(chat_id)
+        session.dialect = dialect
+        session_store.save(chat_id, session)
+        with DB_COMMIT_SECONDS.timer('dialect'), span("db.commit", operation="dialect"):
+            db.session.commit()
+
+
+async def chat(request: Request):
+    with CHAT_TURN_SECONDS.timer(), start_trace("POST /api/chat (asgi)"):
+        data = await request.json()
+        user_message = data.get('message', '')
+        chat_id = data.get('chat_id')
+
+        async with Session() as session:
+            if not chat_id:
+                # Create a new chat if not provided
+                new_chat = Chat(title="Real Estate Chat")
+                session.add(new_chat)
+                with DB_COMMIT_SECONDS.timer('create_chat'), span("db.commit", operation="create_chat"):
+                    await session.commit()
+                chat_id = new_chat.id
+
+            session.add(Message(chat_id=chat_id, content=user_message, is_user=True))
+            with DB_COMMIT_SECONDS.timer('user_message'), span("db.commit", operation="user_message"):
+                await session.commit()
+
+            try:
+                ai_response, stage_before, stage_after = await run_agent(_agent_turn, chat_id, user_message)
+            except QueueFull:
+                return JSONResponse({'status': 'error', 'message': BUSY_REPLY, 'chat_id': chat_id}, status_code=503)
+            except Exception as e:
+                logger.error(f"Error processing message: {str(e)}")
+                return JSONResponse({'status': 'error', 'message': ERROR_REPLY, 'chat_id': chat_id})
+
+            if stage_after != stage_before:
+                STAGE_TRANSITIONS.inc(stage_before, stage_after)
+
+            session.add(Message(chat_id=chat_id, content=ai_response, is_user=False))
+            with DB_COMMIT_SECONDS.timer('ai_message'), span("db.commit", operation="ai_message"):
+                await session.commit()
+
+        return JSONResponse({'status': 'success', 'message': ai_response, 'chat_id': chat_id})
+
+
+async def get_chats(request: Request):
+    async with Session() as session:
+        chats = (await session.execute(select(Chat.id, Chat.title))).all()
+    return JSONResponse({
+        'chats': [{'id': chat_id, 'title': title} for chat_id, title in chats]
+    })
+
+
+async def get_messages(request: Request):
+    chat_id = request.path_params['chat_id']
+    async with Session() as session:
+        messages = (await session.execute(
+            select(Message).where(Message.chat_id == chat_id).order_by(Message.created_at)
+        )).scalars().all()
+    return JSONResponse({
+        'messages': [
+            {
+                'id': msg.id,
+                'content': msg.content,
+                'is_user': msg.is_user,
+                'timestamp': msg.created_at.isoformat()
+            } for msg in messages
+        ]
+    })
+
+
+async def change_dialect(request: Request):
+    data = await request.json()
+    dialect = data.get('dialect', 'egyptian')
+    chat_id = data.get('chat_id')
+    if chat_id:
+        # Pinning a chat's dialect leaves the agent's default alone
+        ai_agent = get_agent()
+        if ai_agent is None:
+            return JSONResponse({'status': 'error', 'message': 'AI agent not initialized'})
+        if dialect in ai_agent.phrases:
+            try:
+                await run_agent(_pin_dialect, chat_id, dialect)
+            except QueueFull:
+                return JSONResponse({'status': 'error', 'message': BUSY_REPLY}, status_code=503)
+        return JSONResponse({'status': 'success', 'message': ai_agent.dialect_confirmation(dialect)})
+    try:
+        confirmation = await run_agent(_set_dialect, dialect)
+    except QueueFull:
+        return JSONResponse({'status': 'error', 'message': BUSY_REPLY}, status_code=503)
+    if confirmation is None:
+        return JSONResponse({'status': 'error', 'message': 'AI agent not initialized'})
+    return JSONResponse({'status': 'success', 'message': confirmation})
+
+
+async def healthz(request: Request):
+    return JSONResponse({'status': 'ok'})
+
+
+async def readyz(request: Request):
+    ready = all(readiness.values())
+    return JSONResponse({
+        'status': 'ready' if ready else 'not_ready',
+        'checks': readiness
+    }, status_code=200 if ready else 503)
+
+
+async def metrics(request: Request):
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global engine, Session
+    with flask_app.app_context():
+        # Flask-SQLAlchemy has already resolved relative SQLite paths
+        url = async_database_url(db.engine.url)
+    engine = create_async_engine(url, pool_recycle=300, pool_pre_ping=True)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    # Create the tables, load the catalogue and warm the agent before taking traffic
+    await asyncio.get_running_loop().run_in_executor(executor, ensure_tables)
+    await asyncio.get_running_loop().run_in_executor(executor, get_agent)
+    logger.info(f"ASGI app ready: {AGENT_THREADS} agent threads, {MAX_PENDING_TURNS} pending turns")
+    try:
+        yield
+    finally:
+        executor.shutdown(wait=True)
+        await engine.dispose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/chat', chat, methods=['POST']),
+        Route('/api/chats', get_chats, methods=['GET']),
+        Route('/api/messages/{chat_id:int}', get_messages, methods=['GET']),
+        Route('/api/dialect', change_dialect, methods=['POST']),
+        Route('/healthz', healthz, methods=['GET']),
+        Route('/readyz', readyz, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        # The page, the remaining API and the admin endpoints run on the Flask app
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,239 @@
+import zlib
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from currency import RateTable
+from session_state import PROPERTY_TYPES
+
+CATALOGUE_PATH = "fake_real_estate_data_with_currency.csv"
+
+# Text columns with few distinct values are stored as categoricals: one small
+# int code array per column instead of a Python str object per row. This keeps
+# the catalogue in a handful of NumPy buffers that forked workers can share
+# copy-on-write without touching refcounts.
+CATEGORICAL_COLUMNS = (
+    "type", "location", "neighborhood", "description", "currency",
+    "services", "compound", "finishing", "finishing_type"
+)
+INTEGER_COLUMNS = ("id", "bedrooms", "bathrooms", "area_m2")
+# Catalogue property types, in session_state.PROPERTY_TYPES order
+TYPE_VALUES = ("Apartment", "Villa", "Office", "Land")
+# Listing price converted to the base currency, added at load time
+BASE_PRICE_COLUMN = "price_base"
+
+# Services, compound and finishing packed into one uint16 per listing, added at load time:
+#
+#   bits 0-3  services, one bit each, in session_state.SERVICES order
+#   bit  4    in a compound
+#   bits 5-6  finishing code, as in session_state.FINISHINGS (0 = unknown)
+#   bits 7-8  finishing type code, as in session_state.FINISHING_TYPES (0 = unknown)
+#
+# Codes match the session preference codes, so a request is compared with every
+# listing by one vectorized AND.
+ATTRIBUTES_COLUMN = "attributes"
+SERVICE_VALUES = ("security", "garage", "club", "mall")
+COMPOUND_BIT = 1 << 4
+FINISHING_SHIFT = 5
+FINISHING_TYPE_SHIFT = 7
+FIELD_MASK = 0b11
+FINISHING_VALUES = ("finished", "semi-finished")
+FINISHING_TYPE_VALUES = ("super lux", "ultra lux", "standard")
+
+# Derived columns, recomputed at load and left out of the catalogue version
+DERIVED_COLUMNS = (BASE_PRICE_COLUMN, ATTRIBUTES_COLUMN)
+
+# Relative tolerances the recommendation search tries in turn around the preferred area
+AREA_TOLERANCES = (0.2, 0.4)
+# Budget multipliers the recommendation search tries in turn before falling back to the cheapest listings
+BUDGET_BUFFERS = (1.2, 1.5)
+
+
+def type_values(property_type: str) -> Tuple[str, ...]:
+    """Type column values matching a preferred type: its catalogue name and the Arabic label itself."""
+    if property_type in PROPERTY_TYPES:
+        return (TYPE_VALUES[PROPERTY_TYPES.index(property_type)], property_type)
+    return (property_type,)
+
+
+def load_catalogue(path: str = CATALOGUE_PATH, rates: Optional[RateTable] = None) -> pd.DataFrame:
+    """
+    Load the property listings in a compact columnar layout.
+
+    Args:
+        path: CSV file with the property listings
+        rates: Exchange rates for the base-currency price column (default: the bundled table)
+
+    Returns:
+        DataFrame with categorical text columns, downcast integer columns and
+        a price_base column
+    """
+    return with_base_prices(compact_catalogue(pd.read_csv(path)), rates or RateTable.load())
+
+
+def _codes(column: pd.Series, values) -> np.ndarray:
+    """1-based position of each value in values, 0 for missing or unknown ones."""
+    lookup = {value: code for code, value in enumerate(values, start=1)}
+    return column.astype(object).map(lookup).fillna(0).to_numpy(dtype=np.uint16)
+
+
+def pack_attributes(properties_df: pd.DataFrame) -> np.ndarray:
+    """
+    Pack each listing's services, compound and finishing into bit-flags.
+
+    Listings without these columns (older catalogues) get no flags.
+    """
+    flags = np.zeros(len(properties_df), dtype=np.uint16)
+    if "services" in properties_df.columns:
+        services = properties_df["services"].astype(object).fillna("").astype(str)
+        for bit, service in enumerate(SERVICE_VALUES):
+            flags[services.str.split("|").map(lambda names: service in names).to_numpy(dtype=bool)] |= 1 << bit
+    if "compound" in properties_df.columns:
+        flags[(properties_df["compound"].astype(object) == "yes").to_numpy(dtype=bool)] |= COMPOUND_BIT
+    if "finishing" in properties_df.columns:
+        flags |= _codes(properties_df["finishing"], FINISHING_VALUES) << FINISHING_SHIFT
+    if "finishing_type" in properties_df.columns:
+        flags |= _codes(properties_df["finishing_type"], FINISHING_TYPE_VALUES) << FINISHING_TYPE_SHIFT
+    return flags
+
+
+def with_base_prices(properties_df: pd.DataFrame, rates: RateTable) -> pd.DataFrame:
+    """Return a copy of the listings with prices converted to the base currency."""
+    properties_df = properties_df.copy()
+    properties_df[BASE_PRICE_COLUMN] = rates.base_prices(properties_df)
+    return properties_df
+
+
+def compact_catalogue(properties_df: pd.DataFrame) -> pd.DataFrame:
+    """Convert a listings DataFrame to the compact layout used by load_catalogue(), with packed attribute flags."""
+    properties_df = properties_df.copy()
+    properties_df[ATTRIBUTES_COLUMN] = pack_attributes(properties_df)
+    for column in CATEGORICAL_COLUMNS:
+        if column in properties_df.columns:
+            properties_df[column] = properties_df[column].astype("category")
+    for column in INTEGER_COLUMNS:
+        if column in properties_df.columns and pd.api.types.is_integer_dtype(properties_df[column]):
+            properties_df[column] = pd.to_numeric(properties_df[column], downcast="integer")
+    return properties_df
+
+
+def catalogue_version(properties_df: pd.DataFrame) -> int:
+    """Checksum of the catalogue contents, used to tag serialized sessions."""
+    if properties_df.empty:
+        return 0
+    # Derived columns change with the rate table or flag layout, not with the listings
+    properties_df = properties_df.drop(columns=list(DERIVED_COLUMNS), errors="ignore")
+    row_hashes = pd.util.hash_pandas_object(properties_df.astype(object), index=False).values
+    return zlib.crc32(row_hashes.tobytes())
+
+
+class PropertyIndex:
+    """Maps property ids to row positions using sorted NumPy arrays."""
+
+    def __init__(self, properties_df: pd.DataFrame):
+        if "id" in properties_df.columns:
+            ids = properties_df["id"].to_numpy(dtype=np.int64)
+        else:
+            ids = np.empty(0, dtype=np.int64)
+        self.positions = np.argsort(ids, kind="stable")
+        self.sorted_ids = ids[self.positions]
+
+    def position_of(self, property_id: int) -> Optional[int]:
+        """
+        Find the row position of a property.
+
+        Args:
+            property_id: The property id
+
+        Returns:
+            Row position in the catalogue, or None if the id is unknown
+        """
+        slot = int(np.searchsorted(self.sorted_ids, property_id))
+        if slot < len(self.sorted_ids) and self.sorted_ids[slot] == property_id:
+            return int(self.positions[slot])
+        return None
+
+
+class SortedColumn:
+    """
+    A numeric column presorted once, so range queries are two binary searches.
+
+    Values are kept in ascending order next to the catalogue row position of
+    each value; missing values sort last and never fall inside a range.
+    """
+
+    def __init__(self, values: np.ndarray, positions: np.ndarray):
+        self.values = values
+        self.positions = positions
+
+    @classmethod
+    def from_values(cls, values: np.ndarray) -> "SortedColumn":
+        """Sort a column given in catalogue row order."""
+        values = np.asarray(values, dtype=np.float64)
+        positions = np.argsort(values, kind="stable")
+        return cls(values[positions], positions)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def subset(self, row_mask: np.ndarray) -> "SortedColumn":
+        """
+        Restrict to some catalogue rows without sorting again.
+
+        Args:
+            row_mask: Boolean array over catalogue row positions
+
+        Returns:
+            A SortedColumn over the selected rows, still in ascending order
+        """
+        keep = row_mask[self.positions]
+        return SortedColumn(self.values[keep], self.positions[keep])
+
+    def between(self, low: Optional[float] = None, high: Optional[float] = None) -> np.ndarray:
+        """
+        Find the rows whose value lies in [low, high].
+
+        Args:
+            low: Lower bound, or None for no lower bound
+            high: Upper bound, or None for no upper bound
+
+        Returns:
+            Catalogue row positions, in ascending value order
+        """
+        start = 0 if low is None else int(np.searchsorted(self.values, low, side="left"))
+        if high is None:
+            stop = int(np.searchsorted(self.values, np.inf, side="right"))
+        else:
+            stop = int(np.searchsorted(self.values, high, side="right"))
+        return self.positions[start:max(start, stop)]
+
+
+class ColumnRanges:
+    """
+    Presorted price and area columns of the catalogue.
+
+    Prices are taken from price_base when present, so ranges compare amounts
+    in the base currency whatever each listing is priced in.
+    """
+
+    def __init__(self, properties_df: pd.DataFrame):
+        self.size = len(properties_df)
+        self.columns: Dict[str, SortedColumn] = {}
+        price_column = BASE_PRICE_COLUMN if BASE_PRICE_COLUMN in properties_df.columns else "price"
+        if price_column in properties_df.columns:
+            self.columns["price"] = SortedColumn.from_values(properties_df[price_column].to_numpy(dtype=np.float64))
+        if "area_m2" in properties_df.columns:
+            self.columns["area_m2"] = SortedColumn.from_values(properties_df["area_m2"].to_numpy(dtype=np.float64))
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    def __getitem__(self, column: str) -> SortedColumn:
+        return self.columns[column]
+
+    def row_mask(self, positions: np.ndarray) -> np.ndarray:
+        """Boolean array over catalogue rows, set at the given positions."""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[positions] = True
+        return mask
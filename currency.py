@@ -0,0 +1,106 @@
+import csv
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+RATES_PATH = "currency_rates.csv"
+
+# Prices are compared in this currency; the rate table gives units of it per unit of each currency
+BASE_CURRENCY = "EGP"
+
+# Currency words recognised in user messages
+CURRENCY_WORDS = {
+    "جنيه": "EGP",
+    "دولار": "USD",
+    "يورو": "EUR",
+    "ريال": "SAR",
+    "درهم": "AED",
+    "دينار": "KWD",
+}
+
+# Arabic names used when echoing amounts back to the user
+CURRENCY_NAMES = {
+    "EGP": "جنيه",
+    "USD": "دولار",
+    "EUR": "يورو",
+    "SAR": "ريال",
+    "AED": "درهم",
+    "KWD": "دينار",
+    "QAR": "ريال قطري",
+}
+
+# Currency assumed for a budget quoted without one
+DIALECT_CURRENCIES = {
+    "egyptian": "EGP",
+    "khaleeji": "SAR",
+    "msa": "EGP",
+}
+
+
+class RateTable:
+    """Exchange rates to the base currency, loaded from a local file."""
+
+    def __init__(self, rates: Dict[str, float], base: str = BASE_CURRENCY):
+        self.base = base
+        self.rates = dict(rates)
+        self.rates[base] = 1.0
+
+    @classmethod
+    def load(cls, path: str = RATES_PATH) -> "RateTable":
+        """
+        Read the rate table.
+
+        Args:
+            path: CSV file with currency and egp_per_unit columns
+
+        Returns:
+            The rate table (only the base currency if the file cannot be read)
+        """
+        rates = {}
+        try:
+            with open(path, encoding="utf-8") as rates_file:
+                for row in csv.DictReader(rates_file):
+                    rates[row["currency"].strip().upper()] = float(row["egp_per_unit"])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[ERROR] Could not load currency rates {path}: {str(e)}")
+        return cls(rates)
+
+    def __contains__(self, currency: str) -> bool:
+        return currency in self.rates
+
+    def to_base(self, amount: float, currency: Optional[str]) -> float:
+        """Convert an amount to the base currency; unknown currencies are taken as base."""
+        return amount * self.rates.get(currency, 1.0)
+
+    def from_base(self, amount: float, currency: Optional[str]) -> float:
+        """Convert an amount in the base currency to another currency."""
+        return amount / self.rates.get(currency, 1.0)
+
+    def base_prices(self, properties_df: pd.DataFrame) -> np.ndarray:
+        """
+        Convert every listing price to the base currency in one vectorized pass.
+
+        Listings without a currency column, or with an unknown currency, are
+        taken to be priced in the base currency.
+        """
+        prices = properties_df["price"].to_numpy(dtype=np.float64)
+        if "currency" not in properties_df.columns:
+            return prices
+        rates = properties_df["currency"].map(self.rates).astype(np.float64).fillna(1.0)
+        return prices * rates.to_numpy()
+
+
+def currency_from_word(word: Optional[str]) -> Optional[str]:
+    """The currency code for a currency word in a message, if it names one."""
+    if not word:
+        return None
+    for currency_word, currency in CURRENCY_WORDS.items():
+        if currency_word in word:
+            return currency
+    return None
+
+
+def currency_name(currency: Optional[str]) -> str:
+    """Arabic name of a currency, falling back to its code."""
+    return CURRENCY_NAMES.get(currency, currency or "")
@@ -0,0 +1,116 @@
+import math
+import os
+import re
+from collections import Counter as TallyCounter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from text_index import normalize
+
+# Pick each chat's dialect from its messages; DIALECT_DETECTION=0 keeps the
+# dialect chosen through /api/dialect for every chat
+ENABLED = os.environ.get("DIALECT_DETECTION", "1") == "1"
+# Score lead (in nats) the best dialect needs over the runner-up before a chat is switched to it
+MIN_MARGIN = float(os.environ.get("DIALECT_MIN_MARGIN", "2.0"))
+
+# Words that give a dialect away, in normalized spelling
+MARKER_WORDS = {
+    "egyptian": (
+        "عايز", "عاوز", "عايزه", "عاوزه", "ازاي", "دلوقتي", "كده", "مش", "ايه", "فين",
+        "امتي", "بتاع", "بتاعه", "اوي", "عشان", "علشان", "بكام", "لسه", "ده", "دي", "حاجه",
+        "ايوه", "اه", "خالص", "بتاعتي", "هشتري", "هاخد", "معلش",
+    ),
+    "khaleeji": (
+        "ابي", "ابغي", "ابغا", "ابا", "وش", "شلون", "شلونك", "زين", "حيل", "وايد", "الحين", "ليش",
+        "مب", "هاذي", "يبي", "عطني", "شي", "جذي", "مشكور", "هلا", "ياخوي", "اشوف", "تراني",
+        "ودي", "يمديك", "شوي",
+    ),
+    "msa": (
+        "اريد", "اود", "هل", "ماذا", "لماذا", "كيف", "الذي", "التي", "سوف", "لدي", "لست",
+        "هذا", "هذه", "متي", "اين", "يمكنني", "ارغب", "اسمح", "لكن", "ليس", "جدا", "شكرا",
+    ),
+}
+# Weight of one marker word, in nats
+MARKER_WEIGHT = 2.5
+# Character n-grams learned from the agent's phrases in each dialect
+NGRAM_SIZE = 3
+# N-grams are weaker evidence than markers; their log-likelihoods are scaled by this
+NGRAM_WEIGHT = 0.3
+
+_WORD = re.compile(r"\w+")
+
+
+def _ngrams(text: str) -> Iterable[str]:
+    for word in _WORD.findall(text):
+        padded = f" {word} "
+        for start in range(len(padded) - NGRAM_SIZE + 1):
+            yield padded[start:start + NGRAM_SIZE]
+
+
+class DialectClassifier:
+    """
+    Naive-Bayes style scorer over marker words and character n-grams.
+
+    Every feature maps to one precomputed score per dialect, centred so that
+    features equally likely in all dialects score zero and are left out. A
+    message is scored by summing the vectors of the features it contains: a
+    few dozen dict lookups.
+    """
+
+    def __init__(self, corpora: Dict[str, Iterable[str]], markers: Dict[str, Iterable[str]] = MARKER_WORDS):
+        """
+        Args:
+            corpora: Dialect -> texts written in it (e.g. the agent's phrases)
+            markers: Dialect -> words that give it away; other dialects are ignored
+        """
+        self.dialects: Tuple[str, ...] = tuple(corpora)
+        counts = [TallyCounter(_ngrams(normalize(" ".join(texts)))) for texts in corpora.values()]
+        vocabulary = set().union(*counts) if counts else set()
+        totals = [sum(count.values()) + len(vocabulary) for count in counts]
+
+        self.ngram_scores: Dict[str, Tuple[float, ...]] = {}
+        for ngram in vocabulary:
+            # Laplace-smoothed log-probabilities, minus their mean across dialects
+            logs = [math.log((count[ngram] + 1) / total) for count, total in zip(counts, totals)]
+            mean = sum(logs) / len(logs)
+            scores = tuple(NGRAM_WEIGHT * (value - mean) for value in logs)
+            if max(abs(score) for score in scores) > 0.05:
+                self.ngram_scores[ngram] = scores
+
+        self.marker_scores: Dict[str, Tuple[float, ...]] = {}
+        for dialect, words in markers.items():
+            if dialect not in self.dialects:
+                continue
+            index = self.dialects.index(dialect)
+            for word in words:
+                scores = list(self.marker_scores.get(normalize(word), (0.0,) * len(self.dialects)))
+                scores[index] += MARKER_WEIGHT
+                self.marker_scores[normalize(word)] = tuple(scores)
+
+    def scores(self, text: str) -> List[float]:
+        """Score of each dialect (in self.dialects order) for a message."""
+        text = normalize(text)
+        totals = [0.0] * len(self.dialects)
+        for word in _WORD.findall(text):
+            marker = self.marker_scores.get(word)
+            if marker is not None:
+                totals = [total + score for total, score in zip(totals, marker)]
+        for ngram in _ngrams(text):
+            scores = self.ngram_scores.get(ngram)
+            if scores is not None:
+                totals = [total + score for total, score in zip(totals, scores)]
+        return totals
+
+    def classify(self, text: str, min_margin: float = MIN_MARGIN) -> Tuple[Optional[str], float]:
+        """
+        Most likely dialect of a message.
+
+        Returns:
+            Tuple of (dialect, lead over the runner-up); the dialect is None
+            when the lead is below min_margin
+        """
+        if len(self.dialects) < 2:
+            return (self.dialects[0] if self.dialects else None), 0.0
+        scores = self.scores(text)
+        ranked = sorted(range(len(scores)), key=scores.__getitem__, reverse=True)
+        margin = scores[ranked[0]] - scores[ranked[1]]
+        return (self.dialects[ranked[0]] if margin >= min_margin else None), margin
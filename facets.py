@@ -0,0 +1,156 @@
+import math
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalogue import (
+    AREA_TOLERANCES, ATTRIBUTES_COLUMN, BASE_PRICE_COLUMN, BUDGET_BUFFERS, COMPOUND_BIT, FIELD_MASK,
+    FINISHING_SHIFT, FINISHING_TYPE_SHIFT, SERVICE_VALUES, TYPE_VALUES
+)
+from session_state import PROPERTY_TYPES
+
+# Ask the clarifying question that best splits the remaining listings;
+# ADAPTIVE_QUESTIONS=0 keeps the fixed question order
+ADAPTIVE = os.environ.get("ADAPTIVE_QUESTIONS", "1") == "1"
+# Stop asking and summarize once at most this many listings remain
+SUMMARIZE_AT = int(os.environ.get("SUMMARIZE_AT_CANDIDATES", "5"))
+# Area and budget answers are modelled as this many equal-count price / area bands
+RANGE_BANDS = 5
+
+SERVICES_MASK = (1 << len(SERVICE_VALUES)) - 1
+
+
+def to_bitmap(mask: np.ndarray) -> int:
+    """Pack a boolean row mask into an int with bit i set for row i."""
+    return int.from_bytes(np.packbits(np.asarray(mask, dtype=bool), bitorder="little").tobytes(), "little")
+
+
+def _value_bitmaps(column: pd.Series) -> Dict[Any, int]:
+    """One bitmap per distinct value of a column."""
+    codes, uniques = pd.factorize(column.astype(object), sort=True)
+    return {value: to_bitmap(codes == code) for code, value in enumerate(uniques)}
+
+
+class FacetIndex:
+    """
+    Row bitmaps of the catalogue for each answer to the clarifying questions.
+
+    A bitmap is an int with bit i set for catalogue row i, so narrowing a
+    candidate set is an AND and counting it is int.bit_count(). Each question
+    is modelled as its possible answers, each a pair of bitmaps: the rows for
+    which it is the right answer, and the rows still matching once it is
+    given. Questions the catalogue has no column for (purpose, floor) have no
+    answers and never split anything.
+    """
+
+    def __init__(self, properties_df: pd.DataFrame):
+        self.size = len(properties_df)
+        self.all_rows = (1 << self.size) - 1
+        # Exact-value bitmaps, used to narrow candidates by an answered question
+        self.values: Dict[str, Dict[Any, int]] = {}
+        # Question -> [(rows the answer fits, rows left after the answer)]
+        self.answers: Dict[str, List[Tuple[int, int]]] = {}
+
+        for column in ("location", "bedrooms", "bathrooms"):
+            if column in properties_df.columns:
+                self.values[column] = _value_bitmaps(properties_df[column])
+                self.answers[column] = [(rows, rows) for rows in self.values[column].values()]
+
+        if "type" in properties_df.columns:
+            # Catalogue names and Arabic labels of the same type are one answer
+            names = dict(zip(TYPE_VALUES, PROPERTY_TYPES))
+            types = properties_df["type"].astype(object).map(lambda value: names.get(value, value))
+            self.values["type"] = _value_bitmaps(types)
+            self.answers["type"] = [(rows, rows) for rows in self.values["type"].values()]
+
+        if ATTRIBUTES_COLUMN in properties_df.columns:
+            self.flags = properties_df[ATTRIBUTES_COLUMN].to_numpy()
+            self._attribute_answers()
+        else:
+            self.flags = np.zeros(self.size, dtype=np.uint16)
+
+        if "area_m2" in properties_df.columns:
+            self.areas = properties_df["area_m2"].to_numpy(dtype=np.float64)
+            self.answers["area_m2"] = []
+            for band in self._bands(self.areas):
+                rows = to_bitmap(band)
+                # Listings near the band's median area, and the band itself when it is wider
+                near = self.area_rows(float(np.median(self.areas[band])), AREA_TOLERANCES[0])
+                self.answers["area_m2"].append((rows, rows | near))
+        if BASE_PRICE_COLUMN in properties_df.columns:
+            self.prices = properties_df[BASE_PRICE_COLUMN].to_numpy(dtype=np.float64)
+            self.answers["budget"] = [
+                (to_bitmap(band), self.budget_rows(float(self.prices[band].max()), BUDGET_BUFFERS[0]))
+                for band in self._bands(self.prices)
+            ]
+
+    def _attribute_answers(self) -> None:
+        flags = self.flags
+        compound = to_bitmap(flags & COMPOUND_BIT)
+        # "No" means a compound doesn't matter, so it leaves every row
+        self.answers["compound"] = [(compound, compound), (self.all_rows & ~compound, self.all_rows)]
+
+        for question, shift, filtering in (("finishing", FINISHING_SHIFT, (1, 2)),
+                                           ("finishing_type", FINISHING_TYPE_SHIFT, (1, 2))):
+            codes = (flags >> shift) & FIELD_MASK
+            answers = []
+            for code in np.unique(codes):
+                rows = to_bitmap(codes == code)
+                # Unknown codes, and the "standard" finishing type, don't filter
+                answers.append((rows, rows if int(code) in filtering else self.all_rows))
+            self.answers[question] = answers
+
+        services = flags & SERVICES_MASK
+        answers = []
+        for combination in np.unique(services):
+            # Asking for services keeps every listing that has at least those
+            answers.append((to_bitmap(services == combination),
+                            to_bitmap((services & combination) == combination)))
+        self.answers["services"] = answers
+
+    @staticmethod
+    def _bands(values: np.ndarray) -> List[np.ndarray]:
+        """Boolean masks splitting the rows into up to RANGE_BANDS equal-count bands."""
+        if len(values) == 0:
+            return []
+        edges = np.quantile(values, np.linspace(0, 1, RANGE_BANDS + 1)[1:-1])
+        band = np.searchsorted(edges, values, side="right")
+        return [band == index for index in np.unique(band)]
+
+    def area_rows(self, area: float, tolerance: float) -> int:
+        """Rows within a relative tolerance of an area."""
+        return to_bitmap((self.areas >= area * (1 - tolerance)) & (self.areas <= area * (1 + tolerance)))
+
+    def budget_rows(self, budget: float, buffer: float) -> int:
+        """Rows priced (in the base currency) within a budget times a buffer."""
+        return to_bitmap(self.prices <= budget * buffer)
+
+    def attribute_rows(self, mask: int, value: int) -> int:
+        """Rows whose packed attributes satisfy flags & mask == value."""
+        return to_bitmap((self.flags & mask) == value)
+
+    def information_gain(self, question: str, rows: int) -> float:
+        """
+        Expected reduction, in bits, of log2 of the candidate count once a
+        question is answered, taking each candidate as equally likely to be
+        the listing the user is after.
+
+        Args:
+            question: Entry of the agent's question flow
+            rows: Bitmap of the current candidates
+
+        Returns:
+            0.0 for questions that cannot narrow the candidates
+        """
+        total = rows.bit_count()
+        answers = self.answers.get(question)
+        if total <= 1 or not answers:
+            return 0.0
+        expected = 0.0
+        for fits, left in answers:
+            weight = (rows & fits).bit_count()
+            if weight:
+                expected += weight * math.log2((rows & left).bit_count())
+        return math.log2(total) - expected / total
@@ -0,0 +1,191 @@
+import os
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from text_index import normalize
+
+# Match misspelled keywords and place names; FUZZY_MATCHING=0 keeps exact matching only
+ENABLED = os.environ.get("FUZZY_MATCHING", "1") == "1"
+# Most edits tolerated in a long term; shorter ones tolerate fewer (see allowed_distance)
+MAX_DISTANCE = int(os.environ.get("FUZZY_MAX_DISTANCE", "2"))
+# Longer windows of the message are not looked up
+MAX_TERM_LENGTH = 40
+
+_WORD = re.compile(r"\w+")
+# Conjunction glued to the next word ("وامن"), tried off when a word matches nothing
+_CONJUNCTION = "و"
+
+
+class FuzzyMatch(NamedTuple):
+    term: str  # Normalized dictionary term
+    values: Tuple[Any, ...]  # Every value added for the term; empty for ordinary words
+    distance: int
+
+
+def allowed_distance(term: str) -> int:
+    """Edits tolerated for a dictionary term: none up to 3 letters, one up to 7, then MAX_DISTANCE."""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 7:
+        return min(1, MAX_DISTANCE)
+    return MAX_DISTANCE
+
+
+def _deletes(term: str, depth: int) -> Set[str]:
+    """The term and every string left after deleting up to depth characters from it."""
+    deletes = {term}
+    frontier = {term}
+    for _ in range(depth):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        deletes |= frontier
+    return deletes
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Damerau-Levenshtein (optimal string alignment) distance between two strings.
+
+    Returns:
+        The distance, or limit + 1 if it exceeds limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+class FuzzyIndex:
+    """
+    Symmetric-delete (SymSpell) dictionary for typo-tolerant lookups.
+
+    Every term is stored under each string left after deleting up to its
+    allowed number of characters. A query generates its own deletes and only
+    the terms sharing one of them are compared with it, so a lookup costs a
+    few dozen dict probes whatever the dictionary size. Terms added without
+    a value are ordinary words: a query closer to one of them than to any
+    keyword matches nothing.
+    """
+
+    def __init__(self):
+        self.terms: Dict[str, Tuple[Any, ...]] = {}
+        self.deletes: Dict[str, List[str]] = {}
+        self.max_words = 1
+
+    def add(self, term: str, value: Any = None) -> None:
+        """
+        Add a word or phrase.
+
+        Args:
+            term: Keyword, phrase or place name, in any spelling variant
+            value: Returned when the term matches; None for ordinary words.
+                A term added with several values returns all of them.
+        """
+        term = " ".join(_WORD.findall(normalize(term)))
+        if not term:
+            return
+        if term in self.terms:
+            if value is not None and value not in self.terms[term]:
+                self.terms[term] += (value,)
+            return
+        self.terms[term] = () if value is None else (value,)
+        self.max_words = max(self.max_words, term.count(" ") + 1)
+        for deleted in _deletes(term, allowed_distance(term)):
+            self.deletes.setdefault(deleted, []).append(term)
+
+    def add_words(self, text: str) -> None:
+        """Add every word of a text as an ordinary word."""
+        for word in _WORD.findall(normalize(text)):
+            self.add(word)
+
+    def lookup(self, query: str) -> Optional[FuzzyMatch]:
+        """
+        Closest term to a normalized query within its allowed distance.
+
+        Returns:
+            The match, or None if nothing is close enough or the closest
+            terms disagree on their values
+        """
+        if query in self.terms:
+            return FuzzyMatch(query, self.terms[query], 0)
+        if len(query) > MAX_TERM_LENGTH or query.replace(" ", "").isdigit():
+            return None
+
+        best: Optional[FuzzyMatch] = None
+        ambiguous = False
+        seen = set()
+        for deleted in _deletes(query, MAX_DISTANCE):
+            for term in self.deletes.get(deleted, ()):
+                if term in seen:
+                    continue
+                seen.add(term)
+                limit = allowed_distance(term)
+                if best is not None:
+                    limit = min(limit, best.distance)
+                distance = edit_distance(query, term, limit)
+                if distance > limit:
+                    continue
+                if best is None or distance < best.distance:
+                    best, ambiguous = FuzzyMatch(term, self.terms[term], distance), False
+                elif self.terms[term] != best.values:
+                    ambiguous = True
+        return None if ambiguous else best
+
+    def find(self, text: str) -> List[FuzzyMatch]:
+        """
+        Match a message against the dictionary, longest phrases first.
+
+        Each window of up to max_words consecutive words is looked up, single
+        words also without a leading "و"; words covered by a match are not
+        looked up again. Matches of ordinary words are left out.
+
+        Returns:
+            Matches in message order
+        """
+        words = _WORD.findall(normalize(text))
+        matched: Dict[int, FuzzyMatch] = {}
+        covered = [False] * len(words)
+        for size in range(min(self.max_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                if any(covered[start:start + size]):
+                    continue
+                window = " ".join(words[start:start + size])
+                match = self.lookup(window)
+                if match is None and size == 1 and window.startswith(_CONJUNCTION) and len(window) > 3:
+                    match = self.lookup(window[len(_CONJUNCTION):])
+                if match is not None:
+                    covered[start:start + size] = [True] * size
+                    if match.values:
+                        matched[start] = match
+        return [matched[start] for start in sorted(matched)]
+
+
+def build(tables: Dict[str, Dict[str, Iterable[str]]], vocabulary: Iterable[str] = ()) -> FuzzyIndex:
+    """
+    Index keyword tables for fuzzy lookups.
+
+    Args:
+        tables: Table name -> {label: spellings}; a match's value is (table, label)
+        vocabulary: Texts whose words are known not to be keywords
+
+    Returns:
+        The index
+    """
+    index = FuzzyIndex()
+    for table, labels in tables.items():
+        for label, spellings in labels.items():
+            for spelling in spellings:
+                index.add(spelling, (table, label))
+    for text in vocabulary:
+        index.add_words(text)
+    return index
@@ -0,0 +1,169 @@
+import csv
+import heapq
+import math
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+GAZETTEER_PATH = "locations_geo.csv"
+
+# Search radii (km) tried in order when looking for listings near a place
+SEARCH_RADII_KM = (5, 15, 40, 100, 250, 600)
+
+# Kilometres per degree; longitudes are scaled by cos(latitude) around a
+# central meridian crossing Egypt, which keeps distortion small at this scale
+_KM_PER_DEGREE_LAT = 110.57
+_KM_PER_DEGREE_LON = 111.32
+_CENTRAL_MERIDIAN = 30.0
+
+
+class Place(NamedTuple):
+    name: str
+    kind: str
+    lat: float
+    lon: float
+
+
+class NearbyPlace(NamedTuple):
+    place: Place
+    distance_km: float
+
+
+def _project(lat: float, lon: float) -> Tuple[float, float]:
+    x = (lon - _CENTRAL_MERIDIAN) * _KM_PER_DEGREE_LON * math.cos(math.radians(lat))
+    y = lat * _KM_PER_DEGREE_LAT
+    return x, y
+
+
+class KDTree:
+    """Static 2-d tree over projected (x, y) kilometre coordinates."""
+
+    def __init__(self, points: List[Tuple[float, float]]):
+        self.points = points
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indices: List[int], depth: int):
+        if not indices:
+            return None
+        axis = depth % 2
+        indices.sort(key=lambda i: self.points[i][axis])
+        middle = len(indices) // 2
+        return (
+            indices[middle], axis,
+            self._build(indices[:middle], depth + 1),
+            self._build(indices[middle + 1:], depth + 1),
+        )
+
+    def nearest(self, point: Tuple[float, float], k: int) -> List[Tuple[float, int]]:
+        """The k closest points as (distance, index), closest first."""
+        heap: List[Tuple[float, int]] = []  # max-heap via negated distances
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            distance = math.dist(point, self.points[index])
+            if len(heap) < k:
+                heapq.heappush(heap, (-distance, index))
+            elif distance < -heap[0][0]:
+                heapq.heapreplace(heap, (-distance, index))
+            delta = point[axis] - self.points[index][axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            visit(near)
+            if len(heap) < k or abs(delta) < -heap[0][0]:
+                visit(far)
+
+        visit(self.root)
+        return sorted((-negated, index) for negated, index in heap)
+
+    def within(self, point: Tuple[float, float], radius: float) -> List[Tuple[float, int]]:
+        """All points within radius as (distance, index), closest first."""
+        found: List[Tuple[float, int]] = []
+
+        def visit(node):
+            if node is None:
+                return
+            index, axis, left, right = node
+            distance = math.dist(point, self.points[index])
+            if distance <= radius:
+                found.append((distance, index))
+            delta = point[axis] - self.points[index][axis]
+            if delta - radius <= 0:
+                visit(left)
+            if delta + radius >= 0:
+                visit(right)
+
+        visit(self.root)
+        return sorted(found)
+
+
+class LocationIndex:
+    """
+    Gazetteer lookups plus a spatial index over the places that have listings.
+
+    Any gazetteer name or alias can be used as a query; only catalogue
+    locations and neighborhoods are indexed as results.
+    """
+
+    def __init__(self, places: Iterable[Tuple[Place, List[str]]], indexed_names: Iterable[str]):
+        self.places: Dict[str, Place] = {}
+        self._lookup: Dict[str, Place] = {}
+        for place, aliases in places:
+            self.places[place.name] = place
+            for alias in [place.name] + aliases:
+                self._lookup[alias.strip().lower()] = place
+
+        self.indexed = [self.places[name] for name in dict.fromkeys(indexed_names) if name in self.places]
+        self.tree = KDTree([_project(place.lat, place.lon) for place in self.indexed])
+
+    @classmethod
+    def load(cls, indexed_names: Iterable[str], path: str = GAZETTEER_PATH) -> "LocationIndex":
+        """
+        Build the index from the bundled gazetteer CSV.
+
+        Args:
+            indexed_names: Catalogue locations and neighborhoods to index
+            path: Gazetteer file
+
+        Returns:
+            The index (empty if the gazetteer cannot be read)
+        """
+        places = []
+        try:
+            with open(path, encoding="utf-8") as gazetteer:
+                for row in csv.DictReader(gazetteer):
+                    place = Place(row["name"], row["kind"], float(row["lat"]), float(row["lon"]))
+                    aliases = [alias for alias in row["aliases"].split("|") if alias]
+                    places.append((place, aliases))
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[ERROR] Could not load gazetteer {path}: {str(e)}")
+        return cls(places, indexed_names)
+
+    def resolve(self, name: str) -> Optional[Place]:
+        """Find a place by name or alias, case-insensitively."""
+        if not isinstance(name, str):
+            return None
+        return self._lookup.get(name.strip().lower())
+
+    def names(self) -> Iterator[Tuple[str, Place]]:
+        """Every (lowercased) name and alias resolve() accepts, with its place."""
+        return iter(self._lookup.items())
+
+    def nearest(self, name: str, k: int = 3) -> List[NearbyPlace]:
+        """The k indexed places closest to a named place."""
+        origin = self.resolve(name)
+        if origin is None or not self.indexed:
+            return []
+        point = _project(origin.lat, origin.lon)
+        return [NearbyPlace(self.indexed[index], distance) for distance, index in self.tree.nearest(point, k)]
+
+    def widening(self, name: str, radii: Tuple[float, ...] = SEARCH_RADII_KM) -> Iterator[List[NearbyPlace]]:
+        """
+        Yield the indexed places around a named place for each radius in turn.
+
+        Each batch holds every place within the radius, closest first.
+        """
+        origin = self.resolve(name)
+        if origin is None or not self.indexed:
+            return
+        point = _project(origin.lat, origin.lon)
+        for radius in radii:
+            yield [NearbyPlace(self.indexed[index], distance) for distance, index in self.tree.within(point, radius)]
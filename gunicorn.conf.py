@@ -0,0 +1,51 @@
+import gc
+import os
+import time
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+reuse_port = True
+
+# /ws/chat connections stay open for the life of a chat. The threaded worker
+# serves each from a thread of its pool, and the app refuses sockets past
+# WEBSOCKET_MAX_CONNECTIONS (WORKER_THREADS - 8) to keep threads for the HTTP
+# API and /readyz; with gevent installed, set WORKER_CLASS=gevent to hold
+# thousands of idle connections per worker
+worker_class = os.environ.get("WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WORKER_THREADS", "32"))
+
+# Import the app once in the master so the catalogue and agent are built a
+# single time and shared copy-on-write by every forked worker
+preload_app = True
+
+
+def when_ready(server):
+    from app import ensure_tables, get_agent
+
+    # The app defers creating the tables and loading the catalogue to first
+    # use; do both here, before forking
+    ensure_tables()
+    get_agent()
+
+    # Park everything loaded by the master in the permanent generation so
+    # collections in the workers don't write to (and un-share) those pages
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    worker.fork_started = time.perf_counter()
+
+
+def post_fork(server, worker):
+    import profiler
+    from app import app, db
+
+    # Pooled connections opened in the master must not be used by the children
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    # PROFILE_SECONDS profiles each worker from boot
+    profiler.start_from_env()
+
+    elapsed_ms = (time.perf_counter() - worker.fork_started) * 1000
+    server.log.info("Worker %s ready in %.1f ms", worker.pid, elapsed_ms)
@@ -0,0 +1,244 @@
+import math
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
+
+from sqlalchemy import or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from metrics import Counter, Gauge
+
+# Hold the listing a chat is reserving so other chats are not offered it;
+# LISTING_HOLDS=0 turns holds off
+ENABLED = os.environ.get("LISTING_HOLDS", "1") == "1"
+# Seconds a hold lasts after the holding chat's last turn
+HOLD_TTL_SECONDS = int(os.environ.get("LISTING_HOLD_TTL_SECONDS", "1800"))
+# Seconds between reloads of the holds placed by other workers
+HOLD_REFRESH_SECONDS = float(os.environ.get("LISTING_HOLD_REFRESH_SECONDS", "5"))
+# Conversation stages in which a chat holds its current property
+HOLD_STAGES = ("contact_collection", "closing")
+# Holds are spread over this many independently locked dicts
+STRIPES = 16
+
+# INSERT ... ON CONFLICT constructs of the databases the app runs on
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+LISTING_HOLDS = Gauge("listing_holds", "Listings held by some chat at the last change or refresh")
+LISTING_HOLD_EVENTS = Counter(
+    "listing_hold_events_total", "Listing hold changes by outcome (placed, released, expired, conflict)", ("outcome",)
+)
+
+
+class Hold(NamedTuple):
+    chat_id: int
+    expires_at: float  # time.time() at which the hold lapses
+
+
+class HoldTable:
+    """
+    In-memory listing holds keyed by property id.
+
+    Holds are spread over STRIPES dicts by property id, each with its own
+    lock, so writers on different listings never wait on each other. Readers
+    take no lock: a dict lookup is atomic, and an expired hold reads as no
+    hold. The held ids are also kept as a frozenset that is replaced on every
+    change, so the recommender excludes them with a set lookup per listing.
+    """
+
+    def __init__(self, ttl: float = HOLD_TTL_SECONDS):
+        self.ttl = ttl
+        self._stripes: List[Dict[int, Hold]] = [{} for _ in range(STRIPES)]
+        self._locks = [threading.Lock() for _ in range(STRIPES)]
+        self._owned: Dict[int, int] = {}  # Chat id -> property id it holds
+        self._held: FrozenSet[int] = frozenset()
+        self._next_expiry = math.inf
+        self._last_refresh = -math.inf
+
+    def get(self, property_id: int) -> Optional[Hold]:
+        """The live hold on a listing, if any."""
+        hold = self._stripes[property_id % STRIPES].get(property_id)
+        return hold if hold is not None and hold.expires_at > time.time() else None
+
+    def is_held(self, property_id: int, chat_id: Optional[int] = None) -> bool:
+        """Whether a listing is held by a chat other than chat_id."""
+        hold = self.get(property_id)
+        return hold is not None and hold.chat_id != chat_id
+
+    def held_ids(self, chat_id: Optional[int] = None) -> FrozenSet[int]:
+        """Ids of the listings held by chats other than chat_id."""
+        if time.time() >= self._next_expiry:
+            self._rebuild()
+        held = self._held
+        own = self._owned.get(chat_id)
+        return held - {own} if own in held else held
+
+    def hold(self, property_id: int, chat_id: int) -> bool:
+        """
+        Hold a listing for a chat for ttl seconds, or renew the chat's hold.
+        A chat holds one listing at a time, so its previous hold is released.
+
+        Returns:
+            False if another chat holds the listing
+        """
+        previous = self._owned.get(chat_id)
+        if previous is not None and previous != property_id:
+            self.release(chat_id)
+        stripe = property_id % STRIPES
+        with self._locks[stripe]:
+            current = self.get(property_id)
+            taken = current is not None and current.chat_id != chat_id
+            if not taken:
+                hold = Hold(chat_id, time.time() + self.ttl)
+                taken = not self._claim(property_id, hold)
+                if not taken:
+                    self._stripes[stripe][property_id] = hold
+                    self._owned[chat_id] = property_id
+        if taken:
+            LISTING_HOLD_EVENTS.inc("conflict")
+        elif current is None:
+            LISTING_HOLD_EVENTS.inc("placed")
+        else:
+            # A renewal leaves the held ids as they are; the snapshot stays valid
+            return True
+        self._rebuild()
+        return not taken
+
+    def release(self, chat_id: int) -> None:
+        """Release the hold of a chat, if it has one."""
+        property_id = self._owned.pop(chat_id, None)
+        if property_id is None:
+            return
+        stripe = property_id % STRIPES
+        with self._locks[stripe]:
+            hold = self._stripes[stripe].get(property_id)
+            if hold is not None and hold.chat_id == chat_id:
+                del self._stripes[stripe][property_id]
+                self._unclaim(property_id, chat_id)
+                LISTING_HOLD_EVENTS.inc("released")
+        self._rebuild()
+
+    def update(self, chat_id: int, state) -> None:
+        """Hold the current property of a chat in one of HOLD_STAGES, release its hold otherwise."""
+        current_property = state["current_property"]
+        if state["conversation_stage"] in HOLD_STAGES and current_property and "id" in current_property:
+            property_id = int(current_property["id"])
+            if not self.hold(property_id, chat_id):
+                print(f"[WARNING] Chat {chat_id} reached {state['conversation_stage']} "
+                      f"for property {property_id}, which another chat holds")
+        else:
+            self.release(chat_id)
+
+    def _rebuild(self) -> None:
+        """Drop expired holds and replace the held-id snapshot."""
+        now = time.time()
+        held = []
+        next_expiry = math.inf
+        for stripe, holds in enumerate(self._stripes):
+            with self._locks[stripe]:
+                for property_id, hold in list(holds.items()):
+                    if hold.expires_at <= now:
+                        del holds[property_id]
+                        if self._owned.get(hold.chat_id) == property_id:
+                            del self._owned[hold.chat_id]
+                        LISTING_HOLD_EVENTS.inc("expired")
+                    else:
+                        held.append(property_id)
+                        next_expiry = min(next_expiry, hold.expires_at)
+        self._held = frozenset(held)
+        self._next_expiry = next_expiry
+        LISTING_HOLDS.set(len(held))
+
+    def _replace(self, holds: Dict[int, Hold]) -> None:
+        """Replace every hold, e.g. with the ones read back from the database."""
+        stripes: List[Dict[int, Hold]] = [{} for _ in range(STRIPES)]
+        for property_id, hold in holds.items():
+            stripes[property_id % STRIPES][property_id] = hold
+        for stripe, lock in enumerate(self._locks):
+            with lock:
+                self._stripes[stripe] = stripes[stripe]
+        self._owned = {hold.chat_id: property_id for property_id, hold in holds.items()}
+        self._rebuild()
+
+    def _claim(self, property_id: int, hold: Hold) -> bool:
+        # Storage hook, called under the stripe lock; False if the listing is taken elsewhere
+        return True
+
+    def _unclaim(self, property_id: int, chat_id: int) -> None:
+        # Storage hook, called under the stripe lock
+        pass
+
+    def refresh(self) -> None:
+        """Reload holds placed by other workers; nothing to do in memory."""
+        self._last_refresh = time.monotonic()
+
+    def refresh_if_due(self) -> None:
+        """Refresh when HOLD_REFRESH_SECONDS have passed since the last refresh; cheap otherwise."""
+        if time.monotonic() - self._last_refresh >= HOLD_REFRESH_SECONDS:
+            self.refresh()
+
+
+class DatabaseHoldTable(HoldTable):
+    """
+    Listing holds mirrored to a table, so every worker sees them.
+
+    The table is the arbiter: a hold is placed by one upsert that only takes
+    the row when it is free, expired or already the chat's, so two chats can
+    never both hold a listing. Hold changes are committed on their own
+    connection right away, never with the caller's transaction, so a conflict
+    cannot fail the caller's commit. Each worker reloads the table every
+    HOLD_REFRESH_SECONDS, so it excludes listings held elsewhere within that
+    delay. Call refresh() under the same lock as hold() and update(): a reload
+    replaces every hold, including one placed while it ran.
+    """
+
+    def __init__(self, db, model, ttl: float = HOLD_TTL_SECONDS):
+        super().__init__(ttl)
+        self.db = db
+        self.model = model
+        self.table = model.__table__
+
+    def _claim(self, property_id: int, hold: Hold) -> bool:
+        table = self.table
+        insert = _INSERTS[self.db.engine.dialect.name](table).values(
+            property_id=property_id, chat_id=hold.chat_id, expires_at=hold.expires_at
+        )
+        upsert = insert.on_conflict_do_update(
+            index_elements=[table.c.property_id],
+            set_={"chat_id": insert.excluded.chat_id, "expires_at": insert.excluded.expires_at},
+            where=or_(table.c.chat_id == hold.chat_id, table.c.expires_at <= time.time()),
+        )
+        with self.db.engine.begin() as connection:
+            if connection.execute(upsert).rowcount:
+                return True
+            row = connection.execute(
+                select(table.c.chat_id, table.c.expires_at).where(table.c.property_id == property_id)
+            ).one_or_none()
+        if row is not None:
+            # Held through another worker since the last refresh
+            self._stripes[property_id % STRIPES][property_id] = Hold(row.chat_id, row.expires_at)
+        return False
+
+    def _unclaim(self, property_id: int, chat_id: int) -> None:
+        with self.db.engine.begin() as connection:
+            connection.execute(
+                self.table.delete().where(self.table.c.property_id == property_id, self.table.c.chat_id == chat_id)
+            )
+
+    def refresh(self) -> None:
+        super().refresh()
+        now = time.time()
+        table = self.table
+        with self.db.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.expires_at <= now))
+            rows = connection.execute(
+                select(table.c.property_id, table.c.chat_id, table.c.expires_at).where(table.c.expires_at > now)
+            ).all()
+        self._replace({row.property_id: Hold(row.chat_id, row.expires_at) for row in rows})
+
+
+def from_env(db, model) -> Optional[HoldTable]:
+    """A database-backed hold table, or None when LISTING_HOLDS=0."""
+    if not ENABLED:
+        return None
+    return DatabaseHoldTable(db, model)
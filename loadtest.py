@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+
+class Dialogue(NamedTuple):
+    name: str
+    turns: Tuple[str, ...]
+
+
+# Multi-turn conversations replayed by each simulated user. Like the example
+# dialogue in attached_assets, each one narrows down a search, picks one of the
+# suggestions, hesitates about it and is persuaded before leaving contact details
+DIALOGUES = (
+    Dialogue("egyptian_buy_apartment", (
+        "مرحبا", "القاهرة", "للشراء", "شقة", "نعم", "150", "متشطب", "سوبر",
+        "الأول", "مش متأكد من المنطقة دي", "ايوة", "التاني", "عايز اشتري الشقة دي",
+        "اسمي احمد", "01012345678", "شكرا",
+    )),
+    Dialogue("khaleeji_rent_villa", (
+        "السلام عليكم", "الاسكندرية", "للإيجار", "فيلا", "لا", "300", "متشطب", "لوكس",
+        "الثاني", "غالية شوي", "والخدمات؟", "اتفقنا خلاص", "اسمي خالد", "0501234567", "مشكور",
+    )),
+    Dialogue("msa_buy_office", (
+        "أهلا", "الجيزة", "للشراء", "مكتب", "نعم", "120", "نص تشطيب", "عادي",
+        "الأول", "لست متأكداً من الموقع", "حدثني أكثر", "أريد شراء هذا المكتب", "اسمي سارة",
+        "01198765432", "شكرا جزيلا",
+    )),
+)
+
+# Endpoints are reported by route, not by concrete URL
+CHAT = "POST /api/chat"
+INITIAL_MESSAGE = "GET /api/initial-message"
+MESSAGES = "GET /api/messages/<id>"
+
+REQUEST_TIMEOUT = 30.0
+PERCENTILES = (50, 90, 99)
+
+
+class EndpointStats:
+    """Latencies and error count of one endpoint."""
+
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies_ms.append(elapsed_ms)
+            if not ok:
+                self.errors += 1
+
+    def summary(self, seconds: float) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies_ms)
+            errors = self.errors
+        count = len(latencies)
+        summary = {
+            "requests": count,
+            "errors": errors,
+            "error_rate": errors / count if count else 0.0,
+            "throughput_rps": count / seconds if seconds > 0 else 0.0,
+            "max_ms": latencies[-1] if latencies else 0.0,
+        }
+        for percentile in PERCENTILES:
+            # Nearest-rank percentile
+            rank = max(0, -(-percentile * count // 100) - 1)
+            summary[f"p{percentile}_ms"] = latencies[rank] if latencies else 0.0
+        return summary
+
+
+class LoadStage:
+    """Results of running simulated users at one arrival rate."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.endpoints: Dict[str, EndpointStats] = {
+            endpoint: EndpointStats() for endpoint in (INITIAL_MESSAGE, CHAT, MESSAGES)
+        }
+        self.started_users = 0
+        self.completed_users = 0
+        self.rejected_users = 0
+        self.active_users = 0
+        self.peak_users = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def user_started(self) -> None:
+        with self._lock:
+            self.started_users += 1
+            self.active_users += 1
+            self.peak_users = max(self.peak_users, self.active_users)
+
+    def user_finished(self, completed: bool) -> None:
+        with self._lock:
+            self.active_users -= 1
+            if completed:
+                self.completed_users += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "arrival_rate": self.rate,
+            "seconds": self.seconds,
+            "users_started": self.started_users,
+            "users_completed": self.completed_users,
+            "users_rejected": self.rejected_users,
+            "peak_concurrent_users": self.peak_users,
+            "endpoints": {name: stats.summary(self.seconds) for name, stats in self.endpoints.items()},
+        }
+
+
+def _request(base_url: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    Send one GET (or POST with a JSON payload) request.
+
+    Returns:
+        Tuple of (ok, decoded body). A request fails on a transport error, an
+        HTTP error status, an unreadable body or an "error" status in the body.
+    """
+    data = None
+    headers = {}
+    if payload is not None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+    request = urllib.request.Request(base_url + path, data=data, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            body = json.loads(response.read().decode("utf-8"))
+    except (urllib.error.URLError, OSError, ValueError):
+        return False, None
+    return body.get("status") != "error", body
+
+
+def _timed(stats: EndpointStats, base_url: str, path: str,
+           payload: Optional[Dict[str, Any]] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    started = time.perf_counter()
+    ok, body = _request(base_url, path, payload)
+    stats.record((time.perf_counter() - started) * 1000, ok)
+    return ok, body
+
+
+def simulate_user(base_url: str, dialogue: Dialogue, stage: LoadStage,
+                  think_time: float, rng: random.Random) -> bool:
+    """
+    Hold one conversation like the chat page does: fetch the greeting, send
+    each turn, then reload the chat's messages.
+
+    Args:
+        base_url: Server to drive, e.g. http://127.0.0.1:5000
+        dialogue: Turns to send
+        stage: Where latencies are recorded
+        think_time: Mean pause between turns in seconds (exponentially distributed)
+        rng: Random source for the pauses
+
+    Returns:
+        True if every request of the conversation succeeded
+    """
+    ok, _ = _timed(stage.endpoints[INITIAL_MESSAGE], base_url, "/api/initial-message")
+    chat_id = None
+    for message in dialogue.turns:
+        if think_time > 0:
+            time.sleep(rng.expovariate(1 / think_time))
+        turn_ok, body = _timed(stage.endpoints[CHAT], base_url, "/api/chat",
+                               {"message": message, "chat_id": chat_id})
+        ok = ok and turn_ok
+        if body is None or body.get("chat_id") is None:
+            # Without a chat id the rest of the conversation cannot continue
+            return False
+        chat_id = body["chat_id"]
+    messages_ok, _ = _timed(stage.endpoints[MESSAGES], base_url, f"/api/messages/{chat_id}")
+    return ok and messages_ok
+
+
+def run_stage(base_url: str, rate: float, duration: float, max_users: int,
+              think_time: float, seed: int) -> LoadStage:
+    """
+    Start simulated users at Poisson arrivals for a while and wait for them to finish.
+
+    Args:
+        base_url: Server to drive
+        rate: Mean new conversations per second
+        duration: Seconds during which new users arrive
+        max_users: Concurrent users above which new arrivals are turned away
+        think_time: Mean pause between a user's turns in seconds
+        seed: Seed for arrivals, dialogue choice and pauses
+
+    Returns:
+        The stage's results
+    """
+    stage = LoadStage(rate)
+    rng = random.Random(seed)
+    threads = []
+
+    def user(dialogue: Dialogue, user_seed: int) -> None:
+        completed = False
+        try:
+            completed = simulate_user(base_url, dialogue, stage, think_time, random.Random(user_seed))
+        finally:
+            stage.user_finished(completed)
+
+    started = time.perf_counter()
+    next_arrival = started
+    while True:
+        next_arrival += rng.expovariate(rate)
+        if next_arrival - started >= duration:
+            break
+        time.sleep(max(0.0, next_arrival - time.perf_counter()))
+        dialogue = rng.choice(DIALOGUES)
+        user_seed = rng.getrandbits(32)
+        if stage.active_users >= max_users:
+            stage.rejected_users += 1
+            continue
+        stage.user_started()
+        thread = threading.Thread(target=user, args=(dialogue, user_seed), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    stage.seconds = time.perf_counter() - started
+    return stage
+
+
+def format_stage(stage: LoadStage) -> str:
+    """Render a stage's results as a table."""
+    results = stage.to_dict()
+    lines = [
+        f"Arrival rate {stage.rate:g}/s for {stage.seconds:.1f} s: "
+        f"{stage.started_users} users started, {stage.completed_users} completed, "
+        f"{stage.rejected_users} turned away, peak {stage.peak_users} concurrent",
+        f"  {'endpoint':<26} {'requests':>8} {'errors':>7} {'err %':>6} {'req/s':>7} "
+        f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}",
+    ]
+    for name, summary in results["endpoints"].items():
+        lines.append(
+            f"  {name:<26} {summary['requests']:>8} {summary['errors']:>7} {summary['error_rate'] * 100:>6.1f} "
+            f"{summary['throughput_rps']:>7.2f} {summary['p50_ms']:>8.1f} {summary['p90_ms']:>8.1f} "
+            f"{summary['p99_ms']:>8.1f} {summary['max_ms']:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def serve_locally(database_url: str) -> Tuple[str, Any]:
+    """
+    Start the Flask app in this process on a free port.
+
+    Args:
+        database_url: Database for the app, e.g. a scratch SQLite file or a
+            local Postgres stand-in
+
+    Returns:
+        Tuple of (base URL, server); call server.shutdown() when done
+    """
+    import logging
+    from werkzeug.serving import make_server
+
+    os.environ["DATABASE_URL"] = database_url
+    # Same replies on every run
+    os.environ.setdefault("SALES_PITCH_SEED", "loadtest")
+    from app import app, get_agent
+
+    # Per-request debug logs would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    get_agent()
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay Arabic dialogues against the chat API")
+    parser.add_argument("--url", help="Server to drive; by default the app is started in this process")
+    parser.add_argument("--database-url", help="Database for the in-process app (default: a scratch SQLite file)")
+    parser.add_argument("--rate", default="1", help="New conversations per second; a comma-separated list runs one stage per rate")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of arrivals per stage")
+    parser.add_argument("--max-users", type=int, default=100, help="Concurrent conversations above which arrivals are turned away")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean seconds between a user's turns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        database_url = args.database_url
+        if database_url is None:
+            database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "chat.db")
+        base_url, server = serve_locally(database_url)
+        print(f"Serving the app at {base_url} on {database_url}")
+
+    stages = []
+    try:
+        for index, rate in enumerate(float(rate) for rate in args.rate.split(",")):
+            stage = run_stage(base_url.rstrip("/"), rate, args.duration, args.max_users,
+                              args.think_time, args.seed + index)
+            print(format_stage(stage))
+            stages.append(stage.to_dict())
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump({"url": base_url, "stages": stages}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
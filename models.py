@@ -13,3 +13,13 @@ class Message(db.Model):
     content = db.Column(db.Text, nullable=False)
     is_user = db.Column(db.Boolean, default=False)  # True if message is from user, False if from AI
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ChatSession(db.Model):
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), primary_key=True)
+    state = db.Column(db.LargeBinary, nullable=False)  # Encoded SessionState, see session_state.py
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ListingHold(db.Model):
+    property_id = db.Column(db.Integer, primary_key=True)
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat.id'), nullable=False)
+    expires_at = db.Column(db.Float, nullable=False)  # time.time() at which the hold lapses, see holds.py
@@ -0,0 +1,636 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import math
+import os
+import random
+import sys
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalogue import (
+    AREA_TOLERANCES, BASE_PRICE_COLUMN, BUDGET_BUFFERS, CATALOGUE_PATH, FINISHING_TYPE_VALUES,
+    FINISHING_VALUES, SERVICE_VALUES, TYPE_VALUES, compact_catalogue, with_base_prices,
+)
+from currency import BASE_CURRENCY, DIALECT_CURRENCIES, RateTable
+from geo_index import _project
+from session_state import (
+    COMPOUND_ANSWERS, CURRENCIES, FINISHING_TYPES, FINISHINGS, PROPERTY_TYPES, PURPOSES,
+    SERVICES, SessionState,
+)
+from text_index import analyze
+
+DEFAULT_ENGINE = "Ai_agnet_realestate:ArabicRealEstateAgent"
+
+# Filters relaxed by the recommender, in the order it applies them; these are
+# also the labels of the agent's agent_recommendation_fallbacks_total counter
+RELAXATIONS = (
+    "type_filter_dropped", "nearby_location", "location_filter_dropped",
+    "bedrooms_nearby", "bathrooms_nearby", "attribute_filter_dropped",
+    "area_range_widened", "area_filter_dropped", "budget_buffer_extended",
+    "cheapest_fallback",
+)
+SEARCH_RADII_KM = (5, 15, 40, 100, 250, 600)
+
+# Upper bound on engine rebuilds while shrinking one divergent catalogue
+MAX_SHRINK_STEPS = 300
+
+
+class Recommendation(NamedTuple):
+    ids: Tuple[int, ...]  # Recommended property ids, best first (empty: no match)
+    path: Tuple[str, ...]  # Relaxations taken, in RELAXATIONS order
+
+
+class RecommendationCase(NamedTuple):
+    catalogue: pd.DataFrame  # Raw listings, as in the CSV
+    preferences: Dict[str, Any]
+    shown: Tuple[int, ...]
+    dialect: str
+
+
+class ExtractionCase(NamedTuple):
+    text: str
+    stage: str
+    preferences: Dict[str, Any]
+
+
+# ---------------------------------------------------------------------------
+# Engines
+# ---------------------------------------------------------------------------
+
+def load_engine(spec: str):
+    """Import an agent class given as "module:Class"."""
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name or "ArabicRealEstateAgent")
+
+
+def _quietly(func: Callable, *args):
+    # The agent reports each step on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def build_state(preferences: Dict[str, Any], shown: Sequence[int] = (), stage: str = "recommending") -> SessionState:
+    """A session holding the given preference values."""
+    state = SessionState()
+    state.conversation_stage = stage
+    for key, value in preferences.items():
+        if key == "services":
+            state.preferences.services = value
+        elif key == "other_features":
+            state.preferences.other_features = list(value)
+        else:
+            state.preferences[key] = value
+    state.shown_properties.extend(int(property_id) for property_id in shown)
+    return state
+
+
+def _prepare(catalogue: pd.DataFrame, rates: RateTable) -> pd.DataFrame:
+    return with_base_prices(compact_catalogue(catalogue), rates)
+
+
+class ScanRecommender:
+    """
+    Reference recommender: the filter-and-relax rules of
+    ArabicRealEstateAgent._make_recommendation as plain column scans.
+
+    No presorted columns, packed attribute flags, inverted index or spatial
+    index: every filter compares the raw catalogue columns, so it can judge
+    an engine that uses any of those. Semantic ranking is not covered.
+    """
+
+    def __init__(self, catalogue: pd.DataFrame, rates: RateTable, location_index):
+        self.df = _prepare(catalogue, rates)
+        self.rates = rates
+        self.location_index = location_index
+        descriptions = self.df["description"].astype(str) if "description" in self.df.columns else pd.Series([""] * len(self.df))
+        self.terms = [set(analyze(text)) for text in descriptions]
+
+    def feature_score(self, features: Sequence[str]) -> np.ndarray:
+        """Number of requested features whose every term appears in each description."""
+        scores = np.zeros(len(self.df), dtype=np.int64)
+        for feature in features:
+            wanted = set(analyze(feature))
+            if wanted:
+                scores += np.array([wanted <= terms for terms in self.terms], dtype=np.int64)
+        return scores
+
+    def _nearby(self, df: pd.DataFrame, location: str) -> Optional[pd.DataFrame]:
+        origin = self.location_index.resolve(location)
+        if origin is None:
+            return None
+        point = _project(origin.lat, origin.lon)
+        distances = {
+            place.name: math.dist(point, _project(place.lat, place.lon)) for place in self.location_index.indexed
+        }
+        for radius in SEARCH_RADII_KM:
+            names = [name for name, distance in distances.items() if distance <= radius]
+            if not names:
+                continue
+            nearby = df[df["location"].astype(object).isin(names) | df["neighborhood"].astype(object).isin(names)]
+            if len(nearby):
+                return nearby
+        return None
+
+    def _attribute_match(self, df: pd.DataFrame, preferences: Dict[str, Any]) -> Optional[pd.Series]:
+        """Rows offering everything requested, or None if nothing is requested."""
+        match = pd.Series(True, index=df.index)
+        requested = False
+        services = df["services"].astype(object).fillna("").astype(str).str.split("|") if "services" in df.columns else None
+        for service in preferences.get("services") or ():
+            requested = True
+            if services is None:
+                return match & False
+            name = SERVICE_VALUES[SERVICES.index(service)]
+            match &= services.map(lambda names: name in names)
+        if preferences.get("compound") == "نعم":
+            requested = True
+            match &= df["compound"].astype(object) == "yes" if "compound" in df.columns else False
+        if preferences.get("finishing") is not None:
+            requested = True
+            wanted = FINISHING_VALUES[FINISHINGS.index(preferences["finishing"])]
+            match &= df["finishing"].astype(object) == wanted if "finishing" in df.columns else False
+        if preferences.get("finishing_type") not in (None, "عادي"):
+            requested = True
+            wanted = FINISHING_TYPE_VALUES[FINISHING_TYPES.index(preferences["finishing_type"])]
+            match &= df["finishing_type"].astype(object) == wanted if "finishing_type" in df.columns else False
+        return match if requested else None
+
+    def recommend(self, preferences: Dict[str, Any], shown: Sequence[int], dialect: str) -> Recommendation:
+        df = self.df
+        path = []
+
+        if preferences.get("type") is not None:
+            # A preferred type matches its catalogue name and its Arabic label
+            wanted = [preferences["type"]]
+            if preferences["type"] in PROPERTY_TYPES:
+                wanted.append(TYPE_VALUES[PROPERTY_TYPES.index(preferences["type"])])
+            matched = df[df["type"].astype(object).isin(wanted)]
+            if len(matched):
+                df = matched
+            else:
+                path.append("type_filter_dropped")
+
+        location = preferences.get("location")
+        if location is not None and len(df):
+            matched = df[df["location"].astype(object) == location]
+            if len(matched):
+                df = matched
+            else:
+                nearby = self._nearby(df, location)
+                if nearby is not None:
+                    path.append("nearby_location")
+                    df = nearby
+                else:
+                    path.append("location_filter_dropped")
+
+        for column in ("bedrooms", "bathrooms"):
+            wanted = preferences.get(column)
+            if wanted is not None and len(df):
+                matched = df[df[column] == wanted]
+                if len(matched):
+                    df = matched
+                else:
+                    nearby = df[(df[column] >= wanted - 1) & (df[column] <= wanted + 1)]
+                    if len(nearby):
+                        path.append(f"{column}_nearby")
+                        df = nearby
+
+        if len(df):
+            match = self._attribute_match(df, preferences)
+            if match is not None:
+                if match.any():
+                    df = df[match]
+                else:
+                    path.append("attribute_filter_dropped")
+
+        area = preferences.get("area_m2")
+        if area is not None and len(df):
+            for tolerance in AREA_TOLERANCES:
+                matched = df[(df["area_m2"] >= area * (1 - tolerance)) & (df["area_m2"] <= area * (1 + tolerance))]
+                if len(matched):
+                    if tolerance != AREA_TOLERANCES[0]:
+                        path.append("area_range_widened")
+                    df = matched
+                    break
+            else:
+                path.append("area_filter_dropped")
+
+        if preferences.get("budget") is not None and len(df):
+            currency = preferences.get("budget_currency") or DIALECT_CURRENCIES.get(dialect, BASE_CURRENCY)
+            budget = self.rates.to_base(preferences["budget"], currency)
+            matched = df[df[BASE_PRICE_COLUMN] <= budget * BUDGET_BUFFERS[0]]
+            if not len(matched):
+                path.append("budget_buffer_extended")
+                matched = df[df[BASE_PRICE_COLUMN] <= budget * BUDGET_BUFFERS[1]]
+            if not len(matched):
+                path.append("cheapest_fallback")
+                matched = df.sort_values(BASE_PRICE_COLUMN, kind="stable").head(3)
+            df = matched
+
+        if shown:
+            not_shown = df[~df["id"].isin(list(shown))]
+            if len(not_shown):
+                df = not_shown
+
+        if not len(df):
+            return Recommendation((), tuple(path))
+        scores = self.feature_score(preferences.get("other_features") or ())[self.df.index.get_indexer(df.index)]
+        order = np.lexsort((df[BASE_PRICE_COLUMN].to_numpy(), -scores))
+        return Recommendation(tuple(int(i) for i in df["id"].to_numpy()[order][:2]), tuple(path))
+
+    def rank_keys(self, ids: Sequence[int], preferences: Dict[str, Any]) -> List[Tuple[float, float]]:
+        """Sort keys (feature score, base price) of listings, to tell ties from real differences."""
+        scores = self.feature_score(preferences.get("other_features") or ())
+        rows = {int(property_id): row for row, property_id in enumerate(self.df["id"].to_numpy())}
+        return [(float(scores[rows[i]]), float(self.df[BASE_PRICE_COLUMN].iloc[rows[i]])) for i in ids]
+
+
+class AgentRecommender:
+    """Runs an agent class's _make_recommendation on a preset session."""
+
+    def __init__(self, engine_class, catalogue: pd.DataFrame, rates: RateTable):
+        recording_class = type(f"Recording{engine_class.__name__}", (engine_class,), {
+            "_format_multiple_recommendations": _record_properties,
+            "_suggest_criteria_adjustment": _record_no_match,
+        })
+        self.agent = _quietly(recording_class, _prepare(catalogue, rates))
+        # Rankings must not depend on the SEMANTIC_SEARCH setting of this process
+        self.agent.semantic_index = None
+        # The relaxation counter of the module defining the engine (or the class it extends)
+        self.fallbacks = next((
+            sys.modules[cls.__module__].RECOMMENDATION_FALLBACKS for cls in engine_class.__mro__
+            if hasattr(sys.modules.get(cls.__module__), "RECOMMENDATION_FALLBACKS")
+        ), None)
+
+    def recommend(self, preferences: Dict[str, Any], shown: Sequence[int], dialect: str) -> Recommendation:
+        agent = self.agent
+        agent.session_state = build_state(preferences, shown)
+        agent.current_dialect = dialect
+        agent.current_request = ""
+        agent.recorded = ()
+        before = {label: self.fallbacks.value(label) for label in RELAXATIONS} if self.fallbacks else {}
+        _quietly(agent._make_recommendation)
+        path = tuple(label for label in RELAXATIONS if self.fallbacks and self.fallbacks.value(label) > before[label])
+        return Recommendation(tuple(agent.recorded), path)
+
+
+def _record_properties(self, properties):
+    self.recorded = tuple(int(row["id"]) for row in properties)
+    return super(type(self), self)._format_multiple_recommendations(properties)
+
+
+def _record_no_match(self):
+    self.recorded = ()
+    return super(type(self), self)._suggest_criteria_adjustment()
+
+
+def extract(agent, case: ExtractionCase) -> Dict[str, Any]:
+    """Slots an agent extracts from one message, starting from a preset session."""
+    agent.session_state = build_state(case.preferences, stage=case.stage)
+    _quietly(agent._extract_information, case.text)
+    return agent.session_state.preferences.to_dict()
+
+
+# ---------------------------------------------------------------------------
+# Generated inputs
+# ---------------------------------------------------------------------------
+
+def generate_catalogue(rng: random.Random, template: pd.DataFrame, size: int) -> pd.DataFrame:
+    """
+    A random catalogue shaped like the template: every column is drawn
+    independently from the template's values, numbers are jittered, and a
+    few type values are Arabic labels instead of catalogue names.
+    """
+    columns = {}
+    for column in template.columns:
+        values = template[column].dropna().tolist()
+        columns[column] = [rng.choice(values) if values else None for _ in range(size)]
+    catalogue = pd.DataFrame(columns)
+    catalogue["id"] = rng.sample(range(1, size * 10 + 1), size)
+    if "type" in catalogue.columns:
+        catalogue["type"] = [rng.choice(PROPERTY_TYPES) if rng.random() < 0.3 else value for value in catalogue["type"]]
+    for column in ("price", "area_m2"):
+        if column in catalogue.columns:
+            catalogue[column] = [int(value * rng.uniform(0.5, 1.5)) for value in catalogue[column]]
+    return catalogue
+
+
+def generate_preferences(rng: random.Random, catalogue: pd.DataFrame, places: Sequence[str],
+                         feature_names: Sequence[str]) -> Dict[str, Any]:
+    """A random set of preferences; each field is left unset with probability 0.4."""
+    def maybe(make):
+        return make() if rng.random() < 0.6 else None
+
+    locations = list(catalogue["location"].dropna().unique()) + list(places) + ["Atlantis"]
+    preferences = {
+        "type": maybe(lambda: rng.choice(PROPERTY_TYPES)),
+        "location": maybe(lambda: str(rng.choice(locations))),
+        "bedrooms": maybe(lambda: rng.randint(1, 6)),
+        "bathrooms": maybe(lambda: rng.randint(1, 4)),
+        "budget": maybe(lambda: float(round(10 ** rng.uniform(4.5, 7.5), -3))),
+        "budget_currency": maybe(lambda: rng.choice(CURRENCIES)),
+        "area_m2": maybe(lambda: rng.randint(40, 600)),
+        "purpose": maybe(lambda: rng.choice(PURPOSES)),
+        "compound": maybe(lambda: rng.choice(COMPOUND_ANSWERS)),
+        "finishing": maybe(lambda: rng.choice(FINISHINGS)),
+        "finishing_type": maybe(lambda: rng.choice(FINISHING_TYPES)),
+        "services": tuple(sorted(rng.sample(SERVICES, rng.randint(0, 2)), key=SERVICES.index)),
+        "other_features": rng.sample(list(feature_names), rng.randint(0, 2)),
+    }
+    return {key: value for key, value in preferences.items() if value not in (None, (), [])}
+
+
+def generate_message(rng: random.Random, patterns: Dict[str, Any], locations: Sequence[str]) -> str:
+    """A random message mixing pattern words, numbers with units and places."""
+    keyword_groups = [group for group, values in patterns.items()
+                      if group != "contact_patterns" and all(isinstance(words, list) for words in values.values())]
+    fragments = []
+    for _ in range(rng.randint(1, 4)):
+        kind = rng.random()
+        if kind < 0.5:
+            group = patterns[rng.choice(keyword_groups)]
+            fragments.append(rng.choice(rng.choice(list(group.values()))))
+        elif kind < 0.8:
+            unit = rng.choice(["", "غرف", "حمام", "متر", "دور", "الف", "مليون", "دولار", "ريال"])
+            fragments.append(f"{rng.choice([1, 2, 3, 5, 120, 250, 900, 1500000, 7000000])} {unit}".strip())
+        else:
+            fragments.append(rng.choice(locations))
+    filler = ["عايز", "في", "و", "بس", "تقريبا", "ممكن"]
+    words = []
+    for fragment in fragments:
+        if rng.random() < 0.4:
+            words.append(rng.choice(filler))
+        words.append(fragment)
+    return " ".join(words)
+
+
+# ---------------------------------------------------------------------------
+# Comparison and shrinking
+# ---------------------------------------------------------------------------
+
+class Oracle:
+    """
+    Runs a reference and a candidate implementation on the same inputs and
+    reports every difference.
+
+    Recommendations are checked against ScanRecommender; extraction is
+    checked against the reference agent class, with a fresh reference agent
+    per case and one shared candidate agent (as in the server), so state
+    leaking between sessions also shows up as a divergence.
+    """
+
+    def __init__(self, candidate_class, reference_class, template: pd.DataFrame, rates: Optional[RateTable] = None):
+        self.candidate_class = candidate_class
+        self.reference_class = reference_class
+        self.template = template
+        self.rates = rates or RateTable.load()
+
+    # Recommendations
+
+    def _engines(self, catalogue: pd.DataFrame):
+        candidate = AgentRecommender(self.candidate_class, catalogue, self.rates)
+        reference = ScanRecommender(catalogue, self.rates, candidate.agent.location_index)
+        return reference, candidate
+
+    def compare_recommendation(self, case: RecommendationCase, engines=None) -> Optional[Dict[str, Any]]:
+        """The difference between both recommenders on one case, or None if they agree."""
+        reference, candidate = engines or self._engines(case.catalogue)
+        expected = reference.recommend(case.preferences, case.shown, case.dialect)
+        actual = candidate.recommend(case.preferences, case.shown, case.dialect)
+        if expected == actual:
+            return None
+        if expected.path == actual.path and len(expected.ids) == len(actual.ids) and \
+                reference.rank_keys(expected.ids, case.preferences) == reference.rank_keys(actual.ids, case.preferences):
+            # Equally ranked listings in a different order: both are right
+            return None
+        return {
+            "reference": {"ids": list(expected.ids), "path": list(expected.path)},
+            "candidate": {"ids": list(actual.ids), "path": list(actual.path)},
+        }
+
+    def shrink_recommendation(self, case: RecommendationCase) -> RecommendationCase:
+        """
+        Reduce a divergent case while it still diverges: drop preferences,
+        then shown listings, then catalogue rows (halves first, then smaller chunks).
+        """
+        def diverges(candidate_case):
+            try:
+                return self.compare_recommendation(candidate_case) is not None
+            except Exception:
+                # A crash is a different failure; keep looking for the original one
+                return False
+
+        steps = 0
+        for key in list(case.preferences):
+            trial = case._replace(preferences={k: v for k, v in case.preferences.items() if k != key})
+            steps += 1
+            if diverges(trial):
+                case = trial
+        if case.shown and diverges(case._replace(shown=())):
+            case = case._replace(shown=())
+
+        chunk = max(1, len(case.catalogue) // 2)
+        while chunk >= 1 and steps < MAX_SHRINK_STEPS:
+            removed = False
+            start = 0
+            while start < len(case.catalogue) and steps < MAX_SHRINK_STEPS:
+                trial_catalogue = case.catalogue.drop(case.catalogue.index[start:start + chunk]).reset_index(drop=True)
+                steps += 1
+                if len(trial_catalogue) and diverges(case._replace(catalogue=trial_catalogue)):
+                    case = case._replace(catalogue=trial_catalogue)
+                    removed = True
+                else:
+                    start += chunk
+            if not removed:
+                chunk //= 2
+        return case
+
+    # Extraction
+
+    def compare_extraction(self, case: ExtractionCase, candidate_agent, catalogue: pd.DataFrame) -> Optional[Dict[str, Any]]:
+        """The difference between both extractors on one message, or None if they agree."""
+        reference_agent = _quietly(self.reference_class, _prepare(catalogue, self.rates))
+        expected = extract(reference_agent, case)
+        actual = extract(candidate_agent, case)
+        if expected == actual:
+            return None
+        slots = sorted(key for key in expected if expected[key] != actual[key])
+        return {
+            "slots": slots,
+            "reference": {key: expected[key] for key in slots},
+            "candidate": {key: actual[key] for key in slots},
+        }
+
+    def shrink_extraction(self, case: ExtractionCase, candidate_agent, catalogue: pd.DataFrame) -> ExtractionCase:
+        """Drop words and preset preferences while the extractors still disagree."""
+        def diverges(trial):
+            try:
+                return self.compare_extraction(trial, candidate_agent, catalogue) is not None
+            except Exception:
+                return False
+
+        words = case.text.split()
+        index = 0
+        while index < len(words) and len(words) > 1:
+            trial = case._replace(text=" ".join(words[:index] + words[index + 1:]))
+            if diverges(trial):
+                words = trial.text.split()
+                case = trial
+            else:
+                index += 1
+        for key in list(case.preferences):
+            trial = case._replace(preferences={k: v for k, v in case.preferences.items() if k != key})
+            if diverges(trial):
+                case = trial
+        return case
+
+    # Runs
+
+    def run(self, cases: int, seed: int, catalogue_size: int, shrink: bool = True) -> List[Dict[str, Any]]:
+        """
+        Check both implementations on generated inputs.
+
+        Args:
+            cases: Number of recommendation cases, and of extraction cases
+            seed: Seed for the generated catalogues, preferences and messages
+            catalogue_size: Listings per generated catalogue
+            shrink: Reduce each divergence to a minimal reproducer
+
+        Returns:
+            One reproducer per divergence (see write_reproducer for the layout)
+        """
+        rng = random.Random(seed)
+        divergences = []
+        cases_per_catalogue = 25
+        for first in range(0, cases, cases_per_catalogue):
+            catalogue = generate_catalogue(rng, self.template, catalogue_size)
+            engines = self._engines(catalogue)
+            candidate_agent = engines[1].agent
+            places = list(candidate_agent.location_index.places)
+            feature_names = list(candidate_agent.patterns["feature_patterns"])
+            dialects = candidate_agent.get_available_dialects()
+            ids = catalogue["id"].tolist()
+
+            for number in range(first, min(cases, first + cases_per_catalogue)):
+                case = RecommendationCase(
+                    catalogue,
+                    generate_preferences(rng, catalogue, rng.sample(places, min(3, len(places))), feature_names),
+                    tuple(rng.sample(ids, rng.randint(0, 3))),
+                    rng.choice(dialects),
+                )
+                try:
+                    difference = self.compare_recommendation(case, engines)
+                except Exception as e:
+                    difference = {"error": f"{type(e).__name__}: {e}"}
+                if difference is not None:
+                    if shrink and "error" not in difference:
+                        case = self.shrink_recommendation(case)
+                        difference = self.compare_recommendation(case) or difference
+                    divergences.append(_recommendation_reproducer(seed, number, case, difference))
+
+                message_case = ExtractionCase(
+                    generate_message(rng, candidate_agent.patterns, places[:10]),
+                    rng.choice(("greeting", "clarifying")),
+                    generate_preferences(rng, catalogue, (), feature_names) if rng.random() < 0.5 else {},
+                )
+                try:
+                    difference = self.compare_extraction(message_case, candidate_agent, catalogue)
+                except Exception as e:
+                    difference = {"error": f"{type(e).__name__}: {e}"}
+                if difference is not None:
+                    if shrink and "error" not in difference:
+                        message_case = self.shrink_extraction(message_case, candidate_agent, catalogue)
+                        difference = self.compare_extraction(message_case, candidate_agent, catalogue) or difference
+                    divergences.append(_extraction_reproducer(seed, number, message_case, catalogue, difference))
+        return divergences
+
+    def replay(self, reproducer: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Run a saved reproducer again; returns the difference, or None if it is fixed."""
+        catalogue = pd.DataFrame(reproducer["catalogue"])
+        inputs = reproducer["input"]
+        if reproducer["kind"] == "recommendation":
+            case = RecommendationCase(catalogue, _decode_preferences(inputs["preferences"]),
+                                      tuple(inputs["shown"]), inputs["dialect"])
+            return self.compare_recommendation(case)
+        case = ExtractionCase(inputs["text"], inputs["stage"], _decode_preferences(inputs["preferences"]))
+        candidate_agent = _quietly(self.candidate_class, _prepare(catalogue, self.rates))
+        return self.compare_extraction(case, candidate_agent, catalogue)
+
+
+def _decode_preferences(preferences: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: tuple(value) if key == "services" else value for key, value in preferences.items()}
+
+
+def _json_catalogue(catalogue: pd.DataFrame) -> List[Dict[str, Any]]:
+    return json.loads(catalogue.to_json(orient="records", force_ascii=False))
+
+
+def _recommendation_reproducer(seed, number, case: RecommendationCase, difference) -> Dict[str, Any]:
+    return {
+        "kind": "recommendation",
+        "seed": seed,
+        "case": number,
+        "input": {"preferences": case.preferences, "shown": list(case.shown), "dialect": case.dialect},
+        "catalogue": _json_catalogue(case.catalogue),
+        "difference": difference,
+    }
+
+
+def _extraction_reproducer(seed, number, case: ExtractionCase, catalogue, difference) -> Dict[str, Any]:
+    return {
+        "kind": "extraction",
+        "seed": seed,
+        "case": number,
+        "input": {"text": case.text, "stage": case.stage, "preferences": case.preferences},
+        # The agent matches locations against the catalogue, so it is part of the input
+        "catalogue": _json_catalogue(catalogue),
+        "difference": difference,
+    }
+
+
+def write_reproducer(reproducer: Dict[str, Any], output_dir: str) -> str:
+    """
+    Save a reproducer as JSON: kind, seed, case, input, catalogue (listing
+    records) and difference. Replay it with python oracle.py --replay FILE.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{reproducer['kind']}-{reproducer['seed']}-{reproducer['case']}.json")
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(reproducer, output, ensure_ascii=False, indent=2, default=str)
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare a recommender/extractor against the reference implementation")
+    parser.add_argument("--candidate", default=DEFAULT_ENGINE, help="Agent class under test, as module:Class")
+    parser.add_argument("--reference", default=DEFAULT_ENGINE, help="Reference agent class for extraction, as module:Class")
+    parser.add_argument("--cases", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--catalogue-size", type=int, default=60)
+    parser.add_argument("--no-shrink", action="store_true", help="Report divergences without minimizing them")
+    parser.add_argument("--out", default="oracle-divergences", help="Directory for reproducers")
+    parser.add_argument("--replay", help="Re-run one saved reproducer instead")
+    args = parser.parse_args(argv)
+
+    oracle = Oracle(load_engine(args.candidate), load_engine(args.reference), pd.read_csv(CATALOGUE_PATH))
+    if args.replay:
+        with open(args.replay, encoding="utf-8") as reproducer_file:
+            difference = oracle.replay(json.load(reproducer_file))
+        print(json.dumps(difference, ensure_ascii=False, indent=2) if difference else "No divergence")
+        return 1 if difference else 0
+
+    divergences = oracle.run(args.cases, args.seed, args.catalogue_size, shrink=not args.no_shrink)
+    for reproducer in divergences:
+        path = write_reproducer(reproducer, args.out)
+        print(f"[{reproducer['kind']}] case {reproducer['case']}: {json.dumps(reproducer['difference'], ensure_ascii=False)} -> {path}")
+    print(f"{args.cases} recommendation and {args.cases} extraction cases, {len(divergences)} divergences")
+    return 1 if divergences else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+from typing import Any, Dict, Optional
+
+# Bounds keeping a profiling session cheap enough for live traffic
+MAX_SECONDS = 300
+MIN_INTERVAL_MS = 1.0
+DEFAULT_INTERVAL_MS = 5.0
+
+AGENT_MODULE = "Ai_agnet_realestate"
+# Decorator wrappers (metrics, tracing) add a frame per call; hide them from stacks
+_WRAPPER_MODULES = ("metrics", "tracing")
+
+_lock = threading.Lock()
+_active: Optional["ProfileSession"] = None
+_last: Optional["ProfileSession"] = None
+_labels: Dict[Any, Optional[str]] = {}
+
+
+def _label(code) -> Optional[str]:
+    """Frame label for a code object: agent methods are tagged, wrapper frames dropped."""
+    label = _labels.get(code)
+    if label is None and code not in _labels:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        name = getattr(code, "co_qualname", code.co_name)
+        if module in _WRAPPER_MODULES and code.co_name == "wrapper":
+            label = None
+        elif module == AGENT_MODULE:
+            label = f"[agent] {name}"
+        else:
+            label = f"{module}:{name}"
+        _labels[code] = label
+    return label
+
+
+class ProfileSession:
+    """Samples the stacks of every other thread at a fixed interval."""
+
+    def __init__(self, seconds: float, interval_ms: float, output_dir: Optional[str]):
+        self.seconds = min(max(seconds, 0.1), MAX_SECONDS)
+        self.interval = max(interval_ms, MIN_INTERVAL_MS) / 1000
+        self.output_dir = output_dir
+        self.output_path: Optional[str] = None
+        self.stacks = _StackCounter()
+        self.samples = 0
+        self.started = time.time()
+        self.finished: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _sample(self, own_thread: int) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack = []
+            while frame is not None:
+                label = _label(frame.f_code)
+                if label is not None:
+                    stack.append(label)
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        own_thread = threading.get_ident()
+        deadline = time.perf_counter() + self.seconds
+        try:
+            while not self._stop.is_set() and time.perf_counter() < deadline:
+                self._sample(own_thread)
+                self._stop.wait(self.interval)
+        finally:
+            self._finish()
+
+    def _finish(self) -> None:
+        global _active, _last
+        self.finished = time.time()
+        if self.output_dir:
+            self.output_path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{int(self.started)}.collapsed")
+            try:
+                with open(self.output_path, "w", encoding="utf-8") as output:
+                    output.write(self.collapsed())
+            except OSError as e:
+                print(f"[ERROR] Could not write profile to {self.output_path}: {str(e)}")
+                self.output_path = None
+        with _lock:
+            if _active is self:
+                _active = None
+            _last = self
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl / speedscope."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "running": self.finished is None,
+            "started": self.started,
+            "finished": self.finished,
+            "seconds": self.seconds,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+            "output_path": self.output_path,
+        }
+
+
+def start(seconds: float, interval_ms: float = DEFAULT_INTERVAL_MS,
+          output_dir: Optional[str] = None) -> Optional[ProfileSession]:
+    """
+    Profile this process for a number of seconds in a background thread.
+
+    Args:
+        seconds: How long to sample (capped at MAX_SECONDS)
+        interval_ms: Time between samples (at least MIN_INTERVAL_MS)
+        output_dir: Directory the collapsed stacks are written to when done
+
+    Returns:
+        The new session, or None if one is already running in this process
+    """
+    global _active
+    with _lock:
+        if _active is not None:
+            return None
+        _active = ProfileSession(seconds, interval_ms, output_dir)
+        session = _active
+    session._thread.start()
+    return session
+
+
+def stop() -> None:
+    """Stop the running session early, if any."""
+    with _lock:
+        session = _active
+    if session is not None:
+        session._stop.set()
+
+
+def current() -> Optional[ProfileSession]:
+    """The running session, or else the last finished one."""
+    with _lock:
+        return _active or _last
+
+
+def start_from_env() -> Optional[ProfileSession]:
+    """Start a session if PROFILE_SECONDS is set (PROFILE_INTERVAL_MS, PROFILE_DIR optional)."""
+    seconds = float(os.environ.get("PROFILE_SECONDS", "0"))
+    if seconds <= 0:
+        return None
+    return start(
+        seconds,
+        float(os.environ.get("PROFILE_INTERVAL_MS", DEFAULT_INTERVAL_MS)),
+        os.environ.get("PROFILE_DIR", "."),
+    )
+
+
+def _reset_after_fork() -> None:
+    # The sampling thread does not survive fork; forget the parent's session
+    global _lock, _active, _last
+    _lock = threading.Lock()
+    _active = None
+    _last = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
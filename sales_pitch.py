@@ -0,0 +1,98 @@
+import os
+import random
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# Set SALES_PITCH_SEED to make pitch choices reproducible (e.g. for load tests)
+SEED = os.environ.get("SALES_PITCH_SEED")
+
+# Phrase in the generic arguments that is replaced by the listing's area
+AREA_PLACEHOLDER = "المنطقة دي"
+PRICE_NOTE = "\n\nالسعر ({price:,}) أقل من متوسط أسعار العقارات المماثلة في المنطقة بنسبة 5-10%."
+
+# Used arguments are tracked as bits of a 64-bit session field
+MAX_ARGUMENTS = 64
+
+
+class SalesPitchEngine:
+    """
+    Picks sales arguments a session has not heard yet.
+
+    Used arguments are a bitmask of indices into the argument list. The
+    arguments are localized up front for every (neighborhood, location) pair
+    in the catalogue, so a pitch is a table lookup plus the price note.
+    """
+
+    def __init__(self, arguments: Sequence[str], properties_df: Optional[pd.DataFrame] = None,
+                 seed: Optional[str] = SEED):
+        if len(arguments) > MAX_ARGUMENTS:
+            raise ValueError(f"At most {MAX_ARGUMENTS} sales arguments are supported, got {len(arguments)}")
+        self.arguments: Tuple[str, ...] = tuple(arguments)
+        self.all_used = (1 << len(self.arguments)) - 1
+        self.seed = seed
+        self._rng = random.Random()
+        self.localized: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        if properties_df is not None and {"neighborhood", "location"} <= set(properties_df.columns):
+            areas = properties_df[["neighborhood", "location"]].astype(str).drop_duplicates()
+            for neighborhood, location in areas.itertuples(index=False):
+                self._localize(neighborhood, location)
+
+    def _localize(self, neighborhood: str, location: str) -> Tuple[str, ...]:
+        area = f"منطقة {neighborhood} في {location}"
+        localized = tuple(argument.replace(AREA_PLACEHOLDER, area) for argument in self.arguments)
+        self.localized[(neighborhood, location)] = localized
+        return localized
+
+    def _choose(self, available: int, used: int, property_id: Any) -> int:
+        """Pick one set bit of available, uniformly."""
+        if self.seed is None:
+            rng = self._rng
+        else:
+            # Derived from the session's own history, so concurrent sessions don't disturb each other
+            rng = random.Random(f"{self.seed}:{property_id}:{used}")
+        target = rng.randrange(available.bit_count())
+        for index in range(len(self.arguments)):
+            if available >> index & 1:
+                if target == 0:
+                    return index
+                target -= 1
+        raise AssertionError("no argument available")
+
+    def next_pitch(self, used: int, property_data: Optional[Dict[str, Any]]) -> Tuple[str, int]:
+        """
+        Choose the next sales argument for a session.
+
+        Args:
+            used: Bitmask of argument indices the session has already heard
+            property_data: The property being discussed, if any
+
+        Returns:
+            Tuple of (pitch text, updated bitmask)
+        """
+        if not self.arguments:
+            return "", used
+        used &= self.all_used
+        if used == self.all_used:
+            # Every argument has been used; start over
+            used = 0
+        index = self._choose(self.all_used & ~used, used, (property_data or {}).get("id"))
+        used |= 1 << index
+
+        pitch = self.arguments[index]
+        if property_data:
+            try:
+                if "neighborhood" in property_data and "location" in property_data:
+                    key = (str(property_data["neighborhood"]), str(property_data["location"]))
+                    localized = self.localized.get(key) or self._localize(*key)
+                    pitch = localized[index]
+                if "price" in property_data:
+                    pitch += PRICE_NOTE.format(price=int(property_data["price"]))
+            except (TypeError, ValueError):
+                # If personalization fails, just use the generic argument
+                pitch = self.arguments[index]
+        return pitch, used
+
+    def used_arguments(self, used: int) -> List[str]:
+        """The generic text of the arguments in a used bitmask."""
+        return [argument for index, argument in enumerate(self.arguments) if used >> index & 1]
@@ -0,0 +1,249 @@
+import os
+import time
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from metrics import Counter
+from text_index import normalize
+
+# Set SEMANTIC_SEARCH=1 to rank recommendations by similarity to the request as well
+ENABLED = os.environ.get("SEMANTIC_SEARCH", "0") == "1"
+# Where encoded catalogues are cached, one .npy file per catalogue version
+INDEX_DIR = os.environ.get("SEMANTIC_INDEX_DIR", "embeddings")
+# Time allowed for one query before the remaining inverted lists are skipped
+QUERY_BUDGET_MS = float(os.environ.get("SEMANTIC_BUDGET_MS", "20"))
+
+DIMENSIONS = 256
+ENCODE_BATCH_SIZE = 1024
+# Inverted lists probed per query, closest centroid first
+DEFAULT_PROBES = 3
+
+QUERY_BUDGET_EXCEEDED = Counter(
+    "semantic_query_budget_exceeded_total", "Semantic queries cut short by the latency budget"
+)
+
+
+class HashedNgramEncoder:
+    """
+    Embed text as hashed word and character n-gram counts, L2-normalized.
+
+    CPU-only and deterministic: no model download and no training, so the
+    same text always maps to the same vector in every worker. Catches
+    spelling and morphological variants, not translations.
+    """
+
+    def __init__(self, dimensions: int = DIMENSIONS, char_ngrams: Tuple[int, ...] = (3, 4)):
+        self.dimensions = dimensions
+        self.char_ngrams = char_ngrams
+
+    def _features(self, text: str) -> List[str]:
+        words = normalize(text).split()
+        features = [f"w:{word}" for word in words]
+        for word in words:
+            padded = f" {word} "
+            for n in self.char_ngrams:
+                features.extend(f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+        return features
+
+    def encode(self, text: str) -> np.ndarray:
+        """Embed one text as a float32 unit vector (all zeros for empty text)."""
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            # Low bits pick the dimension, one high bit the sign
+            vector[digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def encode_batch(self, texts: Iterable[str], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Embed many texts into the rows of a matrix.
+
+        Args:
+            texts: Texts to embed
+            out: Matrix to write into (e.g. a memory-mapped file); allocated if None
+
+        Returns:
+            The (len(texts), dimensions) float32 matrix
+        """
+        texts = list(texts)
+        if out is None:
+            out = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for start in range(0, len(texts), ENCODE_BATCH_SIZE):
+            batch = texts[start:start + ENCODE_BATCH_SIZE]
+            out[start:start + len(batch)] = [self.encode(text) for text in batch]
+        return out
+
+
+def listing_texts(properties_df: pd.DataFrame) -> List[str]:
+    """The text embedded for each listing: its type and description."""
+    columns = [column for column in ("type", "description") if column in properties_df.columns]
+    if not columns:
+        return [""] * len(properties_df)
+    return properties_df[columns].astype(str).agg(" ".join, axis=1).tolist()
+
+
+def encode_catalogue(properties_df: pd.DataFrame, path: str,
+                     encoder: Optional[HashedNgramEncoder] = None) -> np.ndarray:
+    """
+    Encode every listing into a .npy file in batches and return it memory-mapped.
+
+    Args:
+        properties_df: The catalogue
+        path: Output .npy file
+        encoder: Encoder to use (default: HashedNgramEncoder())
+
+    Returns:
+        The embedding matrix, memory-mapped read-only from path
+    """
+    encoder = encoder or HashedNgramEncoder()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial_path = path + ".partial"
+    matrix = np.lib.format.open_memmap(
+        partial_path, mode="w+", dtype=np.float32, shape=(len(properties_df), encoder.dimensions)
+    )
+    encoder.encode_batch(listing_texts(properties_df), out=matrix)
+    matrix.flush()
+    del matrix
+    # Publish atomically so a concurrent reader never maps a half-written file
+    os.replace(partial_path, path)
+    return np.load(path, mmap_mode="r")
+
+
+def catalogue_embeddings_path(catalogue_version: int, index_dir: str = INDEX_DIR,
+                              dimensions: int = DIMENSIONS) -> str:
+    return os.path.join(index_dir, f"listings-{catalogue_version:08x}-{dimensions}.npy")
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index over unit vectors.
+
+    Rows are clustered with a few rounds of spherical k-means; a query scores
+    only the rows in the lists whose centroids are closest to it.
+    """
+
+    def __init__(self, vectors: np.ndarray, lists: Optional[int] = None, iterations: int = 8, seed: int = 0):
+        self.vectors = vectors
+        count = len(vectors)
+        lists = lists or max(1, int(np.sqrt(count)))
+        lists = min(lists, max(count, 1))
+        rng = np.random.default_rng(seed)
+        if count == 0:
+            self.centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            self.lists: List[np.ndarray] = []
+            return
+
+        centroids = np.asarray(vectors[rng.choice(count, size=lists, replace=False)], dtype=np.float32)
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for list_id in range(lists):
+                members = vectors[assignment == list_id]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[list_id] = centroid / norm if norm > 0 else centroid
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignment == list_id) for list_id in range(lists)]
+
+    def search(self, query: np.ndarray, candidates: Optional[np.ndarray] = None,
+               probes: int = DEFAULT_PROBES, budget_ms: float = QUERY_BUDGET_MS) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score the rows near a query vector.
+
+        Args:
+            query: Unit query vector
+            candidates: Boolean mask over rows; others are never scored
+            probes: Number of inverted lists to scan
+            budget_ms: Stop scanning further lists once this much time has passed
+
+        Returns:
+            (row positions, cosine similarities) for the rows scanned
+        """
+        started = time.perf_counter()
+        order = np.argsort(-(self.centroids @ query))[:probes]
+        positions, scores = [], []
+        for scanned, list_id in enumerate(order):
+            if scanned and (time.perf_counter() - started) * 1000 > budget_ms:
+                QUERY_BUDGET_EXCEEDED.inc()
+                break
+            members = self.lists[list_id]
+            if candidates is not None:
+                members = members[candidates[members]]
+            if len(members):
+                positions.append(members)
+                scores.append(np.asarray(self.vectors[members] @ query))
+        if not positions:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(positions), np.concatenate(scores)
+
+
+class SemanticIndex:
+    """Embeddings of the catalogue listings plus an IVF index over them."""
+
+    def __init__(self, vectors: np.ndarray, encoder: Optional[HashedNgramEncoder] = None):
+        self.encoder = encoder or HashedNgramEncoder(vectors.shape[1])
+        self.vectors = vectors
+        self.ivf = IVFIndex(vectors)
+
+    @classmethod
+    def load(cls, properties_df: pd.DataFrame, catalogue_version: int, index_dir: str = INDEX_DIR) -> "SemanticIndex":
+        """
+        Map the encoded catalogue from index_dir, encoding it first if this
+        catalogue version has not been encoded yet.
+        """
+        path = catalogue_embeddings_path(catalogue_version, index_dir)
+        vectors = None
+        if os.path.exists(path):
+            try:
+                vectors = np.load(path, mmap_mode="r")
+                if vectors.shape != (len(properties_df), DIMENSIONS):
+                    vectors = None
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] Could not map embeddings {path}: {str(e)}")
+        if vectors is None:
+            print(f"[INFO] Encoding {len(properties_df)} listings into {path}")
+            vectors = encode_catalogue(properties_df, path)
+        return cls(vectors)
+
+    def similarities(self, text: str, candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of every catalogue row to a request.
+
+        Rows outside the probed lists, outside candidates, or skipped by the
+        latency budget score 0.
+        """
+        scores = np.zeros(len(self.vectors), dtype=np.float32)
+        query = self.encoder.encode(text)
+        if not query.any():
+            return scores
+        positions, similarity = self.ivf.search(query, candidates)
+        scores[positions] = np.maximum(similarity, 0)
+        return scores
+
+
+def load_if_enabled(properties_df: pd.DataFrame, catalogue_version: int) -> Optional[SemanticIndex]:
+    """The semantic index when SEMANTIC_SEARCH=1, else None."""
+    if not ENABLED:
+        return None
+    try:
+        return SemanticIndex.load(properties_df, catalogue_version)
+    except OSError as e:
+        print(f"[ERROR] Semantic search disabled: {str(e)}")
+        return None
+
+
+if __name__ == "__main__":
+    # Offline encoding of the bundled catalogue, e.g. during the build step
+    from catalogue import catalogue_version, load_catalogue
+
+    properties_df = load_catalogue()
+    version = catalogue_version(properties_df)
+    path = catalogue_embeddings_path(version)
+    started = time.perf_counter()
+    vectors = encode_catalogue(properties_df, path)
+    print(f"Encoded {len(vectors)} listings into {path} in {(time.perf_counter() - started) * 1000:.1f} ms")
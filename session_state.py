@@ -0,0 +1,733 @@
+import heapq
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from enum import IntEnum
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+from metrics import Counter, Gauge
+
+
+class Stage(IntEnum):
+    """Conversation stages, stored as a single byte per session."""
+    GREETING = 0
+    CLARIFYING = 1
+    SUMMARIZING = 2
+    RECOMMENDING = 3
+    SALES_PITCH = 4
+    CONTACT_COLLECTION = 5
+    REFINING = 6
+    CLOSING = 7
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+
+# Categorical preference values, in code order, as produced by the agent patterns
+PROPERTY_TYPES = ("شقة", "فيلا", "مكتب", "أرض")
+PURPOSES = ("للشراء", "للإيجار")
+COMPOUND_ANSWERS = ("نعم", "لا")
+FINISHINGS = ("متشطب", "نص تشطيب")
+FINISHING_TYPES = ("سوبر لوكس", "الترا لوكس", "عادي")
+CURRENCIES = ("EGP", "USD", "EUR", "SAR", "AED", "KWD", "QAR")
+DIALECTS = ("egyptian", "khaleeji", "msa")
+QUESTION_KEYS = (
+    "ask_location", "ask_purpose", "ask_type", "ask_compound", "ask_area",
+    "ask_finishing", "ask_finishing_type", "ask_services", "ask_floor",
+    "ask_budget", "ask_bedrooms", "ask_bathrooms"
+)
+STAGES = tuple(stage.label for stage in Stage)
+
+# Services are stored as a bitmask, one bit per entry in this order
+SERVICES = ("أمن", "جراج", "نادي", "مول")
+
+# Shown listings remembered per chat; beyond this the oldest are forgotten
+# (and may be suggested again)
+MAX_SHOWN_PROPERTIES = int(os.environ.get("SESSION_MAX_SHOWN_PROPERTIES", "100"))
+# Free-text features kept per chat, newest last
+MAX_OTHER_FEATURES = 32
+# Location, name, phone, email and features are stored cut to this many UTF-8 bytes
+MAX_TEXT_BYTES = 256
+# Encoded sessions larger than this are logged and counted as suspected leaks
+SESSION_BYTE_BUDGET = int(os.environ.get("SESSION_BYTE_BUDGET", "4096"))
+# Sessions untouched for this long are deleted by the sweeper; 0 keeps them forever
+SESSION_IDLE_SECONDS = int(os.environ.get("SESSION_IDLE_SECONDS", str(30 * 24 * 3600)))
+# Seconds between two sweeps of a worker's store
+SESSION_SWEEP_INTERVAL = int(os.environ.get("SESSION_SWEEP_INTERVAL", "600"))
+
+SESSIONS_OVER_BUDGET = Counter(
+    "sessions_over_budget_total", "Session saves whose encoding exceeded SESSION_BYTE_BUDGET"
+)
+SESSIONS_SWEPT = Counter("sessions_swept_total", "Idle sessions deleted by the sweeper")
+SESSION_STORE_SESSIONS = Gauge("session_store_sessions", "Sessions in the store at the last sweep")
+SESSION_STORE_BYTES = Gauge("session_store_bytes", "Encoded bytes held by the store at the last sweep")
+
+
+class _Coded:
+    """
+    Descriptor exposing a small-int slot as its label.
+
+    Nullable fields reserve code 0 for None and number labels from 1.
+    """
+
+    def __init__(self, labels: Tuple[str, ...], nullable: bool = True):
+        self.labels = (None,) + labels if nullable else labels
+        self.codes = {label: i for i, label in enumerate(self.labels)}
+
+    def __set_name__(self, owner, name):
+        self.slot = "_" + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return self.labels[getattr(obj, self.slot)]
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, self.codes[value])
+
+
+class _MappingAccess:
+    """Dict-style access so agent code can keep using state["key"]."""
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    def __getitem__(self, key: str):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fields
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {}
+        for field in self._fields:
+            value = getattr(self, field)
+            if isinstance(value, _MappingAccess):
+                value = value.to_dict()
+            elif isinstance(value, tuple):
+                value = list(value)
+            result[field] = value
+        return result
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+
+class Preferences(_MappingAccess):
+    """User search preferences with categorical values held as small ints."""
+    __slots__ = (
+        "_type", "location", "bedrooms", "bathrooms", "budget", "_budget_currency",
+        "area_m2", "floor", "_purpose", "_compound", "_finishing", "_finishing_type",
+        "_services", "other_features"
+    )
+    _fields = (
+        "type", "location", "bedrooms", "bathrooms", "budget", "budget_currency",
+        "area_m2", "floor", "purpose", "compound", "finishing", "finishing_type",
+        "services", "other_features"
+    )
+
+    type = _Coded(PROPERTY_TYPES)
+    budget_currency = _Coded(CURRENCIES)  # Currency the budget was quoted in, if stated
+    purpose = _Coded(PURPOSES)  # For rent or sale
+    compound = _Coded(COMPOUND_ANSWERS)  # In a compound or not
+    finishing = _Coded(FINISHINGS)
+    finishing_type = _Coded(FINISHING_TYPES)  # Type of finishing if applicable
+
+    def __init__(self):
+        self._type = 0
+        self.location: Optional[str] = None
+        self.bedrooms: Optional[int] = None
+        self.bathrooms: Optional[int] = None
+        self.budget: Optional[float] = None
+        self._budget_currency = 0
+        self.area_m2: Optional[int] = None
+        self.floor: Optional[int] = None
+        self._purpose = 0
+        self._compound = 0
+        self._finishing = 0
+        self._finishing_type = 0
+        self._services = 0
+        self.other_features: List[str] = []
+
+    @property
+    def services(self) -> Tuple[str, ...]:
+        """Requested services in the order they are defined in SERVICES."""
+        return tuple(name for bit, name in enumerate(SERVICES) if self._services & (1 << bit))
+
+    @services.setter
+    def services(self, values) -> None:
+        self._services = 0
+        for value in values:
+            self.add_service(value)
+
+    def add_service(self, service: str) -> bool:
+        """
+        Mark a service as requested.
+
+        Returns:
+            True if the service was not already requested
+        """
+        bit = 1 << SERVICES.index(service)
+        if self._services & bit:
+            return False
+        self._services |= bit
+        return True
+
+
+class UserInfo(_MappingAccess):
+    """Contact details collected during the conversation."""
+    __slots__ = ("name", "phone", "email")
+    _fields = ("name", "phone", "email")
+
+    def __init__(self):
+        self.name: Optional[str] = None
+        self.phone: Optional[str] = None
+        self.email: Optional[str] = None
+
+
+class SessionState(_MappingAccess):
+    """Per-conversation state of the real estate agent."""
+    __slots__ = (
+        "preferences", "user_info", "_conversation_stage", "shown_properties",
+        "current_property", "selected_property_index", "negotiation_attempts",
+        "question_flow_index", "asked_finishing_type", "asked_services",
+        "_last_question_asked", "sales_pitch_stage", "used_sales_arguments",
+        "asked_questions", "_dialect"
+    )
+    _fields = (
+        "preferences", "user_info", "conversation_stage", "shown_properties",
+        "current_property", "selected_property_index", "negotiation_attempts",
+        "question_flow_index", "asked_finishing_type", "asked_services",
+        "last_question_asked", "sales_pitch_stage", "used_sales_arguments",
+        "asked_questions", "dialect"
+    )
+
+    conversation_stage = _Coded(STAGES, nullable=False)
+    last_question_asked = _Coded(QUESTION_KEYS)  # Track the last question asked
+    dialect = _Coded(DIALECTS)  # Detected or chosen for this chat; None until known
+
+    def __init__(self):
+        self.preferences = Preferences()
+        self.user_info = UserInfo()
+        self._conversation_stage = Stage.GREETING
+        self.shown_properties = array("i")
+        self.current_property: Optional[Dict[str, Any]] = None
+        self.selected_property_index = 0  # Index of the property the user selected (1 or 2)
+        self.negotiation_attempts = 0
+        self.question_flow_index = 0  # To control the flow of questions
+        self.asked_finishing_type = False
+        self.asked_services = False
+        self._last_question_asked = 0
+        self.sales_pitch_stage = 0  # Track which sales pitch stage we're in
+        self.used_sales_arguments = 0  # Bitmask of indices into the agent's sales arguments
+        self.asked_questions = 0  # Bitmask of QUESTION_KEYS indices already asked
+        self._dialect = 0
+
+    @property
+    def stage(self) -> Stage:
+        return Stage(self._conversation_stage)
+
+    def remember_shown(self, property_id: int) -> None:
+        """Record a shown listing, forgetting the oldest beyond MAX_SHOWN_PROPERTIES."""
+        self.shown_properties.append(property_id)
+        if len(self.shown_properties) > MAX_SHOWN_PROPERTIES:
+            del self.shown_properties[:len(self.shown_properties) - MAX_SHOWN_PROPERTIES]
+
+    def to_bytes(self, catalogue_version: int = 0) -> bytes:
+        """Serialize the session into the compact binary session-store format."""
+        return encode_session(self, catalogue_version)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, resolve_property: Optional["PropertyResolver"] = None) -> "SessionState":
+        """Rebuild a session from bytes produced by to_bytes()."""
+        return decode_session(data, resolve_property)
+
+
+# Binary format (version 5)
+#
+#   header   B version, I catalogue version
+#   fixed    session counters, coded preferences and numeric preferences;
+#            the flags byte holds asked_finishing_type (bit 0), asked_services
+#            (bit 1) and the dialect code (bits 2-3)
+#   strings  location, name, phone, email (H length, 0xFFFF for None)
+#   lists    other_features, shown_properties (packed int32)
+#
+# Strings and lists are cut to MAX_TEXT_BYTES, MAX_OTHER_FEATURES and
+# MAX_SHOWN_PROPERTIES (keeping the newest entries), so a session encodes to
+# a bounded size however long the chat.
+#   tail     Q used_sales_arguments bitmask, H asked_questions bitmask,
+#            i current_property id (-1 for None)
+#
+# Version 1 stored current_property as a JSON blob and tagged the header with
+# the version only. Version 2 had no budget currency. Versions 1-3 stored the
+# used sales arguments as their (personalized) texts, which are dropped on
+# decoding. Versions before 5 did not record which questions were asked; the
+# ones before the question flow index are assumed asked. The dialect bits
+# are zero in sessions written before they existed, so those decode with no
+# dialect. All versions are still accepted by decode_session().
+
+FORMAT_VERSION = 5
+
+_VERSION = struct.Struct("<B")
+_HEADER = struct.Struct("<BI")
+_FIXED = struct.Struct("<BBBHBHB" "BBBBBBB" "qqqqd")
+_FIXED_V2 = struct.Struct("<BBBHBHB" "BBBBBB" "qqqqd")
+_LENGTH = struct.Struct("<H")
+_BLOB_LENGTH = struct.Struct("<I")
+_PROPERTY_ID = struct.Struct("<i")
+_ARGUMENT_MASK = struct.Struct("<Q")
+_QUESTION_MASK = struct.Struct("<H")
+_NONE_LENGTH = 0xFFFF
+_NONE_BLOB = 0xFFFFFFFF
+_NONE_PROPERTY = -1
+_NONE_INT = -(2 ** 63)
+_INT_MAX = 2 ** 63 - 1
+_SWAP_BYTES = sys.byteorder != "little"
+
+# Looks up a catalogue row by property id: (property_id, catalogue_version) -> row dict
+PropertyResolver = Callable[[int, int], Optional[Dict[str, Any]]]
+
+
+def _pack_int(value: Optional[int]) -> int:
+    # Values outside int64 only come from nonsense input (e.g. a phone number
+    # read as a bedroom count), so clamping them is harmless.
+    if value is None:
+        return _NONE_INT
+    return max(_NONE_INT + 1, min(_INT_MAX, int(value)))
+
+
+def _unpack_int(value: int) -> Optional[int]:
+    return None if value == _NONE_INT else value
+
+
+def _pack_str(parts: List[bytes], value: Optional[str]) -> None:
+    if value is None:
+        parts.append(_LENGTH.pack(_NONE_LENGTH))
+        return
+    encoded = value.encode("utf-8")
+    if len(encoded) > MAX_TEXT_BYTES:
+        # Cut on a character boundary
+        encoded = encoded[:MAX_TEXT_BYTES].decode("utf-8", errors="ignore").encode("utf-8")
+    parts.append(_LENGTH.pack(len(encoded)))
+    parts.append(encoded)
+
+
+def _unpack_str(data: bytes, offset: int) -> Tuple[Optional[str], int]:
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    if length == _NONE_LENGTH:
+        return None, offset
+    if offset + length > len(data):
+        raise ValueError("Truncated session data: string runs past the end")
+    return data[offset:offset + length].decode("utf-8", errors="ignore"), offset + length
+
+
+def _pack_str_list(parts: List[bytes], values: List[str]) -> None:
+    values = values[-MAX_OTHER_FEATURES:]
+    parts.append(_LENGTH.pack(len(values)))
+    for value in values:
+        _pack_str(parts, value)
+
+
+def _unpack_str_list(data: bytes, offset: int) -> Tuple[List[str], int]:
+    (count,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    values = []
+    for _ in range(count):
+        value, offset = _unpack_str(data, offset)
+        values.append(value)
+    return values, offset
+
+
+def _pack_ids(parts: List[bytes], ids) -> None:
+    packed = array("i", ids[-MAX_SHOWN_PROPERTIES:])
+    if _SWAP_BYTES:
+        packed.byteswap()
+    parts.append(_LENGTH.pack(len(packed)))
+    parts.append(packed.tobytes())
+
+
+def _unpack_ids(data: bytes, offset: int) -> Tuple[array, int]:
+    (count,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    end = offset + 4 * count
+    if end > len(data):
+        raise ValueError("Truncated session data: id array runs past the end")
+    ids = array("i")
+    ids.frombytes(data[offset:end])
+    if _SWAP_BYTES:
+        ids.byteswap()
+    return ids, end
+
+
+def _property_id(current_property: Optional[Dict[str, Any]]) -> int:
+    if not current_property or "id" not in current_property:
+        return _NONE_PROPERTY
+    return int(current_property["id"])
+
+
+def encode_session(state: SessionState, catalogue_version: int = 0) -> bytes:
+    """
+    Encode a session state into bytes.
+
+    Args:
+        state: The session to encode
+        catalogue_version: Version of the catalogue current_property refers to
+
+    Returns:
+        Compact binary representation of the session
+    """
+    prefs = state.preferences
+    flags = (1 if state.asked_finishing_type else 0) | (2 if state.asked_services else 0) | (state._dialect << 2)
+    budget = math.nan if prefs.budget is None else float(prefs.budget)
+
+    parts = [
+        _HEADER.pack(FORMAT_VERSION, catalogue_version & 0xFFFFFFFF),
+        _FIXED.pack(
+            state._conversation_stage, state._last_question_asked,
+            min(state.selected_property_index, 0xFF), min(state.negotiation_attempts, 0xFFFF),
+            min(state.question_flow_index, 0xFF), min(state.sales_pitch_stage, 0xFFFF), flags,
+            prefs._type, prefs._purpose, prefs._compound, prefs._finishing,
+            prefs._finishing_type, prefs._services, prefs._budget_currency,
+            _pack_int(prefs.bedrooms), _pack_int(prefs.bathrooms),
+            _pack_int(prefs.area_m2), _pack_int(prefs.floor), budget
+        )
+    ]
+    _pack_str(parts, prefs.location)
+    _pack_str(parts, state.user_info.name)
+    _pack_str(parts, state.user_info.phone)
+    _pack_str(parts, state.user_info.email)
+    _pack_str_list(parts, prefs.other_features)
+    _pack_ids(parts, state.shown_properties)
+    parts.append(_ARGUMENT_MASK.pack(state.used_sales_arguments & 0xFFFFFFFFFFFFFFFF))
+    parts.append(_QUESTION_MASK.pack(state.asked_questions & 0xFFFF))
+    parts.append(_PROPERTY_ID.pack(_property_id(state.current_property)))
+
+    return b"".join(parts)
+
+
+def decode_session(data: bytes, resolve_property: Optional[PropertyResolver] = None) -> SessionState:
+    """
+    Decode bytes produced by encode_session().
+
+    Args:
+        data: Encoded session
+        resolve_property: Looks up current_property from its id; without it
+            current_property is restored as {"id": ...}
+
+    Returns:
+        The decoded SessionState
+
+    Raises:
+        ValueError: If the data is malformed or uses an unknown format version
+    """
+    try:
+        (version,) = _VERSION.unpack_from(data, 0)
+        if version == 1:
+            catalogue_version = 0
+            offset = _VERSION.size
+        elif 2 <= version <= FORMAT_VERSION:
+            _, catalogue_version = _HEADER.unpack_from(data, 0)
+            offset = _HEADER.size
+        else:
+            raise ValueError(f"Unsupported session format version: {version}")
+
+        fixed = _FIXED if version >= 3 else _FIXED_V2
+        values = fixed.unpack_from(data, offset)
+        offset += fixed.size
+        if version < 3:
+            # No budget currency before version 3
+            values = values[:13] + (0,) + values[13:]
+
+        state = SessionState()
+        prefs = state.preferences
+        (state._conversation_stage, state._last_question_asked,
+         state.selected_property_index, state.negotiation_attempts,
+         state.question_flow_index, state.sales_pitch_stage, flags,
+         prefs._type, prefs._purpose, prefs._compound, prefs._finishing,
+         prefs._finishing_type, prefs._services, prefs._budget_currency,
+         bedrooms, bathrooms, area_m2, floor, budget) = values
+
+        if (state._conversation_stage >= len(STAGES)
+                or state._last_question_asked > len(QUESTION_KEYS)
+                or prefs._type > len(PROPERTY_TYPES) or prefs._purpose > len(PURPOSES)
+                or prefs._compound > len(COMPOUND_ANSWERS) or prefs._finishing > len(FINISHINGS)
+                or prefs._finishing_type > len(FINISHING_TYPES)
+                or prefs._budget_currency > len(CURRENCIES)
+                or prefs._services >> len(SERVICES)
+                or flags >> 2 > len(DIALECTS)):
+            raise ValueError("Invalid session data: code out of range")
+
+        state.asked_finishing_type = bool(flags & 1)
+        state.asked_services = bool(flags & 2)
+        state._dialect = flags >> 2
+        prefs.bedrooms = _unpack_int(bedrooms)
+        prefs.bathrooms = _unpack_int(bathrooms)
+        prefs.area_m2 = _unpack_int(area_m2)
+        prefs.floor = _unpack_int(floor)
+        prefs.budget = None if math.isnan(budget) else budget
+
+        prefs.location, offset = _unpack_str(data, offset)
+        state.user_info.name, offset = _unpack_str(data, offset)
+        state.user_info.phone, offset = _unpack_str(data, offset)
+        state.user_info.email, offset = _unpack_str(data, offset)
+        prefs.other_features, offset = _unpack_str_list(data, offset)
+
+        if version == 1:
+            (count,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            state.shown_properties = array("i", struct.unpack_from(f"<{count}q", data, offset))
+            offset += 8 * count
+            _, offset = _unpack_str_list(data, offset)
+            (blob_length,) = _BLOB_LENGTH.unpack_from(data, offset)
+            offset += _BLOB_LENGTH.size
+            property_id = _NONE_PROPERTY
+            if blob_length != _NONE_BLOB:
+                property_id = _property_id(json.loads(data[offset:offset + blob_length].decode("utf-8")))
+                offset += blob_length
+        else:
+            state.shown_properties, offset = _unpack_ids(data, offset)
+            if version >= 4:
+                (state.used_sales_arguments,) = _ARGUMENT_MASK.unpack_from(data, offset)
+                offset += _ARGUMENT_MASK.size
+            else:
+                _, offset = _unpack_str_list(data, offset)
+            if version >= 5:
+                (state.asked_questions,) = _QUESTION_MASK.unpack_from(data, offset)
+                offset += _QUESTION_MASK.size
+                if state.asked_questions >> len(QUESTION_KEYS):
+                    raise ValueError("Invalid session data: code out of range")
+            (property_id,) = _PROPERTY_ID.unpack_from(data, offset)
+            offset += _PROPERTY_ID.size
+    except (struct.error, UnicodeDecodeError, json.JSONDecodeError, OverflowError) as e:
+        raise ValueError(f"Malformed session data: {str(e)}")
+
+    if offset != len(data):
+        raise ValueError("Malformed session data: trailing bytes")
+
+    if version < 5:
+        # The fixed question order had asked everything before the flow index
+        state.asked_questions = (1 << min(state.question_flow_index, len(QUESTION_KEYS))) - 1
+
+    if property_id != _NONE_PROPERTY:
+        if resolve_property is None:
+            state.current_property = {"id": property_id}
+        else:
+            state.current_property = resolve_property(property_id, catalogue_version)
+
+    return state
+
+
+def deep_sizeof(obj, _seen=None) -> int:
+    """
+    Approximate the memory held by an object, following containers and slots.
+
+    Args:
+        obj: Object to measure
+
+    Returns:
+        Size in bytes
+    """
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, _seen) + deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, _seen) for item in obj)
+    elif hasattr(obj, "__slots__") and not isinstance(obj, (str, bytes, int, float)):
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, "__slots__", ()):
+                if hasattr(obj, slot):
+                    size += deep_sizeof(getattr(obj, slot), _seen)
+    return size
+
+
+class SessionStore:
+    """In-memory store of encoded sessions keyed by chat id."""
+
+    def __init__(self):
+        self._sessions: Dict[int, bytes] = {}
+        self._touched: Dict[int, float] = {}  # Chat id -> time.time() of its last load or save
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.catalogue_version = 0
+        self.resolve_property: Optional[PropertyResolver] = None
+
+    def bind_catalogue(self, catalogue_version: int, resolve_property: PropertyResolver) -> None:
+        """Set the catalogue that stored property ids refer to."""
+        self.catalogue_version = catalogue_version
+        self.resolve_property = resolve_property
+
+    def _read(self, chat_id: int) -> Optional[bytes]:
+        with self._lock:
+            data = self._sessions.get(chat_id)
+            if data is not None:
+                self._touched[chat_id] = time.time()
+            return data
+
+    def _write(self, chat_id: int, data: bytes) -> None:
+        with self._lock:
+            self._sessions[chat_id] = data
+            self._touched[chat_id] = time.time()
+
+    def _delete_idle(self, max_idle: float) -> int:
+        cutoff = time.time() - max_idle
+        with self._lock:
+            idle = [chat_id for chat_id, touched in self._touched.items() if touched < cutoff]
+            for chat_id in idle:
+                del self._sessions[chat_id]
+                del self._touched[chat_id]
+        return len(idle)
+
+    def load(self, chat_id: int) -> SessionState:
+        """Return the session for a chat, or a fresh one if none is stored."""
+        data = self._read(chat_id)
+        if data is None:
+            return SessionState()
+        try:
+            return decode_session(data, self.resolve_property)
+        except ValueError as e:
+            print(f"[ERROR] Dropping unreadable session for chat {chat_id}: {str(e)}")
+            return SessionState()
+
+    def encode(self, chat_id: int, state: SessionState) -> bytes:
+        """Encode the session for a chat, reporting it if it is over SESSION_BYTE_BUDGET."""
+        data = encode_session(state, self.catalogue_version)
+        if len(data) > SESSION_BYTE_BUDGET:
+            SESSIONS_OVER_BUDGET.inc()
+            print(f"[WARNING] Session for chat {chat_id} is {len(data)} bytes, "
+                  f"over the {SESSION_BYTE_BUDGET} byte budget")
+        return data
+
+    def save(self, chat_id: int, state: SessionState) -> None:
+        """Store the session for a chat."""
+        self._write(chat_id, self.encode(chat_id, state))
+
+    def sweep(self, max_idle: float = SESSION_IDLE_SECONDS) -> int:
+        """
+        Delete the sessions idle for longer than max_idle seconds and refresh
+        the store gauges.
+
+        Returns:
+            Number of sessions deleted
+        """
+        self._last_sweep = time.monotonic()
+        removed = self._delete_idle(max_idle) if max_idle > 0 else 0
+        if removed:
+            SESSIONS_SWEPT.inc(amount=removed)
+            print(f"[INFO] Swept {removed} idle sessions")
+        SESSION_STORE_SESSIONS.set(len(self))
+        SESSION_STORE_BYTES.set(self.total_bytes())
+        return removed
+
+    def sweep_if_due(self) -> int:
+        """Sweep when SESSION_SWEEP_INTERVAL has passed since the last sweep; cheap otherwise."""
+        if time.monotonic() - self._last_sweep < SESSION_SWEEP_INTERVAL:
+            return 0
+        return self.sweep()
+
+    def largest(self, limit: int = 10) -> List[Tuple[int, int]]:
+        """The limit largest sessions as (chat id, encoded bytes), largest first."""
+        with self._lock:
+            sizes = [(chat_id, len(data)) for chat_id, data in self._sessions.items()]
+        return heapq.nlargest(max(limit, 0), sizes, key=lambda item: item[1])
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def total_bytes(self) -> int:
+        """Total size of the encoded sessions held by the store."""
+        with self._lock:
+            return sum(len(data) for data in self._sessions.values())
+
+
+class DatabaseSessionStore(SessionStore):
+    """
+    Session store backed by a table, so any worker can continue a chat.
+
+    save() and sweep() only stage their changes; they are written by the
+    caller's next commit.
+    """
+
+    def __init__(self, db, model):
+        super().__init__()
+        self.db = db
+        self.model = model
+
+    def _read(self, chat_id: int) -> Optional[bytes]:
+        row = self.db.session.get(self.model, chat_id)
+        return row.state if row is not None else None
+
+    def _write(self, chat_id: int, data: bytes) -> None:
+        row = self.db.session.get(self.model, chat_id)
+        if row is None:
+            self.db.session.add(self.model(chat_id=chat_id, state=data))
+        else:
+            row.state = data
+
+    def __len__(self) -> int:
+        return self.db.session.query(self.model).count()
+
+    def total_bytes(self) -> int:
+        return int(self.db.session.query(self.db.func.sum(self.db.func.length(self.model.state))).scalar() or 0)
+
+    def _delete_idle(self, max_idle: float) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=max_idle)
+        return self.db.session.query(self.model).filter(self.model.updated_at < cutoff).delete(synchronize_session=False)
+
+    def largest(self, limit: int = 10) -> List[Tuple[int, int]]:
+        size = self.db.func.length(self.model.state)
+        rows = self.db.session.query(self.model.chat_id, size).order_by(size.desc()).limit(max(limit, 0))
+        return [(chat_id, int(length)) for chat_id, length in rows]
+
+
+if __name__ == "__main__":
+    import timeit
+
+    # Report the footprint of a typical mid-conversation session
+    state = SessionState()
+    state.conversation_stage = "recommending"
+    state.last_question_asked = "ask_bathrooms"
+    state.preferences.type = "شقة"
+    state.preferences.location = "Cairo"
+    state.preferences.purpose = "للشراء"
+    state.preferences.budget = 5000000.0
+    state.preferences.bedrooms = 3
+    state.preferences.add_service("أمن")
+    state.shown_properties.extend([12, 47])
+    state.current_property = {"id": 12}
+    state.question_flow_index = 12
+
+    legacy = state.to_dict()
+    legacy["shown_properties"] = list(legacy["shown_properties"])
+    print(f"dict layout:      {deep_sizeof(legacy):6d} bytes")
+    print(f"SessionState:     {deep_sizeof(state):6d} bytes")
+    print(f"encoded:          {len(state.to_bytes()):6d} bytes")
+
+    data = state.to_bytes()
+    rounds = 20000
+    encode_us = timeit.timeit(state.to_bytes, number=rounds) / rounds * 1e6
+    decode_us = timeit.timeit(lambda: decode_session(data), number=rounds) / rounds * 1e6
+    print(f"encode:           {encode_us:6.1f} us")
+    print(f"decode:           {decode_us:6.1f} us")
@@ -0,0 +1,235 @@
+import importlib
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional
+
+import sales_pitch
+from metrics import Counter, Gauge, Histogram, suppressed as metrics_suppressed
+from session_state import PropertyResolver, SessionState, decode_session, encode_session
+
+# Set SHADOW_ENGINE=module:Class to replay a sample of live chat turns on
+# another agent implementation; the shadow's replies are never sent
+ENGINE = os.environ.get("SHADOW_ENGINE", "")
+# Fraction of turns replayed
+SAMPLE_RATE = float(os.environ.get("SHADOW_SAMPLE_RATE", "0.05"))
+# Sampled turns waiting for the shadow agent; when full, new ones are dropped
+QUEUE_SIZE = int(os.environ.get("SHADOW_QUEUE_SIZE", "64"))
+# Divergent turns kept for /admin/shadow
+DIFF_RING_SIZE = int(os.environ.get("SHADOW_DIFF_RING_SIZE", "50"))
+
+SHADOW_TURNS = Counter(
+    "shadow_turns_total", "Sampled chat turns by shadow outcome (match, reply_diff, state_diff, error, dropped)", ("outcome",)
+)
+SHADOW_TURN_SECONDS = Histogram(
+    "shadow_turn_seconds", "process_input time of sampled turns on the primary and the shadow agent", ("agent",)
+)
+SHADOW_QUEUE_DEPTH = Gauge("shadow_queue_depth", "Sampled turns waiting for the shadow agent")
+
+
+class ShadowTurn(NamedTuple):
+    """One sampled turn as the primary agent handled it."""
+    chat_id: int
+    message: str
+    dialect: str
+    state: bytes  # Encoded session before the turn
+    reply: str
+    state_after: bytes  # Encoded session after the turn
+    seconds: float  # Primary process_input time
+    held: FrozenSet[int] = frozenset()  # Listings held by other chats when the turn started
+
+
+class _HeldSnapshot:
+    """The listing holds a primary turn saw, for the shadow agent to read; never changes."""
+
+    def __init__(self, held: FrozenSet[int]):
+        self.held = held
+
+    def held_ids(self, chat_id: Optional[int] = None) -> FrozenSet[int]:
+        return self.held
+
+    def is_held(self, property_id: int, chat_id: Optional[int] = None) -> bool:
+        return property_id in self.held
+
+
+def _comparable(state: SessionState) -> Dict[str, Any]:
+    """Session fields by dotted name, with the current property reduced to its id."""
+    fields = {}
+    for key, value in state.to_dict().items():
+        if isinstance(value, dict) and key != "current_property":
+            fields.update({f"{key}.{name}": item for name, item in value.items()})
+        elif key == "current_property":
+            fields[key] = value.get("id") if value else None
+        else:
+            fields[key] = list(value) if key == "shown_properties" else value
+    return fields
+
+
+class ShadowRunner:
+    """
+    Replays sampled turns on a second agent in a background thread.
+
+    The request thread only encodes the session before and after a sampled
+    turn and offers it to a bounded queue without waiting, so a slow or
+    failing shadow never delays or breaks a reply. The shadow agent is built
+    on the worker thread when the first turn arrives. Shadow turns record
+    only the shadow_* metrics. The shadow skips the listings that were held
+    when the primary turn started, and picks sales arguments with the same
+    seed as the primary (pitch_seed, which the primary agent must be given).
+    """
+
+    def __init__(self, engine_class, properties_df, resolve_property: Optional[PropertyResolver],
+                 catalogue_version: int, sample_rate: float = SAMPLE_RATE, queue_size: int = QUEUE_SIZE,
+                 pitch_seed: Optional[str] = None):
+        self.engine_class = engine_class
+        self.engine = f"{engine_class.__module__}:{engine_class.__name__}"
+        self.properties_df = properties_df
+        self.resolve_property = resolve_property
+        self.catalogue_version = catalogue_version
+        # Without SALES_PITCH_SEED each agent would pick its own random arguments
+        self.pitch_seed = pitch_seed or sales_pitch.SEED or os.urandom(8).hex()
+        self.sample_rate = sample_rate
+        self.queue_size = queue_size
+        self.diffs = deque(maxlen=DIFF_RING_SIZE)
+        self.disabled_reason: Optional[str] = None
+        self._rng = random.Random()
+        self._lock = threading.Lock()
+        self._queue: Optional[queue.Queue] = None
+        self._pid: Optional[int] = None
+        self._compared = 0
+        self._primary_seconds = 0.0
+        self._shadow_seconds = 0.0
+
+    def sampled(self) -> bool:
+        """Whether to shadow the turn about to run."""
+        return self.disabled_reason is None and self._rng.random() < self.sample_rate
+
+    def submit(self, turn: ShadowTurn) -> bool:
+        """
+        Offer a turn to the shadow agent without blocking.
+
+        Returns:
+            False if the queue is full (the turn is dropped) or shadowing is disabled
+        """
+        if self.disabled_reason is not None:
+            return False
+        turns = self._ensure_worker()
+        try:
+            turns.put_nowait(turn)
+        except queue.Full:
+            SHADOW_TURNS.inc("dropped")
+            return False
+        SHADOW_QUEUE_DEPTH.set(turns.qsize())
+        return True
+
+    def _ensure_worker(self) -> queue.Queue:
+        # Threads do not survive fork; each process starts its own worker on first use
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=self.queue_size)
+                    threading.Thread(target=self._run, args=(self._queue,), name="shadow-agent", daemon=True).start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def _run(self, turns: queue.Queue) -> None:
+        agent = None
+        while True:
+            turn = turns.get()
+            SHADOW_QUEUE_DEPTH.set(turns.qsize())
+            if agent is None:
+                try:
+                    with metrics_suppressed():
+                        agent = self.engine_class(self.properties_df, dialect=turn.dialect)
+                    if getattr(agent, "pitch_engine", None) is not None:
+                        agent.pitch_engine.seed = self.pitch_seed
+                except Exception as e:
+                    self.disabled_reason = f"Could not build {self.engine}: {str(e)}"
+                    print(f"[ERROR] Shadow execution disabled. {self.disabled_reason}")
+                    return
+            try:
+                self._compare(agent, turn)
+            except Exception as e:
+                SHADOW_TURNS.inc("error")
+                print(f"[ERROR] Shadow agent failed on chat {turn.chat_id}: {str(e)}")
+                self.diffs.append({"chat_id": turn.chat_id, "message": turn.message, "error": str(e)})
+
+    def _compare(self, agent, turn: ShadowTurn) -> None:
+        agent.set_dialect(turn.dialect)
+        agent.session_state = decode_session(turn.state, self.resolve_property)
+        agent.listing_holds = _HeldSnapshot(turn.held)
+        agent.current_chat_id = turn.chat_id
+        started = time.perf_counter()
+        # The agent's own metrics would count the turn a second time
+        with metrics_suppressed():
+            reply = agent.process_input(turn.message)
+        seconds = time.perf_counter() - started
+
+        SHADOW_TURN_SECONDS.observe(turn.seconds, "primary")
+        SHADOW_TURN_SECONDS.observe(seconds, "shadow")
+        with self._lock:
+            self._compared += 1
+            self._primary_seconds += turn.seconds
+            self._shadow_seconds += seconds
+
+        state_matches = encode_session(agent.session_state, self.catalogue_version) == turn.state_after
+        if reply == turn.reply and state_matches:
+            SHADOW_TURNS.inc("match")
+            return
+        SHADOW_TURNS.inc("reply_diff" if reply != turn.reply else "state_diff")
+
+        changed = {}
+        if not state_matches:
+            primary = _comparable(decode_session(turn.state_after, self.resolve_property))
+            shadow = _comparable(agent.session_state)
+            changed = {key: {"primary": primary[key], "shadow": shadow.get(key)}
+                       for key in primary if primary[key] != shadow.get(key)}
+        self.diffs.append({
+            "chat_id": turn.chat_id,
+            "message": turn.message,
+            "primary_reply": turn.reply,
+            "shadow_reply": reply if reply != turn.reply else None,
+            "state_changes": changed,
+            "primary_ms": turn.seconds * 1000,
+            "shadow_ms": seconds * 1000,
+        })
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            compared = self._compared
+            primary_ms = self._primary_seconds * 1000 / compared if compared else 0.0
+            shadow_ms = self._shadow_seconds * 1000 / compared if compared else 0.0
+        return {
+            "pid": os.getpid(),
+            "engine": self.engine,
+            "sample_rate": self.sample_rate,
+            "queue_size": self.queue_size,
+            "queued": self._queue.qsize() if self._queue is not None and self._pid == os.getpid() else 0,
+            "disabled_reason": self.disabled_reason,
+            "compared": compared,
+            "outcomes": {outcome: SHADOW_TURNS.value(outcome)
+                         for outcome in ("match", "reply_diff", "state_diff", "error", "dropped")},
+            "mean_primary_ms": primary_ms,
+            "mean_shadow_ms": shadow_ms,
+            "mean_latency_delta_ms": shadow_ms - primary_ms,
+        }
+
+    def recent_diffs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent divergent turns, newest first."""
+        return list(self.diffs)[::-1][:max(limit, 0)]
+
+
+def from_env(properties_df, resolve_property: Optional[PropertyResolver], catalogue_version: int) -> Optional[ShadowRunner]:
+    """A runner for SHADOW_ENGINE (module:Class), or None when shadowing is off."""
+    if not ENGINE or SAMPLE_RATE <= 0:
+        return None
+    module_name, _, class_name = ENGINE.partition(":")
+    try:
+        engine_class = getattr(importlib.import_module(module_name), class_name or "ArabicRealEstateAgent")
+    except (ImportError, AttributeError) as e:
+        print(f"[ERROR] Shadow execution disabled, cannot load {ENGINE}: {str(e)}")
+        return None
+    return ShadowRunner(engine_class, properties_df, resolve_property, catalogue_version)
@@ -0,0 +1,50 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+# Set STARTUP_PROFILE=1 to log the time spent in each startup phase
+ENABLED = os.environ.get("STARTUP_PROFILE", "0") == "1"
+
+_process_started = time.perf_counter()
+_phases: List[Tuple[str, float]] = []
+
+
+@contextmanager
+def phase(name: str):
+    """Time a startup phase (an import block, table creation, catalogue load...)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, (time.perf_counter() - started) * 1000))
+
+
+def get_phases() -> List[Tuple[str, float]]:
+    """Recorded phases as (name, milliseconds), in the order they ran."""
+    return list(_phases)
+
+
+def format_report() -> str:
+    """Render the recorded phases as a table."""
+    lines = ["Startup profile:"]
+    for name, elapsed_ms in _phases:
+        lines.append(f"  {name:<28} {elapsed_ms:9.1f} ms")
+    lines.append(f"  {'total (phases)':<28} {sum(ms for _, ms in _phases):9.1f} ms")
+    lines.append(f"  {'since profiler import':<28} {(time.perf_counter() - _process_started) * 1000:9.1f} ms")
+    return "\n".join(lines)
+
+
+def report(logger) -> None:
+    """Log the startup profile when STARTUP_PROFILE is enabled."""
+    if ENABLED:
+        logger.info(format_report())
+
+
+if __name__ == "__main__":
+    # Cold-start measurement: import the app and force the deferred catalogue load.
+    # Phases are recorded by the imported module, not by this __main__ copy.
+    import app
+    import startup_profile
+    app.get_agent()
+    print(startup_profile.format_report())
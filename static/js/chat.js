@@ -3,9 +3,17 @@
 let currentChatId = null;
 let isTyping = false;
 
+// WebSocket transport; the HTTP API is used whenever the socket is not open
+let socket = null;
+let socketOpen = false;
+let lastMessageId = 0;
+let greetingShown = false;
+let reconnectDelay = 1000;
+const MAX_RECONNECT_DELAY = 30000;
+
 document.addEventListener('DOMContentLoaded', function() {
-    // Load initial greeting message
-    loadInitialGreeting();
+    // Connect the chat socket; it delivers the greeting, or falls back to loading it over HTTP
+    connectSocket();
     
     // Set up event listeners
     const sendButton = document.getElementById('send-button');
@@ -26,12 +34,106 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+// Open the chat socket, resuming the current chat after a reconnect
+function connectSocket() {
+    if (!('WebSocket' in window)) {
+        loadInitialGreeting();
+        return;
+    }
+    
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    let opened = false;
+    socket = new WebSocket(`${protocol}//${window.location.host}/ws/chat`);
+    
+    socket.addEventListener('open', function() {
+        opened = true;
+        socketOpen = true;
+        reconnectDelay = 1000;
+        socket.send(JSON.stringify({
+            type: 'hello',
+            chat_id: currentChatId,
+            last_message_id: lastMessageId
+        }));
+    });
+    
+    socket.addEventListener('message', function(event) {
+        handleSocketEvent(JSON.parse(event.data));
+    });
+    
+    socket.addEventListener('close', function() {
+        socketOpen = false;
+        socket = null;
+        if (!opened) {
+            // No WebSocket endpoint on this server: stay on HTTP
+            if (!greetingShown) {
+                loadInitialGreeting();
+            }
+            return;
+        }
+        setTimeout(connectSocket, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, MAX_RECONNECT_DELAY);
+    });
+}
+
+// Send an event over the socket; returns false if it is not open
+function sendSocketEvent(event) {
+    if (!socketOpen) return false;
+    socket.send(JSON.stringify(event));
+    return true;
+}
+
+// Handle an event received on the chat socket
+function handleSocketEvent(data) {
+    if (data.chat_id && !currentChatId) {
+        currentChatId = data.chat_id;
+    }
+    
+    switch (data.type) {
+        case 'ready':
+            // Replies that arrived while we were disconnected
+            data.messages.forEach(msg => {
+                lastMessageId = Math.max(lastMessageId, msg.id);
+                if (!msg.is_user) {
+                    addMessage(msg.content, false);
+                }
+            });
+            break;
+        case 'message':
+            if (!data.message_id) {
+                // Greeting; sent again on every reconnect before the first message
+                if (greetingShown) break;
+                greetingShown = true;
+            } else {
+                lastMessageId = Math.max(lastMessageId, data.message_id);
+            }
+            hideTypingIndicator();
+            addMessage(data.message, false);
+            if (data.message_id) {
+                updateLastMessage(data.message);
+            }
+            break;
+        case 'typing':
+            if (data.state) {
+                showTypingIndicator();
+            } else {
+                hideTypingIndicator();
+            }
+            break;
+        case 'dialect':
+        case 'error':
+            hideTypingIndicator();
+            addMessage(data.message, false);
+            break;
+    }
+}
+
 // Load the initial greeting message from the AI
 function loadInitialGreeting() {
     fetch('/api/initial-message')
         .then(response => response.json())
         .then(data => {
             if (data.status === 'success') {
+                greetingShown = true;
                 addMessage(data.message, false);
             }
         })
@@ -54,6 +156,11 @@ function sendMessage() {
     // Clear the input
     messageInput.value = '';
     
+    // Use the socket when it is open; the server answers with typing and message events
+    if (sendSocketEvent({ type: 'message', message: message })) {
+        return;
+    }
+    
     // Show typing indicator
     showTypingIndicator();
     
@@ -181,6 +288,10 @@ function loadChatHistory(chatId) {
             data.messages.forEach(msg => {
                 addMessage(msg.content, msg.is_user);
             });
+            
+            // Point the socket at this chat, after the messages just loaded
+            lastMessageId = data.messages.reduce((maxId, msg) => Math.max(maxId, msg.id), 0);
+            sendSocketEvent({ type: 'hello', chat_id: chatId, last_message_id: lastMessageId });
         })
         .catch(error => {
             console.error('Error loading chat history:', error);
@@ -54,13 +54,21 @@ document.addEventListener('DOMContentLoaded', function() {
         dialectSelect.addEventListener('change', function() {
             const selectedDialect = this.value;
             
+            // Over the chat socket when it is open; the confirmation arrives as a dialect event
+            if (typeof sendSocketEvent === 'function' && sendSocketEvent({ type: 'dialect', dialect: selectedDialect })) {
+                return;
+            }
+            
             // Call API to change dialect
             fetch('/api/dialect', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ dialect: selectedDialect }),
+                body: JSON.stringify({
+                    dialect: selectedDialect,
+                    chat_id: typeof currentChatId !== 'undefined' ? currentChatId : null
+                }),
             })
             .then(response => response.json())
             .then(data => {
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+import pytest
+
+# app.py reads its settings on import and creates the tables on the first request
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("ADMIN_TOKEN", "test-token")
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_headers():
+    return {"X-Admin-Token": os.environ["ADMIN_TOKEN"]}
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+
+@pytest.mark.parametrize("body", (
+    {"seconds": None}, {"seconds": "abc"}, {"seconds": -1}, {"seconds": "nan"},
+    {"interval_ms": [1]}, [1, 2],
+))
+def test_start_profile_rejects_invalid_settings(client, admin_headers, body):
+    response = client.post("/admin/profile", json=body, headers=admin_headers)
+    assert response.status_code == 400
+    assert response.json["status"] == "error"
+
+
+def test_start_profile(client, admin_headers):
+    response = client.post("/admin/profile", json={"seconds": 0.1}, headers=admin_headers)
+    assert response.status_code == 200
+    client.delete("/admin/profile", headers=admin_headers)
+
+
+def test_dialect_pin_is_committed_and_keeps_the_default(client):
+    from app import app, db, get_agent, session_store
+
+    chat_id = client.post("/api/chat", json={"message": "مرحبا"}).json["chat_id"]
+    default_dialect = get_agent().default_dialect
+
+    response = client.post("/api/dialect", json={"dialect": "khaleeji", "chat_id": chat_id})
+    assert response.json["status"] == "success"
+
+    with app.app_context():
+        db.session.remove()
+        assert session_store.load(chat_id).dialect == "khaleeji"
+    assert get_agent().default_dialect == default_dialect
+
+
+def test_chat_socket_is_refused_at_capacity(client, monkeypatch):
+    import app
+
+    pytest.importorskip("flask_sock")
+    monkeypatch.setattr(app, "WEBSOCKET_MAX_CONNECTIONS", 2)
+    monkeypatch.setattr(app, "open_sockets", 2)
+    response = client.get("/ws/chat")
+    assert response.status_code == 503
+    assert response.json["status"] == "error"
+    # Let through below the limit, where flask-sock turns down the non-upgrade request
+    monkeypatch.setattr(app, "open_sockets", 1)
+    assert client.get("/ws/chat").status_code == 400
+    assert app.open_sockets == 1
+
+
+def test_importing_the_app_leaves_the_database_alone(tmp_path):
+    import subprocess
+    import sys
+
+    database = tmp_path / "untouched.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database}", "EAGER_LOAD": "0"}
+    subprocess.run([sys.executable, "-c", "import app"], env=env, check=True, capture_output=True)
+    assert not database.exists()
+
+    subprocess.run([sys.executable, "-c", "import app; app.app.test_client().get('/api/chats')"],
+                   env=env, check=True, capture_output=True)
+    assert database.exists()
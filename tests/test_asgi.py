@@ -0,0 +1,55 @@
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+# ASGI mode is an optional extra
+TestClient = pytest.importorskip("starlette.testclient").TestClient
+
+
+@pytest.fixture(scope="module")
+def asgi_client():
+    import asgi_app
+    with TestClient(asgi_app.app) as client:
+        yield client
+
+
+def test_chat_sweeps_idle_sessions(asgi_client):
+    from app import app, db, session_store
+    from models import Chat, ChatSession
+
+    with app.app_context():
+        idle = Chat(title="Real Estate Chat")
+        db.session.add(idle)
+        db.session.commit()
+        idle_id = idle.id
+        db.session.add(ChatSession(chat_id=idle_id, state=b"", updated_at=datetime.utcnow() - timedelta(days=365)))
+        db.session.commit()
+    session_store._last_sweep = -math.inf
+
+    response = asgi_client.post("/api/chat", json={"message": "مرحبا"})
+    assert response.json()["status"] == "success"
+
+    with app.app_context():
+        assert db.session.get(ChatSession, idle_id) is None
+        assert db.session.get(ChatSession, response.json()["chat_id"]) is not None
+
+
+def test_concurrent_messages_on_one_chat_keep_both_turns(asgi_client):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app import app, session_store
+
+    chat_id = asgi_client.post("/api/chat", json={"message": "مرحبا"}).json()["chat_id"]
+    messages = ("عايز شقة", "ميزانيتي 5 مليون جنيه")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        replies = list(pool.map(
+            lambda message: asgi_client.post("/api/chat", json={"message": message, "chat_id": chat_id}), messages
+        ))
+    assert all(reply.json()["status"] == "success" for reply in replies)
+
+    with app.app_context():
+        preferences = session_store.load(chat_id).preferences
+    # Whichever turn ran second started from the first one's state
+    assert preferences.type == "شقة"
+    assert preferences.budget == 5000000.0
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalogue import AREA_TOLERANCES, BASE_PRICE_COLUMN, BUDGET_BUFFERS, ColumnRanges
+
+
+@pytest.fixture
+def listings():
+    rng = np.random.default_rng(5)
+    areas = rng.choice([80.0, 96.0, 100.0, 120.0, 140.0, 150.0, 200.0], size=60)
+    areas[[3, 17]] = np.nan
+    return pd.DataFrame({
+        "area_m2": areas,
+        "price": rng.integers(5, 50, size=60) * 100_000,
+        BASE_PRICE_COLUMN: rng.integers(5, 50, size=60) * 100_000.0,
+    })
+
+
+def _brute_force(values, low=None, high=None):
+    inside = ~np.isnan(values)
+    if low is not None:
+        inside &= values >= low
+    if high is not None:
+        inside &= values <= high
+    return set(np.flatnonzero(inside))
+
+
+@pytest.mark.parametrize("tolerance", AREA_TOLERANCES)
+def test_area_ranges_match_a_brute_force_scan_at_the_tolerance_edges(listings, tolerance):
+    ranges = ColumnRanges(listings)
+    areas = listings["area_m2"].to_numpy()
+    # 100 +- 20% lands exactly on the 80 and 120 listings, which are inside
+    for area in (100.0, 120.0, 125.0, 10.0):
+        low, high = area * (1 - tolerance), area * (1 + tolerance)
+        positions = ranges["area_m2"].between(low, high)
+        assert set(positions) == _brute_force(areas, low, high)
+        assert list(areas[positions]) == sorted(areas[positions])
+
+
+def test_budget_ranges_use_base_prices(listings):
+    ranges = ColumnRanges(listings)
+    prices = listings[BASE_PRICE_COLUMN].to_numpy()
+    for budget in (500_000.0, 2_000_000.0, 2_500_000.0):
+        for buffer in BUDGET_BUFFERS:
+            assert set(ranges["price"].between(high=budget * buffer)) == _brute_force(prices, high=budget * buffer)
+    assert set(ranges["price"].between(low=2_000_000.0)) == _brute_force(prices, low=2_000_000.0)
+
+
+def test_subset_matches_a_brute_force_scan_of_the_rows(listings):
+    ranges = ColumnRanges(listings)
+    keep = np.arange(len(listings)) % 3 != 0
+    areas = np.where(keep, listings["area_m2"].to_numpy(), np.nan)
+    subset = ranges["area_m2"].subset(keep)
+    assert set(subset.between(96.0, 140.0)) == _brute_force(areas, 96.0, 140.0)
+    assert set(subset.between()) == _brute_force(areas)
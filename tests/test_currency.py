@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from catalogue import BASE_PRICE_COLUMN, BUDGET_BUFFERS, ColumnRanges, with_base_prices
+from currency import BASE_CURRENCY, RateTable
+
+
+@pytest.fixture
+def rates():
+    return RateTable.load()
+
+
+@pytest.fixture
+def listings(rates):
+    # The bundled listings are all in EGP; spread them over every rate and an unknown currency
+    listings = pd.read_csv("fake_real_estate_data_with_currency.csv")
+    currencies = sorted(rates.rates) + ["XYZ"]
+    return listings.assign(currency=[currencies[row % len(currencies)] for row in range(len(listings))])
+
+
+def test_base_prices_match_converting_each_listing(rates, listings):
+    expected = [rates.to_base(price, currency) for price, currency in zip(listings["price"], listings["currency"])]
+    assert rates.base_prices(listings) == pytest.approx(expected)
+
+
+def test_unknown_and_missing_currencies_are_taken_as_base(rates):
+    listings = pd.DataFrame({"price": [100.0, 200.0, 300.0, 400.0], "currency": ["USD", "XYZ", None, BASE_CURRENCY]})
+    assert list(rates.base_prices(listings)) == pytest.approx([rates.to_base(100.0, "USD"), 200.0, 300.0, 400.0])
+    assert list(rates.base_prices(listings.drop(columns="currency"))) == [100.0, 200.0, 300.0, 400.0]
+
+
+def test_with_base_prices_leaves_the_listings_alone(rates, listings):
+    converted = with_base_prices(listings, rates)
+    assert BASE_PRICE_COLUMN not in listings.columns
+    assert list(converted[BASE_PRICE_COLUMN]) == pytest.approx(list(rates.base_prices(listings)))
+
+
+@pytest.mark.parametrize("budget, currency", ((100_000, "USD"), (2_000_000, "EGP"), (500_000, "SAR")))
+def test_budget_search_matches_converting_each_listing(rates, listings, budget, currency):
+    ranges = ColumnRanges(with_base_prices(listings, rates))
+    limit = rates.to_base(budget, currency) * BUDGET_BUFFERS[0]
+    found = set(ranges["price"].between(high=limit))
+    assert found == {
+        row for row, (price, listing_currency) in enumerate(zip(listings["price"], listings["currency"]))
+        if rates.to_base(price, listing_currency) <= limit
+    }
+    assert rates.from_base(rates.to_base(budget, currency), currency) == pytest.approx(budget)
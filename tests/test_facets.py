@@ -0,0 +1,77 @@
+import math
+
+import pandas as pd
+import pytest
+
+from facets import SUMMARIZE_AT, FacetIndex, to_bitmap
+
+
+@pytest.fixture
+def listings():
+    return pd.DataFrame({
+        "location": ["Cairo", "Cairo", "Cairo", "Giza", "Giza", "Alexandria", "Cairo", "Giza"],
+        "bedrooms": [2, 3, 3, 2, 4, 3, 2, 2],
+        "type": ["Apartment", "شقة", "Villa", "Apartment", "Villa", "Office", "Apartment", "Villa"],
+    })
+
+
+def _brute_force_gain(listings, rows, column):
+    # Entropy of a uniformly likely candidate less the expected entropy once the column is known
+    candidates = listings[[bool(rows >> i & 1) for i in range(len(listings))]]
+    if len(candidates) <= 1:
+        return 0.0
+    counts = candidates[column].value_counts()
+    expected = sum(count * math.log2(count) for count in counts) / len(candidates)
+    return math.log2(len(candidates)) - expected
+
+
+@pytest.mark.parametrize("column", ("location", "bedrooms"))
+def test_information_gain_matches_a_brute_force_count(listings, column):
+    facets = FacetIndex(listings)
+    for rows in (facets.all_rows, to_bitmap(listings["location"] != "Alexandria"),
+                 to_bitmap(listings["bedrooms"] == 2), 0b1):
+        assert facets.information_gain(column, rows) == pytest.approx(_brute_force_gain(listings, rows, column))
+
+
+def test_type_labels_are_one_answer(listings):
+    facets = FacetIndex(listings)
+    labelled = listings.assign(type=listings["type"].replace({"شقة": "Apartment"}))
+    assert facets.information_gain("type", facets.all_rows) == pytest.approx(
+        _brute_force_gain(labelled, facets.all_rows, "type"))
+
+
+@pytest.mark.parametrize("question", ("purpose", "floor"))
+def test_questions_without_a_column_have_no_gain(listings, question):
+    facets = FacetIndex(listings)
+    assert facets.information_gain(question, facets.all_rows) == 0.0
+
+
+@pytest.fixture
+def agent():
+    from Ai_agnet_realestate import ArabicRealEstateAgent
+    from session_state import SessionState
+
+    agent = ArabicRealEstateAgent(pd.read_csv("fake_real_estate_data_with_currency.csv"))
+    agent.facet_index = FacetIndex(agent.properties_df)
+    agent.session_state = SessionState()
+    return agent
+
+
+def test_asks_the_question_with_the_highest_gain(agent):
+    rows = agent._candidate_rows()
+    gains = {question: agent.facet_index.information_gain(question, rows)
+             for question in agent.question_flow if question not in ("compound", "finishing_type")}
+    assert agent._next_adaptive_question() == max(gains, key=gains.get)
+
+
+def test_unscored_questions_are_asked_before_summarizing(agent):
+    preferences = agent.session_state["preferences"]
+    preferences["location"], preferences["type"] = "Cairo", "شقة"
+    preferences["bedrooms"], preferences["bathrooms"] = 3, 2
+    assert agent._candidate_rows().bit_count() <= SUMMARIZE_AT
+
+    asked = []
+    while (question := agent._next_adaptive_question()) is not None:
+        asked.append(question)
+        agent.session_state["asked_questions"] |= 1 << agent.question_flow.index(question)
+    assert asked == ["purpose", "floor"]
@@ -0,0 +1,88 @@
+import random
+
+import pandas as pd
+import pytest
+
+from fuzzy_index import MAX_DISTANCE, allowed_distance, build, edit_distance
+
+
+def _osa_distance(a, b):
+    # Full optimal string alignment table, no early exit
+    table = [[max(i, j) if not i or not j else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            table[i][j] = min(table[i - 1][j] + 1, table[i][j - 1] + 1, table[i - 1][j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                table[i][j] = min(table[i][j], table[i - 2][j - 2] + 1)
+    return table[-1][-1]
+
+
+def _typo(rng, word):
+    letters = sorted(set(word.replace(" ", ""))) or ["ا"]
+    position = rng.randrange(len(word) + 1)
+    edit = rng.choice(("insert", "delete", "replace", "swap"))
+    if edit == "insert" or not word:
+        return word[:position] + rng.choice(letters) + word[position:]
+    position = min(position, len(word) - 1)
+    if edit == "delete":
+        return word[:position] + word[position + 1:]
+    if edit == "replace":
+        return word[:position] + rng.choice(letters) + word[position + 1:]
+    position = min(position, len(word) - 2)
+    return word[:position] + word[position + 1:position + 2] + word[position] + word[position + 2:]
+
+
+@pytest.fixture(scope="module")
+def index():
+    from Ai_agnet_realestate import ArabicRealEstateAgent
+
+    agent = ArabicRealEstateAgent(pd.read_csv("fake_real_estate_data_with_currency.csv"))
+    if agent.fuzzy_index is None:
+        pytest.skip("FUZZY_MATCHING=0")
+    return agent.fuzzy_index
+
+
+def _brute_force_lookup(index, query):
+    if query in index.terms:
+        return index.terms[query], 0
+    # Strings further apart in length than MAX_DISTANCE can't be close enough
+    distances = {
+        term: _osa_distance(query, term) for term in index.terms if abs(len(term) - len(query)) <= MAX_DISTANCE
+    }
+    close = {term: distance for term, distance in distances.items() if distance <= allowed_distance(term)}
+    if not close:
+        return None
+    nearest = min(close.values())
+    values = {index.terms[term] for term, distance in close.items() if distance == nearest}
+    return (values.pop(), nearest) if len(values) == 1 else None
+
+
+def test_edit_distance_matches_the_full_table():
+    rng = random.Random(1)
+    alphabet = "abcd" + "شقةفيلا"
+    for _ in range(2000):
+        a = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+        b = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+        limit = rng.randint(0, 3)
+        expected = _osa_distance(a, b)
+        assert edit_distance(a, b, limit) == (expected if expected <= limit else limit + 1)
+
+
+def test_lookup_matches_a_brute_force_scan(index):
+    rng = random.Random(2)
+    terms = sorted(index.terms)
+    queries = rng.sample(terms, 30)
+    for term in rng.sample(terms, 120):
+        query = _typo(rng, term)
+        queries.append(_typo(rng, query) if rng.random() < 0.3 else query)
+    for query in filter(None, queries):
+        match = index.lookup(query)
+        expected = _brute_force_lookup(index, query)
+        assert (None if match is None else (match.values, match.distance)) == expected, query
+
+
+def test_short_terms_need_an_exact_match(index):
+    short = next(term for term, values in index.terms.items() if values and len(term) <= 3)
+    assert index.lookup(short).distance == 0
+    assert allowed_distance("abcdefgh") == MAX_DISTANCE
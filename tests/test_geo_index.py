@@ -0,0 +1,65 @@
+import csv
+import math
+import random
+
+import pytest
+
+from geo_index import KDTree, LocationIndex, _project
+
+
+@pytest.fixture
+def points():
+    rng = random.Random(3)
+    return [(rng.uniform(-300, 300), rng.uniform(3000, 3600)) for _ in range(200)]
+
+
+def _brute_force(points, query):
+    return sorted((math.dist(query, point), index) for index, point in enumerate(points))
+
+
+@pytest.mark.parametrize("k", (1, 3, 10, 250))
+def test_nearest_matches_a_brute_force_scan(points, k):
+    tree = KDTree(points)
+    rng = random.Random(k)
+    for query in [points[0], (0.0, 3300.0)] + [(rng.uniform(-400, 400), rng.uniform(2900, 3700)) for _ in range(50)]:
+        assert tree.nearest(query, k) == _brute_force(points, query)[:k]
+
+
+def test_within_matches_a_brute_force_scan_at_the_edge(points):
+    tree = KDTree(points)
+    query = (10.0, 3310.0)
+    for distance, _ in _brute_force(points, query)[:40:7]:
+        # A point exactly at the radius is included
+        assert tree.within(query, distance) == [
+            (found, index) for found, index in _brute_force(points, query) if found <= distance
+        ]
+
+
+def test_empty_tree():
+    assert KDTree([]).nearest((0.0, 0.0), 3) == []
+    assert KDTree([]).within((0.0, 0.0), 100) == []
+
+
+def test_gazetteer_lookups_match_a_brute_force_scan():
+    with open("locations_geo.csv", encoding="utf-8") as gazetteer:
+        names = [row["name"] for row in csv.DictReader(gazetteer)]
+    # Only every other place has listings, so only those can be returned
+    indexed = names[::2]
+    index = LocationIndex.load(indexed)
+    for name in names:
+        origin = index.resolve(name)
+        by_distance = sorted(
+            (math.dist(_project(origin.lat, origin.lon), _project(place.lat, place.lon)), place.name)
+            for place in index.indexed
+        )
+        nearest = index.nearest(name, k=3)
+        assert [nearby.place.name for nearby in nearest] == [name for _, name in by_distance[:3]]
+        assert [nearby.distance_km for nearby in nearest] == pytest.approx([distance for distance, _ in by_distance[:3]])
+        for radius, batch in zip((15, 100), index.widening(name, (15, 100))):
+            assert [nearby.place.name for nearby in batch] == [name for distance, name in by_distance if distance <= radius]
+
+
+def test_aliases_resolve_to_the_same_place():
+    index = LocationIndex.load(["Cairo"])
+    assert index.resolve(" القاهرة ") == index.resolve("CAIRO") == index.places["Cairo"]
+    assert index.nearest("nowhere") == []
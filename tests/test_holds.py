@@ -0,0 +1,131 @@
+import threading
+import time
+
+import pytest
+
+from holds import DatabaseHoldTable, HoldTable
+
+
+@pytest.fixture
+def hold_tables():
+    """Two workers' hold tables over the test database, with chats 1 to 3."""
+    from app import app, db, ensure_tables
+    from models import Chat, ListingHold
+
+    ensure_tables()
+    with app.app_context():
+        db.session.query(ListingHold).delete()
+        chats = [Chat(title="Real Estate Chat") for _ in range(3)]
+        db.session.add_all(chats)
+        db.session.commit()
+        yield db, [chat.id for chat in chats], DatabaseHoldTable(db, ListingHold), DatabaseHoldTable(db, ListingHold)
+        db.session.rollback()
+
+
+def test_one_chat_holds_a_listing(hold_tables):
+    db, (first, second, _), table, other = hold_tables
+    assert table.hold(10, first)
+    assert not other.hold(10, second)
+    # The conflict is known locally without waiting for a refresh
+    assert other.is_held(10, second)
+    assert table.hold(10, first)
+
+    table.release(first)
+    other.refresh()
+    assert other.hold(10, second)
+
+
+def test_conflict_leaves_the_callers_transaction_usable(hold_tables):
+    from models import Message
+
+    db, (first, second, _), table, other = hold_tables
+    table.hold(10, first)
+    db.session.add(Message(chat_id=second, content="مرحبا", is_user=True))
+    assert not other.hold(10, second)
+    db.session.commit()
+
+
+def test_claims_from_two_sessions_never_both_succeed(hold_tables):
+    from app import app
+
+    db, (first, second, _), table, other = hold_tables
+    outcome = {}
+
+    def other_worker():
+        # Another thread has its own session, like a request on another worker
+        with app.app_context():
+            outcome["held"] = other.hold(10, second)
+            db.session.commit()
+
+    assert table.hold(10, first)
+    thread = threading.Thread(target=other_worker)
+    thread.start()
+    thread.join()
+    db.session.commit()
+    assert outcome == {"held": False}
+
+
+def test_refresh_picks_up_holds_from_other_workers(hold_tables):
+    db, (first, second, third), table, other = hold_tables
+    table.hold(10, first)
+    other.hold(11, second)
+    other.refresh()
+    assert other.held_ids(third) == {10, 11}
+    assert other.held_ids(first) == {11}
+
+    table.release(first)
+    other.refresh()
+    assert other.held_ids(third) == {11}
+
+
+def test_expired_hold_is_taken_over(hold_tables):
+    from models import ListingHold
+
+    db, (first, second, _), table, other = hold_tables
+    table.ttl = 0.05
+    table.hold(10, first)
+    time.sleep(0.1)
+    assert other.hold(10, second)
+    assert db.session.get(ListingHold, 10).chat_id == second
+
+
+def test_in_memory_hold_expires():
+    table = HoldTable(ttl=0.05)
+    assert table.hold(5, 1)
+    assert table.held_ids(2) == {5}
+    time.sleep(0.1)
+    assert table.held_ids(2) == frozenset()
+    assert table.hold(5, 2)
+
+
+def test_renewal_keeps_the_snapshot():
+    table = HoldTable()
+    table.hold(5, 1)
+    snapshot = table.held_ids(2)
+    assert table.hold(5, 1)
+    assert table.held_ids(2) is snapshot
+
+
+@pytest.mark.parametrize("choice, position", (("الأول", 0), ("العقار الثاني", 1)))
+def test_the_chosen_recommendation_is_held(choice, position, monkeypatch):
+    import pandas as pd
+
+    from Ai_agnet_realestate import ArabicRealEstateAgent
+    from session_state import SessionState
+
+    # The scripted dialogue follows the adaptive question order
+    monkeypatch.setattr("Ai_agnet_realestate.ADAPTIVE_QUESTIONS", True)
+    agent = ArabicRealEstateAgent(pd.read_csv("fake_real_estate_data_with_currency.csv"))
+    agent.session_state = SessionState()
+    table = HoldTable()
+    for message in ("عايز شقة في القاهرة للشراء", "لا يهم", "نعم"):
+        agent.process_input(message)
+    recommended = list(agent.session_state.shown_properties)
+    assert len(recommended) == 2
+
+    agent.process_input(choice)
+    assert agent.session_state["current_property"]["id"] == recommended[position]
+    agent.process_input("أريد شراء هذا العقار")
+    assert agent.session_state["conversation_stage"] == "contact_collection"
+    table.update(1, agent.session_state)
+    assert table.held_ids(2) == {recommended[position]}
@@ -0,0 +1,25 @@
+import threading
+
+from metrics import Counter, Gauge, Histogram, suppressed
+
+REQUESTS = Counter("test_requests_total", "Test counter", ("path",))
+IN_FLIGHT = Gauge("test_in_flight", "Test gauge")
+LATENCY = Histogram("test_latency_seconds", "Test histogram")
+
+
+def test_suppressed_drops_metrics_of_the_current_thread_only():
+    with suppressed():
+        REQUESTS.inc("a")
+        IN_FLIGHT.set(5)
+        LATENCY.observe(0.1)
+        # Other threads keep recording
+        other = threading.Thread(target=REQUESTS.inc, args=("b",))
+        other.start()
+        other.join()
+    assert REQUESTS.value("a") == 0
+    assert REQUESTS.value("b") == 1
+    assert IN_FLIGHT.value() == 0
+    assert LATENCY.count() == 0
+
+    REQUESTS.inc("a")
+    assert REQUESTS.value("a") == 1
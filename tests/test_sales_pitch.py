@@ -0,0 +1,42 @@
+import random
+
+import pandas as pd
+import pytest
+
+from sales_pitch import AREA_PLACEHOLDER, PRICE_NOTE, SalesPitchEngine
+
+ARGUMENTS = [f"الحجة {index}: العقارات في {AREA_PLACEHOLDER} مطلوبة" for index in range(5)] + ["حجة عامة"]
+
+
+@pytest.fixture
+def listings():
+    return pd.read_csv("fake_real_estate_data_with_currency.csv")
+
+
+def test_localized_table_matches_replacing_the_area_in_each_argument(listings):
+    engine = SalesPitchEngine(ARGUMENTS, listings, seed="7")
+    pairs = set(listings[["neighborhood", "location"]].astype(str).itertuples(index=False, name=None))
+    assert set(engine.localized) == pairs
+
+    for listing in listings.head(30).to_dict("records"):
+        used = 0
+        for _ in range(len(ARGUMENTS)):
+            pitch, now_used = engine.next_pitch(used, listing)
+            index = (now_used & ~used).bit_length() - 1
+            area = f"منطقة {listing['neighborhood']} في {listing['location']}"
+            assert pitch == ARGUMENTS[index].replace(AREA_PLACEHOLDER, area) + PRICE_NOTE.format(price=int(listing["price"]))
+            used = now_used
+
+
+def test_seeded_choice_matches_picking_from_the_unused_arguments():
+    engine = SalesPitchEngine(ARGUMENTS, seed="7")
+    used = 0
+    for _ in range(len(ARGUMENTS)):
+        unused = [index for index in range(len(ARGUMENTS)) if not used >> index & 1]
+        expected = unused[random.Random(f"7:42:{used}").randrange(len(unused))]
+        _, now_used = engine.next_pitch(used, {"id": 42})
+        assert now_used == used | 1 << expected
+        used = now_used
+    # Every argument was heard once; the next pitch starts over
+    assert used == engine.all_used
+    assert engine.next_pitch(used, {"id": 42})[1].bit_count() == 1
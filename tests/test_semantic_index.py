@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from semantic_index import DEFAULT_PROBES, HashedNgramEncoder, IVFIndex, SemanticIndex, listing_texts
+
+QUERIES = (
+    "شقة في القاهرة", "فيلا بحديقة", "مكتب قريب من المترو", "villa with pool", "office near metro",
+    "apartment in Giza", "modern apartment", "Alexandria sea view", "spacious family home", "شقه واسعه",
+)
+
+
+@pytest.fixture(scope="module")
+def encoded():
+    listings = pd.read_csv("fake_real_estate_data_with_currency.csv")
+    encoder = HashedNgramEncoder()
+    texts = listing_texts(listings)
+    return encoder, texts, encoder.encode_batch(texts)
+
+
+def _top(positions, scores, k):
+    return positions[np.argsort(-scores, kind="stable")[:k]]
+
+
+def test_every_row_is_in_one_list(encoded):
+    _, _, vectors = encoded
+    ivf = IVFIndex(vectors)
+    rows = np.concatenate(ivf.lists)
+    assert sorted(rows) == list(range(len(vectors)))
+
+
+def test_probing_every_list_is_a_brute_force_scan(encoded):
+    encoder, texts, vectors = encoded
+    ivf = IVFIndex(vectors)
+    for query in QUERIES + tuple(texts[::17]):
+        query_vector = encoder.encode(query)
+        positions, scores = ivf.search(query_vector, probes=len(ivf.lists), budget_ms=math.inf)
+        assert sorted(positions) == list(range(len(vectors)))
+        assert scores[np.argsort(positions)] == pytest.approx(vectors @ query_vector, abs=1e-6)
+
+
+@pytest.mark.parametrize("k", (5, 10))
+def test_top_k_recall_against_a_brute_force_scan(encoded, k):
+    encoder, texts, vectors = encoded
+    ivf = IVFIndex(vectors)
+    recalls = []
+    for query in QUERIES + tuple(texts[::10]):
+        query_vector = encoder.encode(query)
+        exact = vectors @ query_vector
+        # Listings tied with the k-th best are as good an answer as it
+        kth = np.sort(exact)[-k]
+        found = _top(*ivf.search(query_vector, probes=DEFAULT_PROBES, budget_ms=math.inf), k)
+        recalls.append(np.mean(exact[found] >= kth - 1e-6))
+    assert np.mean(recalls) >= 0.9
+    assert min(recalls) >= 0.5
+
+
+def test_search_only_scores_the_candidates(encoded):
+    encoder, _, vectors = encoded
+    ivf = IVFIndex(vectors)
+    candidates = np.arange(len(vectors)) % 2 == 1
+    positions, _ = ivf.search(encoder.encode("villa with pool"), candidates, probes=len(ivf.lists), budget_ms=math.inf)
+    assert sorted(positions) == list(np.flatnonzero(candidates))
+
+
+def test_similarities_of_an_empty_request_are_zero(encoded):
+    _, _, vectors = encoded
+    assert not SemanticIndex(vectors).similarities("").any()
@@ -0,0 +1,204 @@
+import json
+import random
+import struct
+
+import pytest
+
+from session_state import (
+    COMPOUND_ANSWERS, CURRENCIES, DIALECTS, FINISHING_TYPES, FINISHINGS, PROPERTY_TYPES, PURPOSES,
+    QUESTION_KEYS, SERVICES, STAGES, SessionState, decode_session, encode_session
+)
+
+CATALOGUE_VERSION = 7
+
+# Layouts of the older format versions, as decode_session() reads them
+_V1_HEADER = struct.Struct("<B")
+_HEADER = struct.Struct("<BI")
+_FIXED_V2 = struct.Struct("<BBBHBHB" "BBBBBB" "qqqqd")
+_FIXED = struct.Struct("<BBBHBHB" "BBBBBBB" "qqqqd")
+_NONE_INT = -(2 ** 63)
+
+
+def _resolve(property_id, catalogue_version):
+    return {"id": property_id, "catalogue_version": catalogue_version}
+
+
+def _random_text(rng):
+    if rng.random() < 0.3:
+        return None
+    return "".join(rng.choice("abc أبجد😀") for _ in range(rng.randint(0, 40)))
+
+
+def _random_state(rng) -> SessionState:
+    state = SessionState()
+    state.conversation_stage = rng.choice(STAGES)
+    state.last_question_asked = rng.choice((None,) + QUESTION_KEYS)
+    state.dialect = rng.choice((None,) + DIALECTS)
+    state.selected_property_index = rng.randint(0, 2)
+    state.negotiation_attempts = rng.randint(0, 100)
+    state.question_flow_index = rng.randint(0, len(QUESTION_KEYS))
+    state.sales_pitch_stage = rng.randint(0, 20)
+    state.asked_finishing_type = rng.random() < 0.5
+    state.asked_services = rng.random() < 0.5
+    state.asked_questions = rng.getrandbits(len(QUESTION_KEYS))
+    state.used_sales_arguments = rng.getrandbits(rng.choice((0, 12, 64)))
+
+    prefs = state.preferences
+    prefs.type = rng.choice((None,) + PROPERTY_TYPES)
+    prefs.purpose = rng.choice((None,) + PURPOSES)
+    prefs.compound = rng.choice((None,) + COMPOUND_ANSWERS)
+    prefs.finishing = rng.choice((None,) + FINISHINGS)
+    prefs.finishing_type = rng.choice((None,) + FINISHING_TYPES)
+    prefs.budget_currency = rng.choice((None,) + CURRENCIES)
+    for service in SERVICES:
+        if rng.random() < 0.5:
+            prefs.add_service(service)
+    prefs.bedrooms = rng.choice((None, rng.randint(0, 10)))
+    prefs.bathrooms = rng.choice((None, rng.randint(0, 5)))
+    prefs.area_m2 = rng.choice((None, rng.randint(30, 2000)))
+    prefs.floor = rng.choice((None, rng.randint(-5, 10 ** 6)))
+    prefs.budget = rng.choice((None, rng.random() * 1e7))
+    prefs.location = _random_text(rng)
+    prefs.other_features = [_random_text(rng) or "" for _ in range(rng.randint(0, 4))]
+
+    state.user_info.name = _random_text(rng)
+    state.user_info.phone = rng.choice((None, "0101234567"))
+    state.user_info.email = _random_text(rng)
+    for _ in range(rng.randint(0, 30)):
+        state.remember_shown(rng.randint(1, 10 ** 6))
+    state.current_property = rng.choice((None, {"id": rng.randint(1, 1000), "price": 1}))
+    return state
+
+
+def _comparable(state: SessionState):
+    fields = state.to_dict()
+    fields["shown_properties"] = list(fields["shown_properties"])
+    return fields
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_round_trip_of_random_sessions(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        state = _random_state(rng)
+        decoded = decode_session(encode_session(state, CATALOGUE_VERSION), _resolve)
+
+        expected = _comparable(state)
+        actual = _comparable(decoded)
+        current_property = expected.pop("current_property")
+        assert actual.pop("current_property") == (
+            None if current_property is None
+            else {"id": current_property["id"], "catalogue_version": CATALOGUE_VERSION}
+        )
+        assert actual == expected
+
+
+def test_round_trip_without_resolver_keeps_property_id():
+    state = SessionState()
+    state.current_property = {"id": 12, "price": 1}
+    assert decode_session(state.to_bytes()).current_property == {"id": 12}
+
+
+def test_every_truncation_raises_value_error():
+    data = encode_session(_random_state(random.Random(1)), CATALOGUE_VERSION)
+    for length in range(len(data)):
+        with pytest.raises(ValueError):
+            decode_session(data[:length])
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_mutated_bytes_decode_or_raise_value_error(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        data = bytearray(encode_session(_random_state(rng), CATALOGUE_VERSION))
+        for _ in range(rng.randint(1, 4)):
+            operation = rng.random()
+            if operation < 0.5:
+                data[rng.randrange(len(data))] = rng.randrange(256)
+            elif operation < 0.75:
+                data.insert(rng.randrange(len(data) + 1), rng.randrange(256))
+            else:
+                del data[rng.randrange(len(data))]
+        try:
+            decode_session(bytes(data))
+        except ValueError:
+            pass
+
+
+def test_unknown_version_raises_value_error():
+    data = bytearray(SessionState().to_bytes())
+    data[0] = 99
+    with pytest.raises(ValueError):
+        decode_session(bytes(data))
+
+
+def _text(value):
+    if value is None:
+        return struct.pack("<H", 0xFFFF)
+    encoded = value.encode("utf-8")
+    return struct.pack("<H", len(encoded)) + encoded
+
+
+def _texts(values):
+    return struct.pack("<H", len(values)) + b"".join(_text(value) for value in values)
+
+
+def _legacy_payload(version: int) -> bytes:
+    """A mid-conversation session in one of the format versions before 5."""
+    # stage recommending, last question ask_budget, flags asked_services,
+    # type فيلا, purpose للشراء, services أمن + نادي, currency USD (v3+)
+    counters = (STAGES.index("recommending"), QUESTION_KEYS.index("ask_budget") + 1, 1, 2, 10, 3, 2)
+    coded = (2, 1, 0, 1, 0, 0b101)
+    numbers = (3, _NONE_INT, 200, _NONE_INT, 2500000.0)
+    if version >= 3:
+        fixed = _FIXED.pack(*counters, *coded, CURRENCIES.index("USD") + 1, *numbers)
+    else:
+        fixed = _FIXED_V2.pack(*counters, *coded, *numbers)
+    header = _V1_HEADER.pack(1) if version == 1 else _HEADER.pack(version, CATALOGUE_VERSION)
+    strings = _text("Cairo") + _text("Ahmed") + _text("01012345678") + _text(None) + _texts(["حديقة"])
+
+    if version == 1:
+        shown = struct.pack("<H", 2) + struct.pack("<2q", 12, 47)
+        current_property = json.dumps({"id": 47, "price": 100}).encode("utf-8")
+        tail = _texts(["argument text"]) + struct.pack("<I", len(current_property)) + current_property
+    else:
+        shown = struct.pack("<H", 2) + struct.pack("<2i", 12, 47)
+        arguments = struct.pack("<Q", 0b1001) if version >= 4 else _texts(["argument text"])
+        tail = arguments + struct.pack("<i", 47)
+    return header + fixed + strings + shown + tail
+
+
+@pytest.mark.parametrize("version", (1, 2, 3, 4))
+def test_decodes_older_versions(version):
+    state = decode_session(_legacy_payload(version), _resolve)
+    prefs = state.preferences
+
+    assert state.conversation_stage == "recommending"
+    assert state.last_question_asked == "ask_budget"
+    assert state.question_flow_index == 10
+    assert state.sales_pitch_stage == 3
+    assert state.asked_services and not state.asked_finishing_type
+    assert state.dialect is None
+    assert prefs.type == "فيلا"
+    assert prefs.purpose == "للشراء"
+    assert prefs.services == ("أمن", "نادي")
+    assert prefs.budget_currency == ("USD" if version >= 3 else None)
+    assert (prefs.bedrooms, prefs.bathrooms, prefs.area_m2, prefs.floor) == (3, None, 200, None)
+    assert prefs.budget == 2500000.0
+    assert prefs.location == "Cairo"
+    assert prefs.other_features == ["حديقة"]
+    assert (state.user_info.name, state.user_info.phone, state.user_info.email) == ("Ahmed", "01012345678", None)
+    assert list(state.shown_properties) == [12, 47]
+    # Sales arguments were stored as texts before version 4 and are dropped
+    assert state.used_sales_arguments == (0b1001 if version >= 4 else 0)
+    # Questions before the flow index are assumed asked
+    assert state.asked_questions == (1 << 10) - 1
+    assert state.current_property == {"id": 47, "catalogue_version": CATALOGUE_VERSION if version > 1 else 0}
+
+
+@pytest.mark.parametrize("version", (1, 2, 3, 4))
+def test_truncated_older_versions_raise_value_error(version):
+    data = _legacy_payload(version)
+    for length in range(len(data)):
+        with pytest.raises(ValueError):
+            decode_session(data[:length])
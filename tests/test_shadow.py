@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from Ai_agnet_realestate import AGENT_STEP_SECONDS, ArabicRealEstateAgent
+from holds import HoldTable
+from session_state import SessionState
+from shadow import SHADOW_TURN_SECONDS, SHADOW_TURNS, ShadowRunner, ShadowTurn
+
+
+@pytest.fixture(scope="module")
+def catalogue():
+    return pd.read_csv("fake_real_estate_data_with_currency.csv")
+
+
+@pytest.fixture(autouse=True)
+def adaptive_questions(monkeypatch):
+    # The scripted dialogues follow the adaptive question order
+    monkeypatch.setattr("Ai_agnet_realestate.ADAPTIVE_QUESTIONS", True)
+
+
+def _primary_turn(agent, message, chat_id=1):
+    """Run one turn on the primary agent and record it as the shadow would receive it."""
+    agent.current_chat_id = chat_id
+    before = agent.session_state.to_bytes(agent.catalogue_version)
+    reply = agent.process_input(message)
+    return ShadowTurn(chat_id, message, agent.current_dialect, before, reply,
+                      agent.session_state.to_bytes(agent.catalogue_version), 0.01)
+
+
+def test_shadow_turns_do_not_count_in_agent_metrics(catalogue):
+    primary = ArabicRealEstateAgent(catalogue)
+    runner = ShadowRunner(ArabicRealEstateAgent, catalogue, primary.get_property, primary.catalogue_version)
+    turn = _primary_turn(primary, "عايز شقة في القاهرة")
+    steps = AGENT_STEP_SECONDS.count("process_input")
+    shadow_turns = SHADOW_TURN_SECONDS.count("shadow")
+
+    runner._compare(ArabicRealEstateAgent(catalogue), turn)
+
+    assert AGENT_STEP_SECONDS.count("process_input") == steps
+    assert SHADOW_TURN_SECONDS.count("shadow") == shadow_turns + 1
+
+
+def _runner(primary, catalogue):
+    runner = ShadowRunner(ArabicRealEstateAgent, catalogue, primary.get_property, primary.catalogue_version)
+    primary.pitch_engine.seed = runner.pitch_seed
+    return runner
+
+
+def _matches(runner, catalogue, turn):
+    """Whether the shadow agent handles the turn exactly as the primary did."""
+    matches = SHADOW_TURNS.value("match")
+    agent = ArabicRealEstateAgent(catalogue)
+    agent.pitch_engine.seed = runner.pitch_seed
+    runner._compare(agent, turn)
+    return SHADOW_TURNS.value("match") == matches + 1
+
+
+def test_shadow_skips_the_listings_held_when_the_primary_turn_started(catalogue):
+    primary = ArabicRealEstateAgent(catalogue)
+    primary.listing_holds = HoldTable()
+    primary.session_state = SessionState()
+    runner = _runner(primary, catalogue)
+    for message in ("عايز شقة في القاهرة للشراء", "لا يهم", "3 غرف"):
+        _primary_turn(primary, message)
+    # Chat 2 holds the listing chat 1 would be offered first
+    primary.listing_holds.hold(7, chat_id=2)
+    held = primary.listing_holds.held_ids(1)
+    turn = _primary_turn(primary, "2 حمام")
+    assert 7 not in primary.session_state.shown_properties
+
+    # Released before the shadow runs; the shadow still sees the turn's holds
+    primary.listing_holds.release(2)
+    assert _matches(runner, catalogue, turn._replace(held=held))
+    assert not _matches(runner, catalogue, turn)
+
+
+def test_shadow_picks_the_primarys_sales_arguments(catalogue):
+    primary = ArabicRealEstateAgent(catalogue)
+    primary.session_state = SessionState()
+    runner = _runner(primary, catalogue)
+    for message in ("عايز شقة في القاهرة للشراء", "لا يهم", "3 غرف", "2 حمام"):
+        _primary_turn(primary, message)
+    for message in ("الأول", "كمان", "كمان"):
+        turn = _primary_turn(primary, message)
+        assert primary.session_state["conversation_stage"] == "sales_pitch"
+        assert _matches(runner, catalogue, turn)
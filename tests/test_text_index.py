@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from text_index import InvertedIndex, analyze
+
+
+@pytest.fixture
+def texts():
+    descriptions = pd.read_csv("fake_real_estate_data_with_currency.csv")["description"]
+    arabic = pd.Series([
+        "شقة واسعة بإطلالة على النيل", "فيلا بحديقة خاصة وحمام سباحة", "مكتب إداري قرب المترو",
+        "شقةٌ واسعةٌ مع جراج", None, "",
+    ])
+    return pd.concat([descriptions, arabic], ignore_index=True)
+
+
+def _brute_force(texts, phrase):
+    terms = set(analyze(phrase))
+    if not terms:
+        return []
+    # Missing descriptions match nothing
+    return [row for row, text in enumerate(texts) if pd.notna(text) and terms <= set(analyze(text))]
+
+
+def test_search_matches_a_brute_force_scan(texts):
+    index = InvertedIndex(texts)
+    vocabulary = sorted({term for text in texts.dropna() for term in analyze(text)})
+    phrases = [
+        "Modern apartment", "metro station", "spacious villa with garden", "pool", "balcony views",
+        "شقة واسعة", "واسعه", "بحديقة", "حمام السباحة", "إطلالة", "أطلالة", "the", "في", "penthouse", "nan", "",
+    ] + vocabulary + [" ".join(vocabulary[i:i + 2]) for i in range(0, len(vocabulary), 3)]
+    for phrase in phrases:
+        assert list(index.search(phrase)) == _brute_force(texts, phrase), phrase
+
+
+def test_score_counts_the_matching_phrases(texts):
+    index = InvertedIndex(texts)
+    phrases = ["apartment", "metro", "شقة", "garden", "unknown words"]
+    expected = np.zeros(len(texts), dtype=np.int32)
+    for phrase in phrases:
+        expected[_brute_force(texts, phrase)] += 1
+    assert list(index.score(phrases)) == list(expected)
@@ -0,0 +1,100 @@
+import re
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+_DIACRITICS = re.compile("[\u064B-\u0652\u0670\u0640]")  # harakat, dagger alef, tatweel
+_ALEF_FORMS = re.compile("[\u0623\u0625\u0622\u0671]")  # hamza and madda alef forms
+_TOKEN = re.compile(r"\w+")
+
+# Words too common to narrow a search
+STOPWORDS = frozenset({
+    "a", "an", "the", "with", "in", "on", "of", "for", "and", "to", "at",
+    "في", "من", "على", "مع", "و", "او", "الى", "عن", "ب", "ل",
+})
+
+_ARABIC_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_ARABIC_SUFFIXES = ("ات", "ون", "ين", "ه", "ي")
+_ENGLISH_SUFFIXES = ("ing", "ed", "es", "s")
+
+
+def normalize(text: str) -> str:
+    """
+    Fold text to a canonical form: lowercase, no Arabic diacritics or
+    tatweel, one alef form, taa marbuta as haa and alef maqsura as yaa.
+    """
+    text = _DIACRITICS.sub("", str(text).lower())
+    text = _ALEF_FORMS.sub("ا", text)
+    return text.replace("ة", "ه").replace("ى", "ي")
+
+
+def stem(token: str) -> str:
+    """Light stemming: strip one common Arabic or English affix, keeping at least three letters."""
+    if token.isascii():
+        if token.endswith(("ss", "us")):  # business, spacious
+            return token
+        for suffix in _ENGLISH_SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+                return token[:-len(suffix)]
+        return token
+    for prefix in _ARABIC_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+            token = token[len(prefix):]
+            break
+    for suffix in _ARABIC_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+
+def analyze(text: str) -> List[str]:
+    """Normalize, tokenize and stem text into index terms, dropping stopwords."""
+    return [stem(token) for token in _TOKEN.findall(normalize(text)) if token not in STOPWORDS]
+
+
+class InvertedIndex:
+    """
+    Term -> sorted row positions over one text column of the catalogue.
+
+    The column is factorized first, so each distinct text is analyzed once;
+    with a handful of description templates that is a few dozen terms.
+    """
+
+    def __init__(self, texts: pd.Series):
+        self.size = len(texts)
+        codes, uniques = pd.factorize(texts.astype(object), sort=False)
+        term_codes: Dict[str, set] = {}
+        for code, text in enumerate(uniques):
+            for term in analyze(text):
+                term_codes.setdefault(term, set()).add(code)
+        self.postings: Dict[str, np.ndarray] = {
+            term: np.flatnonzero(np.isin(codes, sorted(code_set))).astype(np.int32)
+            for term, code_set in term_codes.items()
+        }
+
+    def search(self, phrase: str) -> np.ndarray:
+        """
+        Rows whose text contains every term of a phrase.
+
+        Returns:
+            Sorted row positions (empty if any term is unknown)
+        """
+        terms = analyze(phrase)
+        if not terms:
+            return np.empty(0, dtype=np.int32)
+        postings = [self.postings.get(term) for term in dict.fromkeys(terms)]
+        if any(posting is None for posting in postings):
+            return np.empty(0, dtype=np.int32)
+        postings.sort(key=len)
+        result = postings[0]
+        for posting in postings[1:]:
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result
+
+    def score(self, phrases: Iterable[str]) -> np.ndarray:
+        """Number of the given phrases each row matches, for every row."""
+        scores = np.zeros(self.size, dtype=np.int32)
+        for phrase in phrases:
+            scores[self.search(phrase)] += 1
+        return scores
@@ -0,0 +1,159 @@
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# Fraction of requests traced; 0 (the default) turns tracing off
+SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+# Finished spans kept in memory for /admin/traces
+RING_SIZE = int(os.environ.get("TRACE_RING_SIZE", "2000"))
+# Optional JSON-lines file that finished spans are appended to
+TRACE_FILE = os.environ.get("TRACE_FILE")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_finished: deque = deque(maxlen=RING_SIZE)
+_file_lock = threading.Lock()
+# Separate generator so sampling never disturbs the agent's use of the random module
+_sampler = random.Random()
+
+
+class Span:
+    """A timed operation inside a trace."""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "_started", "duration_ms", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = f"{_sampler.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        _export(self)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Returned when the current request is not sampled; does nothing."""
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def _export(span: Span) -> None:
+    _finished.append(span)
+    if TRACE_FILE:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with _file_lock, open(TRACE_FILE, "a", encoding="utf-8") as trace_file:
+            trace_file.write(line + "\n")
+
+
+def start_trace(name: str, **attributes):
+    """
+    Open the root span of a request if it is sampled.
+
+    Returns:
+        A span context manager, or a no-op one when the request is not sampled
+    """
+    if SAMPLE_RATE <= 0 or _sampler.random() >= SAMPLE_RATE:
+        return _NOOP
+    return Span(name, f"{_sampler.getrandbits(128):032x}", None, attributes)
+
+
+def span(name: str, **attributes):
+    """Open a child span of the current span; a no-op outside a sampled trace."""
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def traced(name: str):
+    """Decorator wrapping each call of a function in a child span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            parent = _current_span.get()
+            if parent is None:
+                return func(*args, **kwargs)
+            with Span(name, parent.trace_id, parent.span_id, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def propagate(func):
+    """
+    Bind a callable to the current trace context, so work handed to another
+    thread (e.g. an executor) is recorded as part of the same trace.
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+    return wrapper
+
+
+def recent_traces(limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Group the buffered spans into traces, most recent first.
+
+    Args:
+        limit: Maximum number of traces to return
+
+    Returns:
+        List of {"trace_id", "spans"} dictionaries
+    """
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for finished_span in reversed(list(_finished)):
+        if finished_span.trace_id not in traces:
+            if len(traces) >= limit:
+                continue
+            traces[finished_span.trace_id] = []
+        traces[finished_span.trace_id].append(finished_span.to_dict())
+    return [
+        {"trace_id": trace_id, "spans": sorted(spans, key=lambda s: s["start"])}
+        for trace_id, spans in traces.items()
+    ]